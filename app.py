@@ -1,32 +1,36 @@
+import time
+start_time = time.time()
+
 import streamlit as st
 from PIL import Image
-import pandas as pd
-import altair as alt
+import numpy as np
 from datetime import datetime
-from datetime import timedelta
 from libs.obs_utils import *
-from libs.sir_utils import *
 from libs.gsheet import *
-import os
-import json
-
-# Google Sheets credentials
-SPREADSHEET_ID = "1ZHnIEjpFZ9U9Iu5VJfdTVKU2NiVBMtrvjDekRKsXmLs"
-SCOPE = ['https://www.googleapis.com/auth/spreadsheets',]
-GOOGLE_CREDS = "google-credentials.json"
-
-# GOOGLE_CREDS = json.loads(os.getenv('GOOGLE_CREDENTIALS')) 
-
-
-# Bring in Google Sheets data
-gs_df = gsheet2df(SPREADSHEET_ID, GOOGLE_CREDS, SCOPE, debug=True)
-update = gs_df.Date.iloc[-1]
-mt_cases = gs_df['Active infected'].iloc[-1]
-zoo_cases = gs_df['Active Missoula'].iloc[-1]
+from libs.cache import dataset_cache
+from libs.charts import chart_store
+from libs.fetch import Source, fetch_all, fetch_in_background
+from libs.pivots import chart_frame, date_labels, pivot_store
+from libs.startup import StartupTimer
+from libs.telemetry import telemetry
+
+# Nothing above does network I/O or loads scipy/matplotlib/gspread, see
+# benchmarks/bench_startup.py
+timer = StartupTimer(start_time)
+timer.mark('imports')
+
+# Per-section timings and sizes of every run (see libs/telemetry.py), served
+# to Prometheus when TELEMETRY_PORT is set
+telemetry.serve()
+run = telemetry.run('app')
+
+# The NYT snapshots are only needed by the explorer at the bottom, so they
+# refresh in the background while the sections above render
+nyt_fetch = fetch_in_background(upstream_sources())
 
 # Title
 st.title('Missoula Covid-19 Dashboard')
-st.text('Last update: {}'.format(update))
+last_update = st.empty()
 st.markdown(
     """
     The State has put together a very nice [Montana Covid-19 Dashboard](https://montana.maps.arcgis.com/apps/MapSeries/index.html?appid=7c34f3412536439491adcc2103421d4b)
@@ -36,6 +40,20 @@ st.markdown(
 )
 st.text("")
 st.text("")
+timer.mark('first paint')
+run.mark('first paint')
+
+with st.spinner('Loading the latest numbers...'):
+    fetched = fetch_all([Source('gsheet', loader=load_gsheet, timeout=60)])
+if not fetched['gsheet'].ok:
+    raise fetched['gsheet'].error
+gs_df = fetched['gsheet'].value.copy()
+update = gs_df.Date.iloc[-1].strftime('%m/%d/%Y')
+mt_cases = '{:.0f}'.format(gs_df['Active infected'].iloc[-1])
+zoo_cases = '{:.0f}'.format(gs_df['Active Missoula'].iloc[-1])
+last_update.text('Last update: {}'.format(update))
+timer.mark('google sheet')
+run.mark('google sheet', gs_df)
 
 # Current active status in Montana and Missoula (static)
 st.markdown(
@@ -52,28 +70,13 @@ st.markdown(
 st.text("")
 st.text("")
 
-# Format Gsheet data
-gs_df.Date = pd.to_datetime(gs_df.Date)
-gs_df.set_index('Date', inplace=True)
-gs_df.replace("", np.nan, inplace=True)
-active_df = gs_df[['Active infected', 'Active Missoula']]
-active_df.columns = ['Montana', 'Missoula']
-active_df = active_df.dropna(axis=0, how='all')
-testing_df = pd.DataFrame(gs_df['Tests completed'])
-testing_df.columns = ['Tests Completed']
-
-# Plot active cases
-zoo_pop = 120000
-mt_pop = 1069000
+# Format Gsheet data (the same tables publish.py exports)
+sheet = format_gsheet(gs_df)
+testing_df = tests_completed(sheet)
 
 # Create dataframe with CDC indicators
-cdc_df = pd.DataFrame({
-    '14day New Cases': [float(gs_df['Missoula New Cases'].iloc[-1])],
-    '14day % Change': [float(gs_df['Missoula % Change'].iloc[-1])],
-    '7day Pos. Rate': [float(gs_df['Missoula Positivity Rate'].iloc[-1])],
-    'Hosp. % Full': [float(gs_df['Missoula Hosp. % Full'].iloc[-1])],
-    'Hosp. % COV19': [float(gs_df['Missoula Cov. Hosp. %'].iloc[-1])]
-})
+cdc_df = cdc_indicators(sheet)
+run.mark('sheet tables', sheet)
 
 st.markdown(
     """
@@ -90,7 +93,7 @@ st.markdown(
     """
 )
 
-st.table(cdc_df.style.apply(add_color_style, axis=1))
+st.table(cdc_df.style.apply(add_color_style, axis=None))
 
 st.markdown(
     """
@@ -108,43 +111,22 @@ st.markdown(
     """
 )
 
-active_df['Missoula'] = pd.to_numeric(active_df.loc[:, 'Missoula'])
-active_df['Montana'] = pd.to_numeric(active_df.loc[:, 'Montana'])
-active_df.index = active_df.index.strftime("%Y-%m-%d")
-if st.checkbox('Show Data Normalized by Population'):
-    active_df['Missoula'] = 100000*(active_df.loc[:, 'Missoula']/zoo_pop)
-    active_df['Montana'] = 100000*(active_df.loc[:, 'Montana']/mt_pop)
-    active_lab = 'Active Cases / 100k People'
-else:
-    active_lab = 'Active Cases'
+per_100k = st.checkbox('Show Data Normalized by Population')
+active_df = active_cases(sheet, per_100k=per_100k)
+active_lab = 'Active Cases / 100k People' if per_100k else 'Active Cases'
 
 if st.checkbox('Show Raw Data For Active Cases'):
     st.write(
         '#### Active cases:', 
-        active_df.sort_index(ascending=False)
+        date_labels(active_df).sort_index(ascending=False)
         )
 
 # Plot active cases
-active_df['Date'] = pd.to_datetime(active_df.index)
-active_melt = pd.melt(
-    active_df,
-    id_vars='Date',
-    var_name = 'Location',
-    value_name= active_lab
+active_spec, active_bytes = chart_store.line(
+    'active cases', (update, active_lab), lambda: chart_frame(active_df, active_lab), active_lab
 )
-
-active_chart = (
-    alt.Chart(active_melt)
-    .mark_line()
-    .encode(
-        x='Date',
-        y=active_lab,
-        color='Location',
-        tooltip=['Date', active_lab]
-    )
-).interactive()
-
-st.altair_chart(active_chart, use_container_width=True)
+st.vega_lite_chart(spec=active_spec, use_container_width=True)
+run.mark('active cases', rows=len(active_df), bytes_out=active_bytes)
 
 # Plot testing data
 st.markdown(
@@ -156,31 +138,22 @@ st.markdown(
 )
 
 
-testing_df.index = testing_df.index.strftime("%Y-%m-%d")
 if st.checkbox('Show Raw Data For Daily Tests Completed'):
     st.write(
         '#### Tests Completed:', 
-        testing_df.sort_index(ascending=False)
+        date_labels(testing_df).sort_index(ascending=False)
         )
 
-
-testing_df['Date'] = pd.to_datetime(testing_df.index)
-testing_df['Tests Completed'] = pd.to_numeric(testing_df.loc[:,'Tests Completed'])
-
-testing_chart = (
-    alt.Chart(testing_df)
-    .mark_area(
-        line=True, 
-        opacity=0.4, 
-        interpolate='step-after'
-    )
-    .encode(
-        x='Date',
-        y='Tests Completed',
-        tooltip = ['Date', 'Tests Completed']
-    )
-).interactive()
-st.altair_chart(testing_chart, use_container_width=True)
+testing_spec, testing_bytes = chart_store.area(
+    'tests completed',
+    (update,),
+    lambda: chart_frame(testing_df.set_axis(['Montana'], axis=1), 'Tests Completed'),
+    'Tests Completed',
+    color=None
+)
+st.vega_lite_chart(spec=testing_spec, use_container_width=True)
+run.mark('tests completed', rows=len(testing_df), bytes_out=testing_bytes)
+timer.mark('missoula sections')
 
 # Select state 
 st.markdown(
@@ -200,36 +173,29 @@ state_loc = st.selectbox(
     index=mt_idx
 )
 
-state_data = StateCovidData(state=state_loc).cov_update(update=False)
-county_data = CountyCovidData(state=state_loc).cov_update(update=False)
+with st.spinner('Loading NYT data...'):
+    nyt_fetch.result()
+    pivots = pivot_store.load(state_loc)
+timer.mark('nyt data')
+run.mark('nyt data')
 
 if state_loc == 'Montana':    
     default = 'Missoula'
 else:
-    default = county_data['location'].iloc[0]
+    default = pivots.counties[0]
 
 # Select county 
 location = st.multiselect(
     label='Choose County:',
-    options=list(np.sort(county_data['location'].unique())),
+    options=list(np.sort(pivots.counties)),
     default=default
 )
 
 if not location:
     st.error("Please select at least one county")
 
-# Create one dataframe
-county_loc = county_data.loc[county_data['location'].isin(location)][['location','cases']]
-county_df_loc = county_loc.pivot(columns='location').ffill()['cases']
-state_df_loc = state_data[['location', 'cases']]
-state_df_loc = state_df_loc.pivot(columns='location').ffill()['cases']
-df_loc = pd.merge(
-    state_df_loc, 
-    county_df_loc, 
-    how='inner', 
-    left_index=True, 
-    right_index=True
-    )
+# Slice the precomputed state/county matrices
+df_loc = pivots.frame('cumulative', location)
 
 # Select start date
 month_list = df_loc.index.strftime('%B').unique()
@@ -239,81 +205,40 @@ start_month = st.selectbox(
 )
 start_date = datetime.strptime(start_month + ' 2020', '%B %Y')
 df_loc = df_loc.loc[df_loc.index > start_date]
-
-# Melt dataframe
-df_melt = df_loc.copy()
-df_melt['Date'] = df_melt.index
-df_loc_melt = pd.melt(
-    df_melt, 
-    id_vars='Date', 
-    value_vars=location + [state_loc], 
-    value_name='Total Cases', 
-    var_name='Location'
-    )
+run.mark('county selection', df_loc)
 
 # Plot results ============================================
 # Create checkbox to view dataframe
-df_show = df_loc.copy()
-df_show.index = df_loc.index.strftime("%Y-%m-%d")
 if st.checkbox('Show Raw Data For Total Confirmed Cases'):
     st.write(
         '#### Number of Confirmed Covid-19 Cases:', 
-        df_show.sort_index(ascending=False)
+        date_labels(df_loc).sort_index(ascending=False)
         )
 
-# Plot cumulative chart
-chart = (
-    alt.Chart(df_loc_melt)
-    .mark_line()
-    .encode(
-        x='Date',
-        y='Total Cases',
-        color='Location',
-        tooltip=['Date', 'Total Cases']
-    )
-).interactive()
-
-st.altair_chart(chart, use_container_width=True)
+# Plot cumulative chart (specs are cached per selection and data refresh)
+chart_key = (state_loc, tuple(location), start_month, pivots.token)
+chart_spec, chart_bytes = chart_store.line(
+    'total cases', chart_key, lambda: chart_frame(df_loc, 'Total Cases'), 'Total Cases'
+)
+st.vega_lite_chart(spec=chart_spec, use_container_width=True)
+run.mark('total cases', rows=len(df_loc), bytes_out=chart_bytes)
 
 # Plot diff chart
 
 # Calculate difference
 if st.checkbox('Show doubling time'):
-    df_diff = 0.7/df_loc.pct_change()
+    df_diff = pivots.frame('doubling', location, start=start_date)
     ylab = '# days'
 else:
-    df_diff = df_loc.diff()
+    df_diff = pivots.frame('daily', location, start=start_date)
     ylab = 'New Cases'
 
-df_diff[df_diff < 0] = 0
-df_diff = df_diff[~df_diff.isin([np.nan, np.inf, -np.inf]).any(1)]
-df_diff['Date'] = df_diff.index
-
-# Melt diff dataframe
-df_diff_melt = pd.melt(
-    df_diff, 
-    id_vars='Date', 
-    value_vars=location + [state_loc], 
-    value_name=ylab, 
-    var_name='Location'
-    )
-
-chart_diff = (
-    alt.Chart(df_diff_melt)
-    .mark_area(
-        line=True, 
-        opacity=0.4, 
-        interpolate='step-after'
-    )
-    .encode(
-        x='Date',
-        y=alt.Y(ylab, stack=False),
-        color='Location',
-        tooltip = ['Date', ylab]
-    )
-).interactive()
-
-st.altair_chart(chart_diff, use_container_width=True)
+# Melt diff dataframe, skipping days without a finite value everywhere
+diff_spec, diff_bytes = chart_store.area(
+    'new cases', chart_key + (ylab,), lambda: chart_frame(df_diff, ylab, finite=True), ylab
+)
+st.vega_lite_chart(spec=diff_spec, use_container_width=True)
+run.mark('new cases', rows=len(df_diff), bytes_out=diff_bytes)
 
 # Bottom text
 st.markdown(
@@ -347,3 +272,11 @@ st.text("")
 # image = Image.open('./static/logo_final_square_trans.png')
 image = Image.open('./static/logo_final_text_long_trans.png')
 st.image(image, width=200)
+timer.mark('done')
+run.mark('footer')
+run.finish(stats={'dataset_cache': dataset_cache.stats()})
+timer.note('chart bytes', {
+    'active cases': active_bytes, 'tests completed': testing_bytes,
+    'total cases': chart_bytes, 'new cases': diff_bytes,
+})
+timer.save()
@@ -0,0 +1,66 @@
+"""
+Vega-Lite payload size and build time of the explorer charts.
+
+For a growing number of selected counties and days, compares the spec
+app.py used to send (every point of the melted frame) with the
+downsampled spec from libs.charts, and the time to serve it from the
+chart cache.
+
+    python -m benchmarks.bench_charts [--days 100 400 1000] [--counties 1 10 50]
+"""
+
+import argparse
+import json
+import time
+
+import altair as alt
+import pandas as pd
+
+from benchmarks.fixtures import Fixture
+from libs.cache import DatasetCache
+from libs.charts import POINT_BUDGET, ChartStore, line_chart
+from libs.pivots import chart_frame, pivot_store
+
+
+def timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return time.perf_counter() - start, value
+
+
+def compare(days=(100, 400, 1000), counties=(1, 10, 50), budget=POINT_BUDGET):
+    rows = []
+    # Charts with every point can go past altair's default 5000 row limit
+    alt.data_transformers.disable_max_rows()
+    for n_days in days:
+        with Fixture(states=1, days=n_days, counties=max(counties)):
+            pivots = pivot_store.load('Montana')
+            for n_counties in counties:
+                location = pivots.counties[:n_counties]
+                df = pivots.frame('cumulative', location)
+                frame = lambda: chart_frame(df, 'Total Cases')
+                full_seconds, full = timed(lambda: line_chart(frame(), 'Total Cases').to_dict())
+                store = ChartStore(cache=DatasetCache(), budget=budget)
+                key = ('Montana', tuple(location))
+                build_seconds, (spec, size) = timed(lambda: store.line('total cases', key, frame, 'Total Cases'))
+                hit_seconds, _ = timed(lambda: store.line('total cases', key, frame, 'Total Cases'))
+                rows.append((
+                    n_days, n_counties, len(frame()),
+                    len(json.dumps(full)) / 1024, size / 1024,
+                    1000 * full_seconds, 1000 * build_seconds, 1000 * hit_seconds,
+                ))
+    alt.data_transformers.enable('default')
+    return pd.DataFrame(rows, columns=[
+        'days', 'counties', 'points', 'full KB', 'downsampled KB',
+        'full ms', 'downsampled ms', 'cached ms'
+    ]).set_index(['days', 'counties'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--days', nargs='+', type=int, default=[100, 400, 1000])
+    parser.add_argument('--counties', nargs='+', type=int, default=[1, 10, 50])
+    parser.add_argument('--budget', type=int, default=POINT_BUDGET, help='points per series')
+    args = parser.parse_args()
+    with pd.option_context('display.width', 120, 'display.max_columns', 10):
+        print(compare(args.days, args.counties, args.budget).round(1))
@@ -0,0 +1,98 @@
+"""
+Cost of building SIR forecast frames as the horizon grows.
+
+The extend_index and actual padding SirLearner used before (one np.append
+per day on Python dates, None padding into an object array) are reproduced
+below and timed against the current DatetimeIndex/NaN versions, for one
+location and for --locations of them, at horizons up to several years.
+The time to simulate the trajectory is reported separately since both
+share it.
+
+    python -m benchmarks.bench_forecast [--horizons 120 365 1825 3650] [--locations 50]
+"""
+
+import argparse
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from libs.sir_utils import SirLearner, loss, simulate_sir
+
+
+def legacy_extend_index(index, predict_range):
+    values = index.date
+    current = values[-1]
+    while len(values) < predict_range:
+        current = current + timedelta(days=1)
+        values = np.append(values, current)
+    return values
+
+
+def legacy_frame(data, predict_range, trajectory):
+    new_index = legacy_extend_index(data.index, predict_range)
+    size = len(new_index)
+    extended_actual = np.concatenate((data.values, [None] * (size - len(data.values))))
+    return pd.DataFrame({
+        'Actual': extended_actual,
+        'Susceptible': trajectory[:, 0],
+        'Infectious': trajectory[:, 1],
+        'Recovered': trajectory[:, 2]
+    }, index=new_index)
+
+
+def current_frame(learner, data, trajectory):
+    new_index = learner.extend_index(data.index)
+    extended_actual = np.full(len(new_index), np.nan)
+    extended_actual[:len(data)] = data.values
+    return pd.DataFrame({
+        'Actual': extended_actual,
+        'Susceptible': trajectory[:, 0],
+        'Infectious': trajectory[:, 1],
+        'Recovered': trajectory[:, 2]
+    }, index=new_index)
+
+
+def timed(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def compare(horizons=(120, 365, 1825, 3650), locations=50, observed=200):
+    data = pd.Series(
+        np.arange(1, observed + 1, dtype=float),
+        index=pd.date_range('2020-03-10', periods=observed)
+    )
+    rows = []
+    for horizon in horizons:
+        learner = SirLearner(data.to_frame('loc'), 'loc', loss, horizon, 0, 2, 1000)
+        trajectory = simulate_sir(0.0004, 0.2, 998, 2, 0, max(horizon, observed))[0]
+        legacy = timed(lambda: legacy_frame(data, horizon, trajectory))
+        current = timed(lambda: current_frame(learner, data, trajectory))
+        many_legacy = timed(lambda: [legacy_frame(data, horizon, trajectory) for _ in range(locations)], 1)
+        many_current = timed(lambda: [current_frame(learner, data, trajectory) for _ in range(locations)], 1)
+        simulate = timed(lambda: simulate_sir(0.0004, 0.2, 998, 2, 0, horizon), 1)
+        simulate_batch = timed(lambda: simulate_sir(np.full(locations, 0.0004), 0.2, 998, 2, 0, horizon), 1)
+        rows.append((
+            horizon, 1000 * legacy, 1000 * current, 1000 * many_legacy, 1000 * many_current,
+            1000 * simulate, 1000 * simulate_batch
+        ))
+    return pd.DataFrame(rows, columns=[
+        'horizon', 'legacy ms', 'current ms',
+        'legacy x{} ms'.format(locations), 'current x{} ms'.format(locations),
+        'simulate ms', 'simulate x{} batched ms'.format(locations),
+    ]).set_index('horizon')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--horizons', nargs='+', type=int, default=[120, 365, 1825, 3650])
+    parser.add_argument('--locations', type=int, default=50)
+    args = parser.parse_args()
+    with pd.option_context('display.width', 140, 'display.max_columns', 10):
+        print(compare(args.horizons, args.locations).round(2))
@@ -0,0 +1,77 @@
+"""
+Peak memory and time of loading one state from the NYT county feed.
+
+Compares the old approach (read the whole national csv, then filter on
+state) with the chunked reader and with building a snapshot, on a
+synthetic feed shaped like us-counties.csv. Memory is the tracemalloc high
+water mark, which includes NumPy and pandas buffers; it is measured in a
+separate run because tracing slows down the parsers a lot.
+
+    python -m benchmarks.bench_ingest [--days N] [--counties N]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.fixtures import ALL_STATES, write_feeds
+from libs.snapshot import CHUNK_ROWS, FeedSnapshot, read_nyt_csv
+
+
+def naive_read(path, state):
+    df = pd.read_csv(path, parse_dates=[0], index_col=['date'])
+    return df[df['state'] == state]
+
+
+def snapshot_read(path, state, root):
+    snapshot = FeedSnapshot('bench', path, root=root, incremental=True)
+    snapshot.refresh(force=True)
+    return snapshot.read(state)
+
+
+def measure(fn, *args):
+    """Wall time of an untraced run and peak memory of a traced one"""
+    start = time.perf_counter()
+    fn(*args)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    df = fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, df
+
+
+def compare(days=300, counties=60, state='Montana', chunksize=CHUNK_ROWS):
+    tmp = tempfile.mkdtemp()
+    try:
+        path = write_feeds(tmp, states=ALL_STATES, days=days, counties=counties)[0]
+        runs = [
+            ('read all, then filter', naive_read, path, state),
+            ('chunked, state pushdown', read_nyt_csv, path, [state], chunksize),
+            ('snapshot build + read', snapshot_read, path, state, os.path.join(tmp, 'snap')),
+        ]
+        rows = []
+        for name, fn, *args in runs:
+            seconds, peak, df = measure(fn, *args)
+            result = int(df.memory_usage(deep=True).sum())
+            rows.append((name, seconds, peak / 2**20, result / 2**20, len(df)))
+        feed_mb = os.path.getsize(path) / 2**20
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    print('feed: {:.1f} MB'.format(feed_mb))
+    return pd.DataFrame(
+        rows, columns=['reader', 'seconds', 'peak MB', 'result MB', 'rows']
+    ).set_index('reader')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--days', type=int, default=300)
+    parser.add_argument('--counties', type=int, default=60, help='counties per state')
+    args = parser.parse_args()
+    print(compare(days=args.days, counties=args.counties))
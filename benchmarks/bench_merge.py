@@ -0,0 +1,118 @@
+"""
+Compares reconcile() with the three merge paths it replaced.
+
+The old CountyCovidData.merge_data, StateCovidData.merge_data and
+cov_update.py are reproduced below as they ran (an outer merge on the
+value columns plus the date, a global ffill/bfill, and a groupby for
+counties) and timed against reconcile on synthetic multi-state NYT data
+plus a state-library series for a few locations.
+
+    python -m benchmarks.bench_merge [--days N] [--counties N]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from libs.reconcile import reconcile
+
+
+def synthetic_sources(states=10, counties=50, days=300, msl_locations=4, seed=0):
+    """Returns (nyt, msl) long frames indexed by date"""
+    rng = np.random.RandomState(seed)
+    dates = pd.date_range('2020-03-01', periods=days)
+    locations = np.array([
+        'State {} County {}'.format(s, c) for s in range(states) for c in range(counties)
+    ])
+    cases = rng.gamma(2, 2, size=(days, len(locations))).cumsum(axis=0).round()
+    nyt = pd.DataFrame({
+        'county': np.tile(locations, days),
+        'cases': cases.ravel(),
+        'deaths': (cases.ravel() / 50).round(),
+        'source': 'nyt',
+    }, index=pd.Index(np.repeat(dates, len(locations)), name='date'))
+    # NYT lags a few days behind the state library
+    nyt = nyt[nyt.index <= dates[-4]]
+    msl_cases = cases[:, :msl_locations] + rng.randint(0, 3, size=(days, msl_locations))
+    msl = pd.DataFrame({
+        'county': np.tile(locations[:msl_locations], days),
+        'cases': msl_cases.ravel(),
+        'source': 'msl',
+    }, index=pd.Index(np.repeat(dates, msl_locations), name='date'))
+    return nyt, msl
+
+
+def legacy_merge(nyt, msl, column):
+    df_full = pd.merge(
+        nyt.reset_index(),
+        msl.reset_index(),
+        how='outer',
+        on=['date', column, 'cases', 'source']
+    ).set_index('date').sort_index()
+    df_full = df_full[[column, 'cases', 'deaths', 'source']]
+    df_full.ffill(axis=0, inplace=True)
+    df_full.bfill(axis=0, inplace=True)
+    return df_full
+
+
+def legacy_county(nyt, msl):
+    df_full = legacy_merge(nyt, msl, 'county')
+    df_full.rename(columns={'county': 'location'}, inplace=True)
+    return df_full.groupby([df_full.index, 'location']).first().reset_index(['location'])
+
+
+def legacy_state(nyt, msl):
+    nyt = nyt.rename(columns={'county': 'state'})
+    msl = msl.rename(columns={'county': 'state'})
+    df_full = legacy_merge(nyt, msl, 'state')
+    df_full.rename(columns={'state': 'location'}, inplace=True)
+    return df_full
+
+
+def legacy_cov_update(nyt, msl):
+    return legacy_merge(nyt, msl, 'county')
+
+
+def unified(nyt, msl):
+    return reconcile([
+        nyt.rename(columns={'county': 'location'}),
+        msl.rename(columns={'county': 'location'}),
+    ])
+
+
+def best_time(fn, *args, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def compare(state_counts=(1, 5, 25), counties=50, days=300):
+    paths = [
+        ('CountyCovidData.merge_data', legacy_county),
+        ('StateCovidData.merge_data', legacy_state),
+        ('cov_update.py', legacy_cov_update),
+        ('reconcile', unified),
+    ]
+    rows = []
+    for states in state_counts:
+        nyt, msl = synthetic_sources(states=states, counties=counties, days=days)
+        for name, fn in paths:
+            seconds, result = best_time(fn, nyt, msl)
+            rows.append((states, len(nyt) + len(msl), name, seconds, len(result)))
+    df = pd.DataFrame(rows, columns=['states', 'input rows', 'path', 'seconds', 'output rows'])
+    df['us per row'] = 1e6 * df['seconds'] / df['input rows']
+    return df.set_index(['states', 'path'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--days', type=int, default=300)
+    parser.add_argument('--counties', type=int, default=50, help='counties per state')
+    args = parser.parse_args()
+    with pd.option_context('display.width', 120, 'display.max_columns', 10):
+        print(compare(counties=args.counties, days=args.days))
@@ -0,0 +1,168 @@
+"""
+Times and memory-profiles every stage of the data and model pipeline.
+
+Each stage runs on synthetic feeds (benchmarks/fixtures.py) at every
+combination of --states and --days, from the snapshot build through the
+loaders and pivots app.py uses to the SIR fit. Wall time is the best of
+--repeat untraced runs; peak memory is the tracemalloc high water mark of
+one more, traced, run. Results are written as JSON so runs can be diffed;
+with --baseline, stages more than --tolerance times slower than the
+baseline are reported and the exit status is 1.
+
+    python -m benchmarks.bench_pipeline [--states 1 all] [--days 100 1000]
+        [--output bench_results.json] [--baseline old.json]
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.fixtures import ALL_STATES, Fixture
+from libs.obs_utils import (
+    CountyCovidData, CovidTrends, StateCovidData, nyt_county_snapshot, nyt_state_snapshot
+)
+from libs.pivots import chart_frame, data_token, pivot_store
+from libs.sir_utils import SirLearner, loss
+from libs.startup import release
+
+
+def snapshot_build():
+    nyt_county_snapshot.refresh(force=True)
+    nyt_state_snapshot.refresh(force=True)
+
+
+def explorer_frames():
+    """The slicing and melting app.py does for one explorer view"""
+    pivots = pivot_store.load('Montana')
+    location = ['Missoula', 'Gallatin']
+    frames = [chart_frame(pivots.frame('cumulative', location), 'Total Cases')]
+    for variant in ['daily', 'doubling']:
+        frames.append(chart_frame(pivots.frame(variant, location), variant, finite=True))
+    return pd.concat(frames)
+
+
+def sir_train(solver):
+    def train():
+        data = CovidTrends(county=30063).get_covid_data()
+        data = data[data['Missoula'] > 0].astype(float)
+        learner = SirLearner(data, 'Missoula', loss, 120, 0, 2, 1000, solver=solver)
+        return learner.train()[2]
+    return train
+
+
+STAGES = [
+    ('snapshot build', snapshot_build),
+    ('snapshot read', lambda: nyt_county_snapshot.read('Montana')),
+    ('CountyCovidData.cov_update', lambda: CountyCovidData().cov_update()),
+    ('StateCovidData.cov_update', lambda: StateCovidData().cov_update()),
+    ('CovidTrends.get_covid_data', lambda: CovidTrends(county=30063).get_covid_data()),
+    ('pivot build', lambda: pivot_store.build('Montana', data_token())),
+    ('explorer frames', explorer_frames),
+    ('SirLearner.train (rk4)', sir_train('rk4')),
+    ('SirLearner.train (ivp)', sir_train('ivp')),
+]
+
+
+def run_stage(fn, repeat=3):
+    """Returns (best seconds, peak bytes, result)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, result
+
+
+def run_scale(states, days, counties=60, repeat=3):
+    rows = []
+    with Fixture(states=states, days=days, counties=counties) as fixture:
+        for name, fn in STAGES:
+            row = {'stage': name, 'states': states, 'days': days}
+            try:
+                seconds, peak, result = run_stage(fn, repeat)
+                row.update({
+                    'seconds': seconds,
+                    'peak_mb': peak / 2**20,
+                    'rows': len(result) if hasattr(result, '__len__') else None,
+                    'error': None,
+                })
+            except Exception as err:
+                row.update({'seconds': None, 'peak_mb': None, 'rows': None, 'error': repr(err)})
+            rows.append(row)
+            print('{:>3} states {:>5} days  {:<28} {}'.format(
+                states, days, name,
+                row['error'] or '{:.3f}s {:.1f} MB'.format(row['seconds'], row['peak_mb'])
+            ))
+        feed_bytes = fixture.size()
+    return rows, feed_bytes
+
+
+def regressions(results, baseline, tolerance):
+    """Stages that got more than tolerance times slower than in baseline"""
+    key = lambda r: (r['stage'], r['states'], r['days'])
+    old = {key(r): r for r in baseline['stages'] if r['seconds']}
+    slower = []
+    for row in results['stages']:
+        before = old.get(key(row))
+        if before and row['seconds'] and row['seconds'] > tolerance * before['seconds']:
+            slower.append((key(row), before['seconds'], row['seconds']))
+    return slower
+
+
+def main(states=(1,), days=(100,), counties=60, repeat=3):
+    results = {
+        'time': time.time(),
+        'release': release(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'counties_per_state': counties,
+        'repeat': repeat,
+        'feed_bytes': {},
+        'stages': [],
+    }
+    for n_states in states:
+        for n_days in days:
+            rows, feed_bytes = run_scale(n_states, n_days, counties, repeat)
+            results['stages'].extend(rows)
+            results['feed_bytes']['{}x{}'.format(n_states, n_days)] = feed_bytes
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--states', nargs='+', default=['1'],
+        help="numbers of states to generate, 'all' for {}".format(ALL_STATES))
+    parser.add_argument('--days', nargs='+', type=int, default=[100])
+    parser.add_argument('--counties', type=int, default=60, help='counties per state')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    args = parser.parse_args()
+
+    states = [ALL_STATES if s == 'all' else int(s) for s in args.states]
+    results = main(states, args.days, args.counties, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('Results written to ' + args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for (stage, n_states, n_days), before, after in slower:
+            print('REGRESSION {} ({} states, {} days): {:.3f}s -> {:.3f}s'.format(
+                stage, n_states, n_days, before, after
+            ))
+        if slower:
+            sys.exit(1)
@@ -0,0 +1,71 @@
+"""
+Memory of the county case series for every state, by representation.
+
+Loads CountyCovidData(state).cov_update() for all states of synthetic
+national feeds (benchmarks/fixtures.py) and compares the total size of
+
+    object frame       location and source as Python strings, float64
+                       counts (what cov_update() returned before
+                       categoricals)
+    categorical frame  CaseSeries.to_frame()
+    CaseSeries         the arrays cov_update() now returns
+
+plus the time to build the date x location matrix from the frame with
+DataFrame.pivot and from the series with CaseSeries.wide.
+
+    python -m benchmarks.bench_series [--states N] [--days N] [--counties N]
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.fixtures import ALL_STATES, Fixture
+from libs.obs_utils import CountyCovidData, nyt_state_snapshot
+
+
+def object_frame(series):
+    df = series.to_frame()
+    return df.astype({
+        'location': object, 'source': object, 'cases': float, 'deaths': float
+    })
+
+
+def measure(states=ALL_STATES, days=400, counties=60):
+    totals = {'object frame': 0, 'categorical frame': 0, 'CaseSeries': 0}
+    seconds = {'DataFrame.pivot': 0.0, 'CaseSeries.wide': 0.0}
+    rows = 0
+    with Fixture(states=states, days=days, counties=counties):
+        for state in nyt_state_snapshot.states():
+            series = CountyCovidData(state=state).cov_update(update=False)
+            rows += len(series)
+            frame = object_frame(series)
+            totals['object frame'] += frame.memory_usage(deep=True).sum()
+            totals['categorical frame'] += series.to_frame().memory_usage(deep=True).sum()
+            totals['CaseSeries'] += series.nbytes
+
+            start = time.perf_counter()
+            frame[['location', 'cases']].pivot(columns='location')
+            seconds['DataFrame.pivot'] += time.perf_counter() - start
+            start = time.perf_counter()
+            series.wide('cases')
+            seconds['CaseSeries.wide'] += time.perf_counter() - start
+    return rows, totals, seconds
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--states', type=int, default=ALL_STATES)
+    parser.add_argument('--days', type=int, default=400)
+    parser.add_argument('--counties', type=int, default=60, help='counties per state')
+    args = parser.parse_args()
+    rows, totals, seconds = measure(args.states, args.days, args.counties)
+    print('{:,} rows'.format(rows))
+    sizes = pd.DataFrame({
+        'MB': {name: size / 2**20 for name, size in totals.items()},
+        'bytes/row': {name: size / rows for name, size in totals.items()},
+    })
+    print(sizes.round(2))
+    for name, value in seconds.items():
+        print('{:<16} {:.3f}s'.format(name, value))
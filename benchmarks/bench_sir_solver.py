@@ -0,0 +1,65 @@
+"""
+Compares the solve_ivp and RK4/sensitivity SIR backends.
+
+Reports how far each backend's trajectory is from a tight-tolerance
+reference solution and the wall time of SirLearner.train with each.
+
+    python -m benchmarks.bench_sir_solver
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.integrate import solve_ivp
+
+from libs.sir_utils import SirLearner, loss, rk4_sir
+
+
+def reference(beta, gamma, s_0, i_0, r_0, size):
+    def SIR(t, y):
+        S, I, R = y
+        return [-beta*S*I, beta*S*I - gamma*I, gamma*I]
+    t = np.arange(0, size, 1)
+    return solve_ivp(SIR, [0, size], [s_0, i_0, r_0], t_eval=t, rtol=1e-10, atol=1e-10).y
+
+
+def synthetic_cases(N, days, beta, gamma=0.2, seed=0):
+    y = reference(beta, gamma, N - 2, 2, 0, days)
+    noise = np.random.RandomState(seed).normal(1, 0.05, days)
+    index = pd.date_range('2020-03-10', periods=days)
+    return pd.Series(np.maximum(y[1]*noise, 1), index=index)
+
+
+def accuracy(N=1000, days=120, beta=0.0004, gamma=0.2):
+    ref = reference(beta, gamma, N - 2, 2, 0, days)[1]
+    def SIR(t, y):
+        S, I, R = y
+        return [-beta*S*I, beta*S*I - gamma*I, gamma*I]
+    ivp = solve_ivp(SIR, [0, days], [N - 2, 2, 0], t_eval=np.arange(0, days, 1)).y[1]
+    rows = [('ivp', np.abs(ivp - ref).max())]
+    for steps in [1, 2, 4, 8]:
+        rk4 = rk4_sir(beta, gamma, N - 2, 2, 0, days, steps_per_day=steps)[1]
+        rows.append(('rk4 ({}/day)'.format(steps), np.abs(rk4 - ref).max()))
+    return pd.DataFrame(rows, columns=['solver', 'max abs error in I']).set_index('solver')
+
+
+def train_times(N=1000, days=60, beta=0.0004, repeat=3):
+    data = pd.DataFrame({'loc': synthetic_cases(N, days, beta)})
+    rows = []
+    for solver in ['ivp', 'rk4']:
+        learner = SirLearner(data, 'loc', loss, 120, 0, 2, N, solver=solver)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fit_beta, fit_gamma, df = learner.train()
+            times.append(time.perf_counter() - start)
+        rmse = np.sqrt(np.mean((df['Infectious'].values[:days] - data['loc'].values)**2))
+        rows.append((solver, min(times), fit_beta, rmse))
+    return pd.DataFrame(rows, columns=['solver', 'train seconds', 'beta', 'rmse']).set_index('solver')
+
+
+if __name__ == '__main__':
+    print(accuracy())
+    print()
+    print(train_times())
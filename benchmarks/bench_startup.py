@@ -0,0 +1,100 @@
+"""
+Import cost of everything app.py loads before its first paint.
+
+Imports the dashboard's modules in a fresh interpreter with
+python -X importtime, with outgoing socket connections disabled so any
+network I/O at import time fails loudly, and reports:
+
+- the cumulative import time of each module app.py imports
+- the slowest modules overall
+- whether any of libs.startup.HEAVY_MODULES got pulled in
+
+Followed by the cold-start milestones app.py logged to
+libs.startup.STARTUP_LOG (time to first paint and each section).
+
+    python -m benchmarks.bench_startup [--top N]
+"""
+
+import argparse
+import importlib.util
+import subprocess
+import sys
+
+import pandas as pd
+
+from libs.startup import HEAVY_MODULES, STARTUP_LOG, load_reports
+
+APP_MODULES = [
+    'streamlit', 'PIL', 'numpy', 'pandas', 'altair',
+    'libs.obs_utils', 'libs.gsheet', 'libs.cache', 'libs.fetch', 'libs.pivots', 'libs.startup',
+]
+
+NO_NETWORK = '''
+import socket
+def connect(self, *args):
+    raise RuntimeError('network I/O during import')
+socket.socket.connect = connect
+socket.socket.connect_ex = connect
+'''
+
+
+def import_times(modules):
+    """
+    Returns (per module frame, top level modules) from -X importtime.
+    """
+    code = NO_NETWORK + ''.join('import {}\n'.format(m) for m in modules)
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    rows = []
+    errors = []
+    for line in out.stderr.decode().splitlines():
+        if not line.startswith('import time:'):
+            errors.append(line)
+            continue
+        fields = line[len('import time:'):].split('|')
+        if not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        rows.append((
+            name.strip(), len(name) - len(name.lstrip()),
+            int(fields[0]) / 1000, int(fields[1]) / 1000
+        ))
+    if out.returncode:
+        raise RuntimeError('\n'.join(errors))
+    df = pd.DataFrame(rows, columns=['module', 'depth', 'self ms', 'cumulative ms'])
+    return df
+
+
+def report(top=15):
+    modules = [m for m in APP_MODULES if importlib.util.find_spec(m.split('.')[0]) is not None]
+    df = import_times(modules)
+    # A module imported by several others is listed once, where it first loads
+    first = df.drop_duplicates('module').set_index('module')
+    print('Modules imported by app.py:')
+    print(first.reindex(modules)[['cumulative ms']].fillna(0).to_string())
+    print()
+    print('Slowest modules:')
+    print(first.sort_values('self ms', ascending=False).head(top)[['self ms', 'cumulative ms']].to_string())
+    print()
+    loaded = [m for m in HEAVY_MODULES if m in set(first.index)]
+    print('Heavy modules imported: {}'.format(', '.join(loaded) if loaded else 'none'))
+    print('Total: {:.0f} ms'.format(df.loc[df['depth'] == 1, 'cumulative ms'].sum()))
+
+    runs = load_reports()
+    if runs:
+        print()
+        print('Cold starts logged in {} (seconds since start):'.format(STARTUP_LOG))
+        marks = pd.DataFrame(
+            [r['marks'] for r in runs],
+            index=pd.Index([r['release'] for r in runs], name='release')
+        )
+        print(marks.tail(10).round(2).to_string())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--top', type=int, default=15, help='number of slowest modules to show')
+    args = parser.parse_args()
+    report(top=args.top)
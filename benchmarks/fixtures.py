@@ -0,0 +1,134 @@
+"""
+Synthetic NYT-shaped feeds for the benchmarks.
+
+Writes us-counties.csv and us-states.csv files with the same columns,
+ordering and value types as the NYT feeds, at any scale from one state to
+every state and from a few to 1000+ days. The first state is Montana, with
+Missoula (30063) and Gallatin (30031) among its counties, so the Montana
+specific code paths run on the fixtures too.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from libs import obs_utils
+from libs.cache import dataset_cache
+from libs.pivots import pivot_store
+
+ALL_STATES = 55     # states and territories in the NYT feeds
+START_DATE = '2020-01-21'
+MONTANA_COUNTIES = {30031: 'Gallatin', 30063: 'Missoula', 30111: 'Yellowstone', 30049: 'Lewis and Clark'}
+
+
+def state_names(states):
+    return ['Montana'] + ['State {}'.format(s) for s in range(1, states)]
+
+
+def county_table(states, counties):
+    """(state, county, fips) of every county, in feed order"""
+    rows = []
+    for s, state in enumerate(state_names(states)):
+        if state == 'Montana':
+            named = list(MONTANA_COUNTIES.items())
+            fips = [f for f, _ in named] + [30200 + c for c in range(counties - len(named))]
+            names = [n for _, n in named] + ['County {}'.format(c) for c in range(counties - len(named))]
+        else:
+            fips = [1000*(s + 1) + c for c in range(counties)]
+            names = ['County {}'.format(c) for c in range(counties)]
+        rows.extend(zip([state]*counties, names[:counties], fips[:counties]))
+    return pd.DataFrame(rows, columns=['state', 'county', 'fips'])
+
+
+def write_feeds(root, states=1, days=100, counties=60, seed=0):
+    """
+    Writes us-counties.csv and us-states.csv under root.
+
+    Returns (county path, state path). Cases grow randomly from zero, and
+    a county only appears in the feed once it has a case.
+    """
+    rng = np.random.RandomState(seed)
+    table = county_table(states, counties)
+    dates = pd.date_range(START_DATE, periods=days).strftime('%Y-%m-%d')
+    cases = np.zeros(len(table))
+    deaths = np.zeros(len(table))
+    # Counties reach their first case at different times
+    onset = rng.randint(0, max(days // 3, 1), size=len(table))
+    state_codes = pd.Categorical(table['state'], categories=state_names(states)).codes
+    county_path = os.path.join(root, 'us-counties.csv')
+    state_path = os.path.join(root, 'us-states.csv')
+    os.makedirs(root, exist_ok=True)
+    with open(county_path, 'w') as cf, open(state_path, 'w') as sf:
+        cf.write('date,county,state,fips,cases,deaths\n')
+        sf.write('date,state,fips,cases,deaths\n')
+        for day, date in enumerate(dates):
+            active = onset <= day
+            cases += active * rng.poisson(2, size=len(table))
+            deaths += active * rng.binomial(1, 0.02, size=len(table))
+            present = active & (cases > 0)
+            day_df = table[present].copy()
+            day_df.insert(0, 'date', date)
+            day_df['cases'] = cases[present].astype(int)
+            day_df['deaths'] = deaths[present].astype(int)
+            day_df[['date', 'county', 'state', 'fips', 'cases', 'deaths']].to_csv(
+                cf, header=False, index=False
+            )
+            totals = np.bincount(state_codes[present], weights=cases[present], minlength=states)
+            dead = np.bincount(state_codes[present], weights=deaths[present], minlength=states)
+            reported = totals > 0
+            pd.DataFrame({
+                'date': date,
+                'state': np.array(state_names(states))[reported],
+                'fips': np.arange(1, states + 1)[reported],
+                'cases': totals[reported].astype(int),
+                'deaths': dead[reported].astype(int),
+            }).to_csv(sf, header=False, index=False)
+    return county_path, state_path
+
+
+class Fixture(object):
+    """
+    Synthetic feeds in a temporary directory, wired into libs.obs_utils.
+
+    Within the with block the NYT snapshots, the pivot store and the
+    dataset cache all read from and write to the fixture, so the real data
+    directory is never touched.
+    """
+
+    def __init__(self, states=1, days=100, counties=60, seed=0):
+        self.states = states
+        self.days = days
+        self.counties = counties
+        self.seed = seed
+        self.root = None
+
+    def __enter__(self):
+        self.root = tempfile.mkdtemp(prefix='covid-bench-')
+        self.county_path, self.state_path = write_feeds(
+            self.root, self.states, self.days, self.counties, self.seed
+        )
+        self.saved = []
+        for snapshot, path in [
+            (obs_utils.nyt_county_snapshot, self.county_path),
+            (obs_utils.nyt_state_snapshot, self.state_path),
+        ]:
+            self.saved.append((snapshot, snapshot.url, snapshot.root))
+            snapshot.url = path
+            snapshot.root = os.path.join(self.root, 'snapshots', snapshot.source)
+        self.saved_pivots = pivot_store.root
+        pivot_store.root = os.path.join(self.root, 'pivots')
+        dataset_cache.invalidate()
+        return self
+
+    def __exit__(self, *exc):
+        for snapshot, url, root in self.saved:
+            snapshot.url, snapshot.root = url, root
+        pivot_store.root = self.saved_pivots
+        dataset_cache.invalidate()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def size(self):
+        return os.path.getsize(self.county_path) + os.path.getsize(self.state_path)
@@ -0,0 +1,139 @@
+"""
+Process-wide dataset cache shared by every Streamlit session.
+
+Streamlit re-runs app.py for each session and widget change but keeps
+imported modules alive, so a cache living here is shared by all of them.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+
+def sizeof(value):
+    """Approximate memory footprint of a cached value in bytes"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if hasattr(value, 'nbytes'):
+        # Arrays, memmaps and CaseSeries
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sum(sizeof(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class DatasetCache(object):
+    """
+    Thread-safe LRU cache with a TTL and a memory ceiling.
+
+    Only one loader runs per key at a time; concurrent callers asking for a
+    key that is already loading wait for that load instead of starting their
+    own. Cached values are shared, so callers must copy before mutating.
+    """
+
+    def __init__(self, ttl=3600, max_entries=128, max_bytes=512 * 2**20):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (value, size, expires)
+        self._inflight = {}             # key -> Future
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.load_time = 0.0
+
+    def get(self, key, loader, ttl=None):
+        """
+        Returns the cached value for key, calling loader() on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+                self.expirations += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.waits += 1
+                owner = False
+            else:
+                self.misses += 1
+                future = self._inflight[key] = Future()
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        start = time.time()
+        try:
+            value = loader()
+        except BaseException as err:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(err)
+            raise
+        with self._lock:
+            self.load_time += time.time() - start
+            del self._inflight[key]
+            self._store(key, value, self.ttl if ttl is None else ttl)
+        future.set_result(value)
+        return value
+
+    def _store(self, key, value, ttl):
+        size = sizeof(value)
+        if size > self.max_bytes:
+            # Too big to ever fit, hand it back uncached
+            return
+        self._entries[key] = (value, size, time.time() + ttl)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        value, size, expires = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, key=None):
+        """Drops one key, or everything when key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+            elif key in self._entries:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.waits
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': (self.hits + self.waits) / lookups if lookups else 0.0,
+                'load_time': self.load_time,
+            }
+
+
+dataset_cache = DatasetCache()
@@ -0,0 +1,141 @@
+"""
+Chart payloads for the dashboard's Altair charts.
+
+A chart's Vega-Lite JSON carries every data point, so it grows with days x
+locations. Here every line chart series is first downsampled to at most
+POINT_BUDGET points with Largest-Triangle-Three-Buckets, which keeps the
+peaks and turns a plain stride would miss. Step area charts keep every
+point: a step holds its value until the next one, so dropping points would
+change the area drawn. The finished spec is cached in the
+shared dataset cache per (chart, state, counties, start month, metric,
+data version). app.py hands the cached dict to st.vega_lite_chart, so a
+rerun rebuilds neither the frame nor the spec.
+
+ChartStore returns every spec with its serialized size, so app.py records
+the bytes of each chart it renders.
+"""
+
+import json
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from libs.cache import dataset_cache
+from libs.telemetry import telemetry
+
+POINT_BUDGET = 250
+
+
+def lttb(x, y, budget):
+    """
+    Indices of the budget points of (x, y) that Largest-Triangle-Three-Buckets
+    keeps. The first and last points are always kept.
+
+    See Steinarsson, Downsampling Time Series for Visual Representation (2013).
+    """
+    size = len(x)
+    if budget >= size or budget < 3:
+        return np.arange(size)
+    edges = np.linspace(1, size - 1, budget - 1).astype(int)
+    keep = np.empty(budget, dtype=int)
+    keep[0], keep[-1] = 0, size - 1
+    a = 0
+    for i in range(budget - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else size
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(df, value_name, budget=POINT_BUDGET):
+    """
+    Downsamples every Location of a long chart frame to at most budget points.
+
+    Points without a finite value are dropped first; they aren't drawn anyway.
+    """
+    parts = []
+    for _, part in df.groupby('Location', sort=False):
+        values = part[value_name].values.astype(float)
+        part = part[np.isfinite(values)]
+        if len(part) > budget:
+            x = part['Date'].values.astype('datetime64[s]').astype(float)
+            part = part.iloc[lttb(x, part[value_name].values.astype(float), budget)]
+        parts.append(part)
+    if not parts:
+        return df
+    return pd.concat(parts)
+
+
+def line_chart(df, y):
+    return (
+        alt.Chart(df)
+        .mark_line()
+        .encode(
+            x='Date',
+            y=y,
+            color='Location',
+            tooltip=['Date', y]
+        )
+    ).interactive()
+
+
+def area_chart(df, y, color='Location'):
+    encoding = dict(x='Date', y=alt.Y(y, stack=False), tooltip=['Date', y])
+    if color:
+        encoding['color'] = color
+    return (
+        alt.Chart(df)
+        .mark_area(
+            line=True,
+            opacity=0.4,
+            interpolate='step-after'
+        )
+        .encode(**encoding)
+    ).interactive()
+
+
+class ChartStore(object):
+    """
+    Cached Vega-Lite specs, shared by every session.
+    """
+
+    def __init__(self, cache=dataset_cache, budget=POINT_BUDGET, ttl=None):
+        self.cache = cache
+        self.budget = budget
+        self.ttl = ttl
+
+    def spec(self, name, key, build):
+        """
+        (Vega-Lite dict, serialized bytes) of the chart build() returns,
+        cached under (name, key).
+
+        key must identify everything the chart depends on, including the
+        version of its data.
+        """
+        def load():
+            with telemetry.section('chart.build.{}'.format(name)) as section:
+                spec = build().to_dict()
+                size = len(json.dumps(spec))
+                section.add(bytes_out=size)
+            return spec, size
+        return self.cache.get(('chart', name, self.budget) + tuple(key), load, ttl=self.ttl)
+
+    def line(self, name, key, frame, y):
+        """
+        Downsampled line chart of the long chart frame frame() returns.
+
+        frame is only called on a cache miss.
+        """
+        return self.spec(name, key, lambda: line_chart(downsample(frame(), y, self.budget), y))
+
+    def area(self, name, key, frame, y, color='Location'):
+        """Step area chart of every point, see line"""
+        return self.spec(name, key, lambda: area_chart(frame(), y, color))
+
+
+chart_store = ChartStore()
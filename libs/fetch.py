@@ -0,0 +1,169 @@
+"""
+Concurrent fetching of every upstream source.
+
+fetch_all() downloads all sources at once so startup waits for the slowest
+source instead of the sum of them. HTTP sources share one pooled
+requests.Session and are parsed straight from the response stream; any
+blocking callable (a Google Sheet read, a snapshot refresh) can be a source
+too. Each source has its own timeout and retries with exponential backoff.
+Point the URLs at a local server (e.g. python -m http.server) to run it
+offline.
+
+A timed out thread can't be cancelled, so URL reads use the timeout as
+their socket timeout too, and loaders must bound their own blocking (the
+snapshot downloads go through open_url with one). A loader that times out
+isn't retried, since the retry would only queue behind the stuck call.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Source(object):
+    """
+    One upstream source.
+
+    Give either url, whose streamed response body is handed to parse (raw
+    bytes by default), or loader, a blocking callable. timeout is the
+    seconds to wait for one attempt.
+    """
+
+    def __init__(self, name, url=None, loader=None, parse=None, timeout=60, retries=3, backoff=1.0):
+        if (url is None) == (loader is None):
+            raise ValueError('Source needs exactly one of url or loader')
+        self.name = name
+        self.url = url
+        self.loader = loader
+        self.parse = parse
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+
+class FetchResult(object):
+    def __init__(self, name, value=None, error=None, attempts=0, seconds=0.0):
+        self.name = name
+        self.value = value
+        self.error = error
+        self.attempts = attempts
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = 'ok' if self.ok else repr(self.error)
+        return '<FetchResult {} {} in {:.2f}s after {} attempt(s)>'.format(
+            self.name, status, self.seconds, self.attempts
+        )
+
+
+def make_session(pool_size=10):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_session():
+    """The process-wide pooled session"""
+    with _shared_lock:
+        if 'session' not in _shared:
+            _shared['session'] = make_session()
+        return _shared['session']
+
+
+def open_url(url, timeout, headers=None, session=None):
+    """
+    Streamed GET of url with timeout as the socket timeout. Raises on HTTP
+    errors but returns 304 responses; use as a context manager and read
+    response.raw.
+    """
+    session = shared_session() if session is None else session
+    response = session.get(url, headers=headers, stream=True, timeout=timeout)
+    try:
+        response.raise_for_status()
+    except requests.HTTPError:
+        response.close()
+        raise
+    response.raw.decode_content = True
+    return response
+
+
+def read_url(session, source):
+    """Streams one URL into its parser"""
+    with open_url(source.url, source.timeout, session=session) as response:
+        if source.parse is None:
+            return response.raw.read()
+        return source.parse(response.raw)
+
+
+async def fetch_source(loop, executor, session, source):
+    start = time.time()
+    error = None
+    for attempt in range(1, source.retries + 1):
+        if source.url is not None:
+            call = loop.run_in_executor(executor, read_url, session, source)
+        else:
+            call = loop.run_in_executor(executor, source.loader)
+        try:
+            value = await asyncio.wait_for(call, source.timeout)
+            return FetchResult(source.name, value, None, attempt, time.time() - start)
+        except Exception as err:
+            error = err
+            if source.loader is not None and isinstance(err, asyncio.TimeoutError):
+                # The call is still running, a retry would queue behind it
+                break
+            if attempt < source.retries:
+                await asyncio.sleep(source.backoff * 2**(attempt - 1))
+    return FetchResult(source.name, None, error, attempt, time.time() - start)
+
+
+async def fetch_sources(sources, session=None, max_workers=None):
+    loop = asyncio.get_event_loop()
+    session = shared_session() if session is None else session
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(sources))
+    try:
+        results = await asyncio.gather(*[
+            fetch_source(loop, executor, session, source) for source in sources
+        ])
+    finally:
+        # Don't wait on threads still stuck in a timed out call
+        executor.shutdown(wait=False)
+    return {result.name: result for result in results}
+
+
+def fetch_all(sources, session=None, max_workers=None):
+    """
+    Fetches every source concurrently.
+
+    Returns {name: FetchResult}; failures are reported in FetchResult.error
+    instead of raising so one slow or broken source doesn't take the rest
+    down with it.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(fetch_sources(sources, session, max_workers))
+    finally:
+        loop.close()
+
+
+def fetch_in_background(sources, session=None, max_workers=None):
+    """
+    Starts fetch_all on a background thread and returns its Future.
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(fetch_all, sources, session, max_workers)
+    executor.shutdown(wait=False)
+    return future
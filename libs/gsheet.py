@@ -1,24 +1,199 @@
-from oauth2client.service_account import ServiceAccountCredentials
-import pandas as pd 
-import gspread
+import os
 
+import numpy as np
+import pandas as pd
 
+from libs.cache import dataset_cache
+from libs.metrics import population
+from libs.telemetry import telemetry
 
-def gsheet2df(spreadsheet_id, key, scope, debug=False):
-    """
-    Returns Google Sheet data as a pandas dataframe. 
+# Google Sheets credentials
+SPREADSHEET_ID = "1ZHnIEjpFZ9U9Iu5VJfdTVKU2NiVBMtrvjDekRKsXmLs"
+SCOPE = ['https://www.googleapis.com/auth/spreadsheets',]
+GOOGLE_CREDS = "google-credentials.json"
 
-    Need to setup service account first, then share service account email with the Google Sheet. 
-    See https://www.datasciencelearner.com/get-data-of-google-sheets-using-pandas/
+# GOOGLE_CREDS = json.loads(os.getenv('GOOGLE_CREDENTIALS'))
+
+# Local typed copy of the sheet, see SheetSync
+GSHEET_PATH = './data/gsheet.pkl'
+
+
+def authorize(key, scope, debug=False):
     """
+    gspread client for the service account key (a keyfile name if debug,
+    else the parsed json).
+    """
+    # Imported here so the dashboard can start rendering before they load
+    from oauth2client.service_account import ServiceAccountCredentials
+    import gspread
+
     if debug:
         credentials = ServiceAccountCredentials.from_json_keyfile_name(key, scope)
     else:
         credentials = ServiceAccountCredentials.from_json_keyfile_dict(key, scope)
-    gc = gspread.authorize(credentials)
+    return gspread.authorize(credentials)
+
+
+def gsheet2df(spreadsheet_id, key, scope, debug=False):
+    """
+    Returns Google Sheet data as a pandas dataframe.
 
+    Need to setup service account first, then share service account email with the Google Sheet.
+    See https://www.datasciencelearner.com/get-data-of-google-sheets-using-pandas/
+    """
+    gc = authorize(key, scope, debug)
     workbook = gc.open_by_key(spreadsheet_id)
     sheet = workbook.get_worksheet(0)
     values = sheet.get_all_values()
     data = pd.DataFrame(values[1:], columns=values[0])
     return data
+
+
+def column_letter(n):
+    """A1 notation letter of the nth (1-based) column"""
+    letters = ''
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(ord('A') + rem) + letters
+    return letters
+
+
+def typed_sheet(values, header):
+    """
+    Frame of sheet rows (lists of strings) with Date as datetime, every
+    column whose cells all parse as numbers as float and empty cells as NaN.
+    """
+    width = len(header)
+    rows = [row[:width] + [''] * (width - len(row)) for row in values]
+    df = pd.DataFrame(rows, columns=header).replace('', np.nan)
+    for col in header:
+        if col == 'Date':
+            df[col] = pd.to_datetime(df[col])
+            continue
+        try:
+            df[col] = pd.to_numeric(df[col]).astype(float)
+        except (ValueError, TypeError):
+            pass
+    return df
+
+
+class SheetSync(object):
+    """
+    Local typed copy of the first worksheet of a Google Sheet.
+
+    sync() only fetches the rows from the end of the local copy on, plus the
+    last overlap rows again since recent rows still get filled in. The whole
+    sheet is fetched again when the header changes, the sheet got shorter
+    than the local copy or a column's type changes. One authorized client is
+    kept for the life of the object; pass client to use another backend
+    (anything with gspread's open_by_key/get_worksheet/row_values/get).
+    """
+
+    def __init__(self, spreadsheet_id=SPREADSHEET_ID, key=GOOGLE_CREDS, scope=SCOPE,
+                 path=GSHEET_PATH, debug=True, overlap=7, client=None):
+        self.spreadsheet_id = spreadsheet_id
+        self.key = key
+        self.scope = scope
+        self.path = path
+        self.debug = debug
+        self.overlap = overlap
+        self.client = client
+        self._authorized = client is None
+        self._worksheet = None
+        self.fetched_rows = 0
+
+    def worksheet(self):
+        if self._worksheet is None:
+            if self.client is None:
+                self.client = authorize(self.key, self.scope, self.debug)
+            self._worksheet = self.client.open_by_key(self.spreadsheet_id).get_worksheet(0)
+        return self._worksheet
+
+    def read(self):
+        """The local copy, or None"""
+        if not os.path.exists(self.path):
+            return None
+        return pd.read_pickle(self.path)
+
+    def write(self, df):
+        tmp = self.path + '.tmp'
+        df.to_pickle(tmp)
+        os.replace(tmp, self.path)
+
+    def fetch(self, ws, header, start):
+        """Typed rows start (1-based sheet row) to the end of the sheet"""
+        with telemetry.section('gsheet.fetch') as section:
+            values = ws.get('A{}:{}'.format(start, column_letter(len(header))))
+            self.fetched_rows += len(values)
+            section.add(rows=len(values), bytes_in=sum(len(cell) for row in values for cell in row))
+            return section.output(typed_sheet(values, header))
+
+    @telemetry.timed('gsheet.sync')
+    def sync(self):
+        """Brings the local copy up to date and returns it"""
+        try:
+            ws = self.worksheet()
+            header = ws.row_values(1)
+            local = self.read()
+            if local is not None and list(local.columns) == header:
+                keep = max(len(local) - self.overlap, 0)
+                tail = self.fetch(ws, header, keep + 2)
+                if keep + len(tail) >= len(local) and (local.dtypes == tail.dtypes).all():
+                    df = pd.concat([local.iloc[:keep], tail], ignore_index=True)
+                    self.write(df)
+                    return df
+            df = self.fetch(ws, header, 2)
+        except Exception:
+            # Authorize again next time, the token may have expired
+            self._worksheet = None
+            if self._authorized:
+                self.client = None
+            raise
+        self.write(df)
+        return df
+
+
+def load_gsheet():
+    """
+    The dashboard's sheet from the local copy synced by sheet_sync, cached
+    for all sessions and refreshed every 10 min.
+    """
+    return dataset_cache.get(('gsheet', SPREADSHEET_ID, None), sheet_sync.sync, ttl=600)
+
+
+def format_gsheet(gs_df):
+    """Copy of the sheet indexed by date, with empty cells as NaN"""
+    df = gs_df.copy()
+    df.Date = pd.to_datetime(df.Date)
+    df.set_index('Date', inplace=True)
+    df.replace("", np.nan, inplace=True)
+    return df
+
+
+def active_cases(sheet, per_100k=False):
+    """Active cases in Montana and Missoula from a formatted sheet"""
+    active_df = sheet[['Active infected', 'Active Missoula']]
+    active_df.columns = ['Montana', 'Missoula']
+    active_df = active_df.dropna(axis=0, how='all').apply(pd.to_numeric)
+    if per_100k:
+        active_df = 100000*active_df/population('Montana')[active_df.columns]
+    return active_df
+
+
+def tests_completed(sheet):
+    """Daily tests completed in Montana from a formatted sheet"""
+    return pd.to_numeric(sheet['Tests completed']).to_frame('Tests Completed')
+
+
+def cdc_indicators(sheet):
+    """Latest CDC school indicators for Missoula from a formatted sheet"""
+    return pd.DataFrame({
+        '14day New Cases': [float(sheet['Missoula New Cases'].iloc[-1])],
+        '14day % Change': [float(sheet['Missoula % Change'].iloc[-1])],
+        '7day Pos. Rate': [float(sheet['Missoula Positivity Rate'].iloc[-1])],
+        'Hosp. % Full': [float(sheet['Missoula Hosp. % Full'].iloc[-1])],
+        'Hosp. % COV19': [float(sheet['Missoula Cov. Hosp. %'].iloc[-1])]
+    })
+
+
+sheet_sync = SheetSync()
@@ -0,0 +1,82 @@
+"""
+CDC indicators for transmission of COVID-19 in schools.
+
+The thresholds are declared once in CDC_THRESHOLDS and every indicator is
+computed and colored for all locations at once with NumPy, so the same
+code produces the one-row Missoula table on the dashboard or a table for
+every county in the country.
+
+See https://www.cdc.gov/coronavirus/2019-ncov/community/schools-childcare/indicators.html#thresholds
+"""
+
+import numpy as np
+import pandas as pd
+
+from libs.metrics import MAX_LAG, RollingMetrics, align
+
+# Upper bound (inclusive) of every band but the last, lowest risk first
+CDC_THRESHOLDS = {
+    '14day New Cases': [5, 20, 50, 200],
+    '14day % Change': [-10, -5, 0, 10],
+    '7day Pos. Rate': [3, 5, 8, 10],
+    'Hosp. % Full': [75, 80, 90, 95],
+    'Hosp. % COV19': [5, 10, 15, 20],
+}
+CDC_COLORS = ['DarkGreen', 'YellowGreen', 'Yellow', 'DarkOrange', 'Red']
+
+
+def indicator_levels(df, thresholds=CDC_THRESHOLDS):
+    """
+    Risk level (0 = lowest) of every indicator cell, -1 where the value is missing.
+
+    Equivalent to np.digitize(..., right=True) on each column, done for all
+    columns in a single broadcast.
+    """
+    columns = [c for c in df.columns if c in thresholds]
+    values = df[columns].values.astype(float)
+    bounds = np.array([thresholds[c] for c in columns], dtype=float)
+    levels = (values[:, :, None] > bounds[None, :, :]).sum(axis=2)
+    levels[np.isnan(values)] = -1
+    return pd.DataFrame(levels, index=df.index, columns=columns)
+
+
+def add_color_style(df, thresholds=CDC_THRESHOLDS, colors=CDC_COLORS):
+    """
+    Adds color to CDC indicator table.
+
+    Use with df.style.apply(add_color_style, axis=None); columns without
+    thresholds are left unstyled.
+    """
+    styles = np.array(['background-color: ' + c for c in colors] + [''])
+    levels = indicator_levels(df, thresholds)
+    css = pd.DataFrame('', index=df.index, columns=df.columns)
+    css[levels.columns] = styles[levels.values]
+    return css
+
+
+def case_indicators(cumulative, population):
+    """
+    14-day new cases per 100k and week-over-week % change for every location.
+
+    cumulative is a date x location frame of cumulative cases (e.g. a
+    StatePivots.frame), population a Series indexed by location. Locations
+    without a population get NaN for the per 100k value.
+    """
+    metrics = RollingMetrics.from_frame(cumulative.iloc[-(MAX_LAG + 1):], population)
+    table = metrics.latest(['14day per 100k', '14day % Change'])
+    return table.rename(columns={'14day per 100k': '14day New Cases'})
+
+
+def state_indicator_table(pivots, population, extra=None):
+    """
+    CDC indicator table for every county in a state plus the state itself.
+
+    population is the state's population(). extra is an optional frame of
+    indicators we only get from other sources (positivity, hospital load),
+    indexed by location.
+    """
+    cumulative = pivots.frame('cumulative', pivots.counties)
+    table = case_indicators(cumulative, align(population, cumulative.columns))
+    if extra is not None:
+        table = table.join(extra, how='left')
+    return table
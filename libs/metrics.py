@@ -0,0 +1,235 @@
+"""
+Rolling case metrics for many locations at once.
+
+Every metric is a difference of the cumulative case matrix at two lags
+(the prefix sum trick: the sum of daily cases over the last w days is
+C[t] - C[t - w]), so each is one vectorized subtraction over all dates and
+locations, with no per-window loop. RollingMetrics keeps the last
+MAX_LAG rows of cumulative cases, so appending a day only computes that
+day's row.
+
+Populations come from POPULATION_PATH (state, level, location, population;
+level is 'state' on a state's own total and 'county' on its counties), the
+Census Bureau's 2019 estimates. write_population() regenerates it, with every county, from the
+Census county estimates csv (CENSUS_COUNTIES).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+POPULATION_PATH = './data/population.csv'
+CENSUS_COUNTIES = (
+    'https://www2.census.gov/programs-surveys/popest/datasets/2010-2019/'
+    'counties/totals/co-est2019-alldata.csv'
+)
+# Census county name suffixes the NYT feeds leave out
+COUNTY_SUFFIXES = r' (County|Parish|Borough|Census Area|City and Borough|Municipality)$'
+# The NYT reports the five boroughs as one location
+NYC_COUNTIES = ['New York', 'Kings', 'Queens', 'Bronx', 'Richmond']
+
+# Days per window, the 14-day metrics use two
+WINDOW = 7
+MAX_LAG = 2 * WINDOW
+METRICS = [
+    'new', '7day New Cases', '14day New Cases', '7day per 100k', '14day per 100k',
+    '14day % Change', 'doubling',
+]
+
+
+def read_population(path=POPULATION_PATH):
+    return pd.read_csv(path, dtype={'population': float})
+
+
+def population(state, path=POPULATION_PATH):
+    """
+    Population of a state and its counties, indexed by location, with the
+    state total first.
+
+    A county can share its state's name (Arkansas County, Arkansas), so
+    like the columns of a StatePivots frame the state is told apart by its
+    position; see align().
+    """
+    table = read_population(path)
+    table = table[table['state'] == state]
+    table = pd.concat([table[table['level'] == 'state'], table[table['level'] == 'county']])
+    return table.set_index('location')['population']
+
+
+def align(population, locations):
+    """
+    Populations (as population() returns them) of locations, a state
+    followed by some of its counties like the columns of a StatePivots
+    frame. NaN where unknown.
+    """
+    locations = list(locations)
+    counties = population.iloc[1:]
+    values = counties.reindex(locations[1:]).tolist()
+    total = population.iloc[0] if len(population) else np.nan
+    return pd.Series([total] + values, index=locations, dtype=float)
+
+
+def census_population(url=CENSUS_COUNTIES):
+    """
+    (state, level, location, population) of every state and county in the
+    Census county estimates csv, with county names spelled as in the NYT
+    feeds.
+    """
+    raw = pd.read_csv(
+        url, encoding='latin-1', usecols=['SUMLEV', 'STNAME', 'CTYNAME', 'POPESTIMATE2019']
+    )
+    raw = raw.rename(columns={'STNAME': 'state', 'CTYNAME': 'location', 'POPESTIMATE2019': 'population'})
+    counties = raw['SUMLEV'] == 50
+    raw['level'] = np.where(counties, 'county', 'state')
+    raw.loc[counties, 'location'] = raw.loc[counties, 'location'].str.replace(COUNTY_SUFFIXES, '', regex=True)
+    nyc = counties & (raw['state'] == 'New York') & raw['location'].isin(NYC_COUNTIES)
+    table = pd.concat([
+        raw.loc[~nyc, ['state', 'level', 'location', 'population']],
+        pd.DataFrame({
+            'state': ['New York'], 'level': ['county'], 'location': ['New York City'],
+            'population': [raw.loc[nyc, 'population'].sum()]
+        }),
+    ])
+    return table.sort_values(['state', 'level', 'location'], ascending=[True, False, True]).reset_index(drop=True)
+
+
+def write_population(path=POPULATION_PATH, url=CENSUS_COUNTIES):
+    """
+    Rewrites POPULATION_PATH from the Census csv, keeping rows of places it
+    doesn't cover.
+    """
+    table = census_population(url)
+    if os.path.exists(path):
+        old = read_population(path)
+        key = ['state', 'level', 'location']
+        keep = ~old.set_index(key).index.isin(table.set_index(key).index)
+        table = pd.concat([table, old[keep]]).sort_values(key, ascending=[True, False, True])
+    table['population'] = table['population'].astype(int)
+    table.to_csv(path, index=False)
+    return table
+
+
+def lagged(history, rows, lag):
+    """The rows of history lag rows before each of the last rows rows, NaN before the start"""
+    size = len(history)
+    out = np.full((rows, history.shape[1]), np.nan)
+    start = size - rows - lag
+    if size <= lag:
+        return out
+    if start < 0:
+        out[-start:] = history[:size - lag]
+    else:
+        out[:] = history[start:size - lag]
+    return out
+
+
+def window_metrics(history, rows, pop):
+    """
+    Metrics for the last rows rows of history, a days x locations matrix of
+    cumulative cases with one row per day. pop has one population per
+    location (NaN where unknown).
+    """
+    today = history[-rows:]
+    week_ago = lagged(history, rows, WINDOW)
+    fortnight_ago = lagged(history, rows, MAX_LAG)
+    last_week = today - week_ago
+    prev_week = week_ago - fortnight_ago
+    with np.errstate(divide='ignore', invalid='ignore'):
+        new = today - lagged(history, rows, 1)
+        change = 100 * (last_week - prev_week) / prev_week
+        # Days for cases to double at the last week's growth rate
+        doubling = WINDOW * np.log(2) / np.log(today / week_ago)
+        metrics = {
+            'new': np.where(new < 0, 0, new),
+            '7day New Cases': last_week,
+            '14day New Cases': today - fortnight_ago,
+            '7day per 100k': 100000 * last_week / pop,
+            '14day per 100k': 100000 * (today - fortnight_ago) / pop,
+            '14day % Change': change,
+            'doubling': doubling,
+        }
+        change[~np.isfinite(change)] = np.nan
+        # No growth (or fewer cases) never doubles
+        doubling[~np.isfinite(doubling) | (doubling < 0)] = np.nan
+    return metrics
+
+
+class RollingMetrics(object):
+    """
+    Rolling metrics of a date x location matrix of cumulative cases.
+
+    Rows must be consecutive days. extend() appends days and computes only
+    their metrics; frame() returns one metric for every day so far.
+    """
+
+    def __init__(self, locations, population=None):
+        self.locations = list(locations)
+        if population is None:
+            self.pop = np.full(len(self.locations), np.nan)
+        elif list(population.index) == self.locations:
+            # Already aligned, maybe with a county named like its state
+            self.pop = population.values.astype(float)
+        else:
+            self.pop = population.reindex(self.locations).values.astype(float)
+        self.size = 0
+        self.history = np.empty((0, len(self.locations)))
+        self.grow(0)
+
+    def grow(self, capacity):
+        """Reallocates the metric buffers to hold capacity days"""
+        days = np.empty(capacity, dtype='datetime64[D]')
+        values = np.empty((len(METRICS), capacity, len(self.locations)))
+        if self.size:
+            days[:self.size] = self._days[:self.size]
+            values[:, :self.size] = self._values[:, :self.size]
+        self._days, self._values = days, values
+
+    @classmethod
+    def from_frame(cls, cumulative, population=None):
+        metrics = cls(cumulative.columns, population)
+        metrics.extend(cumulative.index, cumulative.values)
+        return metrics
+
+    def extend(self, dates, cumulative):
+        """Appends rows of cumulative cases for the days after the last one"""
+        cumulative = np.atleast_2d(np.asarray(cumulative, dtype=float))
+        rows = len(cumulative)
+        if not rows:
+            return
+        if self.size + rows > len(self._days):
+            self.grow(max(2 * len(self._days), self.size + rows))
+        history = np.vstack([self.history, cumulative])
+        new = window_metrics(history, rows, self.pop)
+        end = self.size + rows
+        for i, name in enumerate(METRICS):
+            self._values[i, self.size:end] = new[name]
+        self._days[self.size:end] = pd.DatetimeIndex(dates).values.astype('datetime64[D]')
+        self.history = history[-MAX_LAG:]
+        self.size = end
+
+    def append(self, date, cumulative):
+        """Appends one day"""
+        self.extend([date], [cumulative])
+
+    @property
+    def days(self):
+        return self._days[:self.size]
+
+    def values(self, name):
+        """days x locations matrix of one metric (a view, don't modify)"""
+        return self._values[METRICS.index(name), :self.size]
+
+    def frame(self, name):
+        return pd.DataFrame(
+            self.values(name),
+            index=pd.DatetimeIndex(self.days, name='date'),
+            columns=self.locations
+        )
+
+    def latest(self, names=METRICS):
+        """The last day's metrics, one row per location"""
+        return pd.DataFrame(
+            {name: self.values(name)[-1] for name in names},
+            index=pd.Index(self.locations, name='location')
+        )
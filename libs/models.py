@@ -0,0 +1,276 @@
+"""
+Compartment models and the fitting pipeline they share.
+
+A model is declared once: its compartments, its parameters (starting
+point and bounds) and its flows, the rate of every transition between two
+compartments. The right-hand side is the stoichiometry matrix times the
+flow rates, so every model is integrated by the same batched RK4 stepper:
+one call advances K parameter sets at once, and the Python work per step
+depends on the number of flows, not on the number of compartments or
+trajectories.
+
+fit() estimates the free parameters of any registered model against the
+observed columns it maps to compartments (cases to I, and deaths to D for
+SIRD). It works on the log of the parameters, since beta (a rate per
+person) is orders of magnitude smaller than the per-day rates, and each
+objective evaluation simulates the point and its central finite-difference
+neighbours as one batch, so the gradient costs one RK4 pass too.
+"""
+
+import numpy as np
+import pandas as pd
+
+STEPS_PER_DAY = 4
+FD_STEP = 1e-6  # in log parameter space, so relative
+# Loss of parameters whose trajectories blow up, so the line search backs off
+DIVERGED = 1e12
+# Multiples of the default starting point fit() scans, in one batch, when
+# it isn't given one
+SCAN_FACTORS = [0.1, 0.3, 1, 3, 10]
+
+NAMES = {
+    'S': 'Susceptible', 'E': 'Exposed', 'I': 'Infectious', 'R': 'Recovered', 'D': 'Dead'
+}
+
+
+class Param(object):
+    """A model parameter with its default starting point and bounds"""
+
+    def __init__(self, name, x0, bounds):
+        self.name = name
+        self.x0 = x0
+        self.bounds = bounds
+
+
+class CompartmentModel(object):
+    """
+    flows(y, p) returns the rate of every transition for states y of shape
+    (compartments, K) and parameters p of shape (params, K); transitions
+    lists the (from, to) compartment of each flow, None for outside the
+    population. observed maps data columns to the compartment fit to them.
+    """
+
+    def __init__(self, name, compartments, params, flows, transitions, observed):
+        self.name = name
+        self.compartments = list(compartments)
+        self.params = list(params)
+        self.flows = flows
+        self.observed = observed
+        self.stoichiometry = np.zeros((len(self.compartments), len(transitions)))
+        for f, (source, target) in enumerate(transitions):
+            if source is not None:
+                self.stoichiometry[self.compartments.index(source), f] -= 1
+            if target is not None:
+                self.stoichiometry[self.compartments.index(target), f] += 1
+
+    @property
+    def param_names(self):
+        return [p.name for p in self.params]
+
+    def rhs(self, y, p):
+        return self.stoichiometry.dot(np.array(self.flows(y, p)))
+
+    def initial(self, N, i_0, r_0=0, **others):
+        """Starting compartments: i_0 infectious, r_0 recovered, others by name, the rest susceptible"""
+        y0 = dict(others, I=i_0, R=r_0)
+        y0 = [float(y0.get(c, 0)) for c in self.compartments]
+        y0[self.compartments.index('S')] = N - sum(y0)
+        return np.array(y0)
+
+    def simulate(self, theta, y0, days, steps_per_day=STEPS_PER_DAY):
+        """
+        Integrates K trajectories with fixed-step RK4.
+
+        theta has shape (params, K) and y0 shape (compartments,) or
+        (compartments, K). Returns an array of shape (K, days, compartments)
+        with the compartments on days 0..days-1.
+        """
+        theta = np.asarray(theta, dtype=float)
+        if theta.ndim == 1:
+            theta = theta[:, None]
+        y = np.asarray(y0, dtype=float)
+        y = np.broadcast_to(y if y.ndim == 2 else y[:, None], (len(self.compartments), theta.shape[1]))
+        h = 1.0 / steps_per_day
+        out = np.empty((days,) + y.shape)
+        out[0] = y
+        for day in range(1, days):
+            for _ in range(steps_per_day):
+                k1 = self.rhs(y, theta)
+                k2 = self.rhs(y + 0.5*h*k1, theta)
+                k3 = self.rhs(y + 0.5*h*k2, theta)
+                k4 = self.rhs(y + h*k3, theta)
+                y = y + h/6*(k1 + 2*k2 + 2*k3 + k4)
+            out[day] = y
+        return np.ascontiguousarray(out.transpose(2, 0, 1))
+
+    def loss(self, theta, y0, targets, steps_per_day=STEPS_PER_DAY):
+        """
+        Sum over the observed columns in targets of the RMSE between the
+        column and its compartment, one value per parameter set in theta.
+        Days missing from a column are skipped; a trajectory that blows up
+        gets a NaN loss.
+        """
+        trajectories = self.simulate(theta, y0, len(targets), steps_per_day)
+        total = np.zeros(trajectories.shape[0])
+        for column, compartment in self.observed.items():
+            if column in targets:
+                observed = np.asarray(targets[column].values, dtype=float)
+                days = np.isfinite(observed)
+                resid = trajectories[:, days, self.compartments.index(compartment)] - observed[days]
+                total += np.sqrt(np.mean(resid**2, axis=1))
+        return total
+
+
+def sir_flows(y, p):
+    S, I, R = y
+    beta, gamma = p
+    return [beta*S*I, gamma*I]
+
+
+def seir_flows(y, p):
+    S, E, I, R = y
+    beta, sigma, gamma = p
+    return [beta*S*I, sigma*E, gamma*I]
+
+
+def sird_flows(y, p):
+    S, I, R, D = y
+    beta, gamma, mu = p
+    return [beta*S*I, gamma*I, mu*I]
+
+
+MODELS = {}
+
+
+def register(model):
+    MODELS[model.name] = model
+    return model
+
+
+register(CompartmentModel(
+    'sir', 'SIR',
+    [Param('beta', 0.001, (1e-8, 0.5)), Param('gamma', 0.2, (1e-8, 0.5))],
+    sir_flows, [('S', 'I'), ('I', 'R')], {'cases': 'I'}
+))
+register(CompartmentModel(
+    'seir', 'SEIR',
+    [Param('beta', 0.001, (1e-8, 0.5)), Param('sigma', 0.2, (1e-8, 1.0)),
+     Param('gamma', 0.2, (1e-8, 0.5))],
+    seir_flows, [('S', 'E'), ('E', 'I'), ('I', 'R')], {'cases': 'I'}
+))
+register(CompartmentModel(
+    'sird', 'SIRD',
+    [Param('beta', 0.001, (1e-8, 0.5)), Param('gamma', 0.2, (1e-8, 0.5)),
+     Param('mu', 0.01, (1e-8, 0.5))],
+    sird_flows, [('S', 'I'), ('I', 'R'), ('I', 'D')], {'cases': 'I', 'deaths': 'D'}
+))
+
+
+def get_model(model):
+    """The registered model called model (or model itself if it is one)"""
+    if isinstance(model, CompartmentModel):
+        return model
+    if model not in MODELS:
+        raise ValueError('unknown model {!r}, expected one of {}'.format(model, sorted(MODELS)))
+    return MODELS[model]
+
+
+def initial_state(model, targets, N, i_0, r_0=0):
+    """Starting compartments, with D starting at the first observed deaths"""
+    others = {}
+    if 'D' in model.compartments and 'deaths' in targets:
+        others['D'] = np.nan_to_num(float(targets['deaths'].iloc[0]))
+    return model.initial(N, i_0, r_0, **others)
+
+
+def latin_hypercube(n, bounds, random, log=True):
+    """
+    n points (one per row) with every parameter's range cut into n equal
+    bins, each holding one point. Bins are equal in log space if log, so
+    bounds spanning orders of magnitude are covered evenly.
+    """
+    low, high = np.array(bounds, dtype=float).T
+    if log:
+        low, high = np.log(low), np.log(high)
+    u = (random.rand(n, len(low)) + np.arange(n)[:, None]) / n
+    for j in range(len(low)):
+        u[:, j] = u[random.permutation(n), j]
+    points = low + u * (high - low)
+    return np.exp(points) if log else points
+
+
+def scan_start(model, base, free, y0, targets, steps_per_day=STEPS_PER_DAY):
+    """
+    The best of every combination of SCAN_FACTORS times the default of each
+    free parameter (clipped to its bounds), evaluated as one batch.
+    """
+    grids = np.meshgrid(*[SCAN_FACTORS] * len(free), indexing='ij')
+    theta = np.repeat(base[:, None], grids[0].size if free else 1, axis=1)
+    for j, i in enumerate(free):
+        low, high = model.params[i].bounds
+        theta[i] = np.clip(base[i] * grids[j].ravel(), low, high)
+    with np.errstate(over='ignore', invalid='ignore'):
+        values = model.loss(theta, y0, targets, steps_per_day)
+    values[~np.isfinite(values)] = np.inf
+    return theta[free, np.argmin(values)]
+
+
+def fit(model, targets, N, i_0, r_0=0, x0=None, fixed=None, steps_per_day=STEPS_PER_DAY):
+    """
+    Fits a model's free parameters to targets with L-BFGS-B.
+
+    targets is a frame of consecutive days with the model's observed
+    columns (cases, and deaths for SIRD). fixed maps parameter names to
+    values held constant; x0 is the starting point of the free ones
+    (default: the best of a scan around the model's defaults).
+    Returns (params, result): every parameter by name and scipy's
+    OptimizeResult.
+    """
+    from scipy.optimize import minimize
+    model = get_model(model)
+    fixed = fixed or {}
+    base = np.array([fixed.get(p.name, p.x0) for p in model.params], dtype=float)
+    free = [i for i, p in enumerate(model.params) if p.name not in fixed]
+    y0 = initial_state(model, targets, N, i_0, r_0)
+    if x0 is None:
+        x0 = scan_start(model, base, free, y0, targets, steps_per_day)
+
+    def objective(x):
+        # Column 0 is x, then x +/- step along every free parameter
+        log_theta = np.repeat(np.log(base)[:, None], 1 + 2*len(free), axis=1)
+        log_theta[free, :] = x[:, None]
+        for j, i in enumerate(free):
+            log_theta[i, 1 + 2*j] += FD_STEP
+            log_theta[i, 2 + 2*j] -= FD_STEP
+        with np.errstate(over='ignore', invalid='ignore'):
+            values = model.loss(np.exp(log_theta), y0, targets, steps_per_day)
+        if not np.isfinite(values).all():
+            return DIVERGED, np.zeros(len(free))
+        return values[0], (values[1::2] - values[2::2]) / (2*FD_STEP)
+
+    result = minimize(
+        objective,
+        np.log(np.asarray(x0, dtype=float)),
+        method='L-BFGS-B',
+        jac=True,
+        bounds=[np.log(model.params[i].bounds) for i in free]
+    )
+    point = base.copy()
+    point[free] = np.exp(result.x)
+    return dict(zip(model.param_names, point)), result
+
+
+def forecast(model, params, targets, N, i_0, r_0=0, predict_range=120, steps_per_day=STEPS_PER_DAY):
+    """
+    Observed cases and every compartment, daily from the first target date
+    over at least predict_range days.
+    """
+    model = get_model(model)
+    days = max(predict_range, len(targets))
+    index = pd.date_range(targets.index[0], periods=days, freq='D')
+    theta = np.array([params[name] for name in model.param_names])
+    trajectory = model.simulate(theta, initial_state(model, targets, N, i_0, r_0), days, steps_per_day)[0]
+    df = pd.DataFrame({'Actual': targets['cases'].reindex(index)}, index=index)
+    for c, compartment in enumerate(model.compartments):
+        df[NAMES[compartment]] = trajectory[:, c]
+    return df
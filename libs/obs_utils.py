@@ -1,153 +1,119 @@
 import pandas as pd
 import numpy as np
+from libs.snapshot import FeedSnapshot
+from libs.cache import dataset_cache
+from libs.indicators import add_color_style
+from libs.fetch import Source
+from libs.reconcile import reconcile
+from libs.series import CaseSeries
+from libs.telemetry import telemetry
 
 nyt_county = 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv'
 nyt_state = 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-states.csv'
+# usa_facts and mt_data are kept for reference, no loader reads them (the
+# MSL numbers come from nls_mt_data, see cov_update.py)
 usa_facts = 'https://usafactsstatic.blob.core.windows.net/public/data/covid-19/covid_confirmed_usafacts.csv'
 mt_data = 'https://www.arcgis.com/sharing/rest/content/items/0d47920e54e0420cb604213acc8761d5/data'
 nls_mt_data = './data/mt_covid19_update.csv'
 
-class CountyCovidData(object):
+# Local snapshots of the NYT feeds, refreshed at most once an hour by parsing
+# only the rows appended since the last refresh
+nyt_county_snapshot = FeedSnapshot('nyt_county', nyt_county, incremental=True)
+nyt_state_snapshot = FeedSnapshot('nyt_state', nyt_state, incremental=True)
+
+class CovidData(object):
     """
-    Merges NYT county data with updated MSL data and returns dataframe
+    NYT data for one state, reconciled with the MSL updates for Montana.
+
+    cov_update() returns a CaseSeries (see libs/series.py). Subclasses pick
+    the NYT snapshot, its location column and the MSL columns they merge in.
     """
+    snapshot = None
+    location_column = None
+    msl_locations = []
+    msl_state = 'Montana'
 
     def __init__(self, state='Montana'):
-        self.state=state
+        self.state = state
 
+    @telemetry.timed('obs.nyt_data')
     def get_nyt_data(self):
-        datatypes = {
-            'date': 'str',
-            'county': 'str',
-            'state': 'str',
-            'fips': 'Int64',
-            'cases': 'float',
-            'deaths': 'float'
-                }
-
-        nyt_data = pd.read_csv(nyt_county, dtype=datatypes, parse_dates=[0])
-        nyt_data.set_index('date',  inplace=True)
-        nyt_data = nyt_data[nyt_data['state'] == self.state]
-        nyt_data['source'] = np.repeat('nyt', len(nyt_data)) 
+        nyt_data = self.snapshot.read(self.state)
+        nyt_data['source'] = pd.Categorical.from_codes(np.zeros(len(nyt_data), dtype=np.int8), ['nyt'])
         return nyt_data
-    
+
+    @telemetry.timed('obs.msl_data')
     def get_msl_data(self):
-        mt_data = pd.read_csv("./data/mt_covid19_update.csv")
+        mt_data = pd.read_csv(nls_mt_data)
         mt_data.set_index('date', inplace=True)
-        locations = ['Missoula', 'Gallatin', 'Yellowstone', 'Lewis and Clark']
         mt_data['date'] = pd.to_datetime(mt_data.index)
         mt_melt = pd.melt(
             mt_data, 
             id_vars='date', 
-            value_vars=locations, 
+            value_vars=self.msl_locations, 
             value_name='cases', 
-            var_name='county'
+            var_name=self.location_column
             )
-        mt_melt['source'] = np.repeat('msl', len(mt_melt))
+        mt_melt['source'] = pd.Categorical.from_codes(np.zeros(len(mt_melt), dtype=np.int8), ['msl'])
         mt_melt.set_index('date', inplace=True)
         return mt_melt
-    
+
+    @telemetry.timed('obs.reconcile')
     def merge_data(self, nyt_data, msl_data):
-        
-        df_full = pd.merge(
-            nyt_data, 
-            msl_data, 
-            how='outer',
-            on=['county', 'cases', 'source'],
-            right_index=True,
-            left_index=True 
-            )
-        df_full = df_full[['county', 'cases', 'deaths', 'source']]
-        df_full.ffill(axis=0, inplace=True)
-        df_full.bfill(axis=0, inplace=True)
-        df_full.rename(columns={'county':'location'}, inplace=True)
-        df_full = df_full.groupby([df_full.index, 'location']).first().reset_index(['location'])
-        return df_full
+        frames = [
+            df.rename(columns={self.location_column: 'location'}) for df in [nyt_data, msl_data]
+        ]
+        return reconcile(frames)
 
+    @telemetry.timed('obs.cov_update')
     def cov_update(self, update=True):
 
         nyt_data = self.get_nyt_data()
-        if update:
+        if update and self.state == self.msl_state:
             msl_data = self.get_msl_data()
-            full_data = self.merge_data(nyt_data, msl_data)
-        else:
-            full_data = nyt_data.copy()
-            full_data = full_data[['county', 'cases', 'deaths', 'source']]
-            full_data.rename(columns={'county':'location'}, inplace=True)
-        return full_data
+            return CaseSeries.from_frame(self.merge_data(nyt_data, msl_data))
+        return CaseSeries.from_frame(nyt_data, self.location_column)
 
-class StateCovidData(object):
+class CountyCovidData(CovidData):
     """
-    Merges NYT state data with updated MSL data and returns dataframe
+    Merges NYT county data with updated MSL data and returns dataframe
     """
-    def __init__(self, state='Montana'):
-        self.state = state
-
-    def get_nyt_data(self):
-
-        datatypes = {
-            'date': 'str',
-            'county': 'str',
-            'state': 'str',
-            'fips': 'Int64',
-            'cases': 'float',
-            'deaths': 'float'
-                }
-
-        nyt_data = pd.read_csv(nyt_state, dtype=datatypes, parse_dates=[0])
-        nyt_data.set_index('date',  inplace=True)
-        nyt_data = nyt_data[nyt_data['state'] == self.state]
-        nyt_data['source'] = np.repeat('nyt', len(nyt_data)) 
-        return nyt_data
-
-    def get_msl_data(self):
-        mt_data = pd.read_csv("./data/mt_covid19_update.csv")
-        mt_data.set_index('date', inplace=True)
-        locations = ['Montana']
-        mt_data['date'] = pd.to_datetime(mt_data.index)
-        mt_melt = pd.melt(
-            mt_data, 
-            id_vars='date', 
-            value_vars=locations, 
-            value_name='cases', 
-            var_name='state'
-            )
-        mt_melt['source'] = np.repeat('msl', len(mt_melt))
-        mt_melt.set_index('date', inplace=True)
-        return mt_melt
+    snapshot = nyt_county_snapshot
+    location_column = 'county'
+    msl_locations = ['Missoula', 'Gallatin', 'Yellowstone', 'Lewis and Clark']
 
-    def merge_data(self, nyt_data, msl_data):
-        df_full = pd.merge(
-            nyt_data, 
-            msl_data, 
-            how='outer',
-            on=['state', 'cases', 'source'],
-            right_index=True,
-            left_index=True 
-            )
-        df_full = df_full[['state', 'cases', 'deaths', 'source']]
-        df_full.ffill(axis=0, inplace=True)
-        df_full.bfill(axis=0, inplace=True)
-        df_full.rename(columns={'state':'location'}, inplace=True)
-        return df_full
+class StateCovidData(CovidData):
+    """
+    Merges NYT state data with updated MSL data and returns dataframe
+    """
+    snapshot = nyt_state_snapshot
+    location_column = 'state'
+    msl_locations = ['Montana']
 
-    def cov_update(self, update=True):
 
-        nyt_data = self.get_nyt_data()
-        if update:
-            msl_data = self.get_msl_data()
-            full_data = self.merge_data(nyt_data, msl_data)
-        else:
-            full_data = nyt_data.copy()
-            full_data = full_data[['state', 'cases', 'deaths', 'source']]
-            full_data.rename(columns={'state':'location'}, inplace=True)
-        return full_data
+def upstream_sources(timeout=300):
+    """
+    The NYT snapshot refreshes as fetch_all sources, so app.py can run them
+    concurrently with its other startup fetches.
+    """
+    return [
+        Source('nyt_state', loader=nyt_state_snapshot.ensure_fresh, timeout=timeout),
+        Source('nyt_county', loader=nyt_county_snapshot.ensure_fresh, timeout=timeout),
+    ]
 
-    
+@telemetry.timed('obs.load_dataset')
+def load_dataset(source, state='Montana', update=True):
+    """
+    Cached cov_update() results shared across sessions, keyed by (source, state, update).
 
-    
-    
-StateCovidData().cov_update()
+    source is 'state' or 'county'. The returned CaseSeries is shared, so copy
+    its arrays before modifying them in place.
+    """
+    loaders = {'state': StateCovidData, 'county': CountyCovidData}
+    return dataset_cache.get(
+        (source, state, update),
+        lambda: loaders[source](state=state).cov_update(update=update)
+    )
 
 class CovidTrends(object):
     
@@ -159,19 +125,8 @@ class CovidTrends(object):
             self.county_name = self.state_df[self.state_df['fips'] == self.county]['county'][0]
 
     def get_nyt_state_data(self):
-
-        datatypes = {
-            'date': 'str',
-            'state': 'str',
-            'fips': 'Int64',
-            'cases': 'Int64',
-            'deaths': 'Int64'
-        }
-
-        nyt_df = pd.read_csv(nyt_county, dtype=datatypes, parse_dates=[0])
-        nyt_df.set_index('date',  inplace=True)
-
-        return nyt_df[nyt_df['state'] == self.state]
+        nyt_df = nyt_county_snapshot.read(self.state)
+        return nyt_df.astype({'cases': 'Int64', 'deaths': 'Int64'})
 
     def select_county_data(self):
         county_df_all = self.state_df[self.state_df['fips'] == self.county]
@@ -181,9 +136,8 @@ class CovidTrends(object):
 
     def fill_mt_state_data(self, state_df_grp):
         nls_df = pd.read_csv(nls_mt_data, parse_dates=[0], index_col=['date'])
-        state_fill_df = pd.merge(state_df_grp, nls_df['Montana'], how='outer', 
-            left_index=True, right_index=True)
-        return state_fill_df[self.state].fillna(nls_df['Montana']).to_frame()
+        # Both columns are called Montana, so a merge would suffix them
+        return state_df_grp[self.state].combine_first(nls_df['Montana']).to_frame()
   
     def fill_county_data(self, county_df):
         nls_df = pd.read_csv(nls_mt_data, parse_dates=[0], index_col=['date'])
@@ -193,7 +147,7 @@ class CovidTrends(object):
 
     def get_covid_data(self):
 
-        state_df_grp = self.state_df.groupby('date').sum()[['cases']]
+        state_df_grp = self.state_df.groupby('date')['cases'].sum().to_frame()
         state_df_grp.columns = [self.state]
 
         if self.state == 'Montana':
@@ -224,63 +178,3 @@ class CovidTrends(object):
         return df 
 
 # CovidTrends(county=30063).get_covid_data()
-
-def add_color_style(x):
-    """Adds color to CDC indicator table"""
-    
-    df = x.copy()
-    if df['14day New Cases'] > 200:
-        df['14day New Cases'] = 'background-color: Red'
-    elif (df['14day New Cases'] <= 200) & (df['14day New Cases'] > 50):
-        df['14day New Cases'] = 'background-color: DarkOrange'
-    elif (df['14day New Cases'] <= 50) & (df['14day New Cases'] > 20):
-        df['14day New Cases'] = 'background-color: Yellow'
-    elif (df['14day New Cases'] <= 20) & (df['14day New Cases'] > 5):
-        df['14day New Cases'] = 'background-color: YellowGreen'
-    elif (df['14day New Cases'] <= 5):
-        df['14day New Cases'] = 'background-color: DarkGreen'
-    
-    if df['14day % Change'] > 10:
-        df['14day % Change'] = 'background-color: Red'
-    elif (df['14day % Change'] <= 10) & (df['14day % Change'] > 0):
-        df['14day % Change'] = 'background-color: DarkOrange'
-    elif (df['14day % Change'] <= 0) & (df['14day % Change'] > -5):
-        df['14day % Change'] = 'background-color: Yellow'   
-    elif (df['14day % Change'] <= -5) & (df['14day % Change'] > -10):
-        df['14day % Change'] = 'background-color: YellowGreen'
-    elif (df['14day % Change'] <= -10):
-        df['14day % Change'] = 'background-color: DarkGreen'   
-
-    if df['7day Pos. Rate'] > 10:
-        df['7day Pos. Rate'] = 'background-color: Red'
-    elif (df['7day Pos. Rate'] <= 10) & (df['7day Pos. Rate'] > 8):
-        df['7day Pos. Rate'] = 'background-color: DarkOrange'
-    elif (df['7day Pos. Rate'] <= 8) & (df['7day Pos. Rate'] > 5):
-        df['7day Pos. Rate'] = 'background-color: Yellow'   
-    elif (df['7day Pos. Rate'] <= 5) & (df['7day Pos. Rate'] > 3):
-        df['7day Pos. Rate'] = 'background-color: YellowGreen'
-    elif (df['7day Pos. Rate'] <= 3):
-        df['7day Pos. Rate'] = 'background-color: DarkGreen'     
-
-    if df['Hosp. % Full'] > 95:
-        df['Hosp. % Full'] = 'background-color: Red'
-    elif (df['Hosp. % Full'] <= 95) & (df['Hosp. % Full'] > 90):
-        df['Hosp. % Full'] = 'background-color: DarkOrange'
-    elif (df['Hosp. % Full'] <= 90) & (df['Hosp. % Full'] > 80):
-        df['Hosp. % Full'] = 'background-color: Yellow'
-    elif (df['Hosp. % Full'] <= 80) & (df['Hosp. % Full'] > 75):
-        df['Hosp. % Full'] = 'background-color: YellowGreen'
-    elif (df['Hosp. % Full'] <= 75):
-        df['Hosp. % Full'] = 'background-color: DarkGreen'
-        
-    if df['Hosp. % COV19'] > 20:
-        df['Hosp. % COV19'] = 'background-color: Red'
-    elif (df['Hosp. % COV19'] <= 20) & (df['Hosp. % COV19'] > 15):
-        df['Hosp. % COV19'] = 'background-color: DarkOrange'
-    elif (df['Hosp. % COV19'] <= 15) & (df['Hosp. % COV19'] > 10):
-        df['Hosp. % COV19'] = 'background-color: Yellow'
-    elif (df['Hosp. % COV19'] <= 10) & (df['Hosp. % COV19'] > 5):
-        df['Hosp. % COV19'] = 'background-color: YellowGreen'
-    elif (df['Hosp. % COV19'] <= 5):
-        df['Hosp. % COV19'] = 'background-color: DarkGreen'
-    return df
@@ -0,0 +1,196 @@
+"""
+Precomputed date x location matrices for the state/county explorer.
+
+For every state we keep one wide matrix per variant (cumulative cases,
+daily new cases, doubling time at the last week's growth, see
+libs/metrics.py) with the state total in the first column and every
+county after it. The matrices are float32 .npy files that are
+memory-mapped on read, so a widget change in app.py is just a column slice.
+They are rebuilt whenever the NYT snapshots change.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from libs.obs_utils import (
+    CountyCovidData, StateCovidData, nyt_county_snapshot, nyt_state_snapshot
+)
+from libs.metrics import RollingMetrics
+from libs.snapshot import slugify
+from libs.telemetry import telemetry
+
+PIVOT_DIR = './data/pivots'
+VARIANTS = ['cumulative', 'daily', 'doubling']
+
+
+def data_token():
+    """Changes whenever either NYT snapshot is refreshed with new data"""
+    return '{}_{}'.format(nyt_state_snapshot.token(), nyt_county_snapshot.token())
+
+
+def wide_cases(data):
+    """Date x location matrix of cumulative cases from a CaseSeries, forward filled"""
+    return data.wide('cases').ffill()
+
+
+def build_variants(state_data, county_data):
+    """
+    Returns (dates, locations, {variant: float32 matrix}) for one state.
+
+    The first location is the state itself, followed by its counties in the
+    order they first appear in the data.
+    """
+    state_df = wide_cases(state_data)
+    county_df = wide_cases(county_data)
+    df = pd.merge(state_df, county_df, how='left', left_index=True, right_index=True)
+    metrics = RollingMetrics.from_frame(df)
+    variants = {
+        'cumulative': df.values.astype(np.float32),
+        'daily': metrics.values('new').astype(np.float32),
+        'doubling': metrics.values('doubling').astype(np.float32),
+    }
+    locations = list(state_df.columns) + list(county_df.columns)
+    return df.index, locations, variants
+
+
+def chart_frame(df, value_name, finite=False):
+    """
+    Melts a date x location frame into the long Date/Location/value layout
+    the altair charts take.
+
+    With finite=True, dates where any location is NaN or infinite are dropped.
+    """
+    if finite:
+        df = df[np.isfinite(df.values).all(axis=1)]
+    df = df.copy()
+    df['Date'] = df.index
+    return pd.melt(
+        df,
+        id_vars='Date',
+        value_vars=list(df.columns[:-1]),
+        value_name=value_name,
+        var_name='Location'
+    )
+
+
+def date_labels(df):
+    """Copy of df indexed by YYYY-MM-DD strings, for the raw data tables"""
+    return df.set_axis(df.index.strftime('%Y-%m-%d'), axis=0)
+
+
+class StatePivots(object):
+    """
+    Memory-mapped pivot matrices for one state.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.state = meta['state']
+        self.token = meta['token']
+        self.locations = meta['locations']
+        self.counties = self.locations[1:]
+        days = np.load(os.path.join(path, 'dates.npy'))
+        self.dates = pd.DatetimeIndex(days.astype('datetime64[D]'))
+        self.matrices = {
+            variant: np.load(os.path.join(path, variant + '.npy'), mmap_mode='r')
+            for variant in VARIANTS
+        }
+
+    def frame(self, variant, counties, start=None):
+        """
+        Slices the state column and the given counties out of one variant.
+
+        Rows start once any of the counties has data (like the inner merge
+        app.py used to do), and after start if given.
+        """
+        cols = [0] + [self.locations.index(c, 1) for c in counties]
+        cumulative = self.matrices['cumulative'][:, cols[1:]]
+        rows = ~np.all(np.isnan(cumulative), axis=1) if counties else np.ones(len(self.dates), bool)
+        if start is not None:
+            rows &= self.dates > start
+        values = self.matrices[variant][:, cols][rows]
+        return pd.DataFrame(
+            values,
+            index=pd.Index(self.dates[rows], name='date'),
+            columns=[self.state] + list(counties)
+        )
+
+
+class PivotStore(object):
+    """
+    Builds and serves StatePivots, one directory per data refresh.
+    """
+
+    def __init__(self, root=PIVOT_DIR):
+        self.root = root
+
+    def path(self, token, state):
+        return os.path.join(self.root, token, slugify(state))
+
+    @telemetry.timed('pivots.build', output=False)
+    def build(self, state, token):
+        """
+        Builds a state's pivots into a private temporary directory and
+        renames it into place; a build that finds them already published
+        for token keeps those.
+        """
+        state_data = StateCovidData(state=state).cov_update(update=False)
+        county_data = CountyCovidData(state=state).cov_update(update=False)
+        dates, locations, variants = build_variants(state_data, county_data)
+
+        path = self.path(token, state)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Private to this build, so concurrent builds of a state never share it
+        tmp = tempfile.mkdtemp(prefix='.{}-'.format(slugify(state)), dir=os.path.dirname(path))
+        days = dates.values.astype('datetime64[D]').astype(np.int32)
+        np.save(os.path.join(tmp, 'dates.npy'), days)
+        for variant, matrix in variants.items():
+            np.save(os.path.join(tmp, variant + '.npy'), matrix)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'state': state, 'locations': locations, 'token': token}, f)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another session published this state for the same token first;
+            # the token pins the data, so its pivots are the same as ours
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.exists(os.path.join(path, 'meta.json')):
+                raise
+        return path
+
+    @telemetry.timed('pivots.load', output=False)
+    def load(self, state, token=None):
+        """
+        Pivots for state, built first if this data refresh has none yet.
+        """
+        token = data_token() if token is None else token
+        path = self.path(token, state)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            self.build(state, token)
+            self.prune(token)
+        return StatePivots(path)
+
+    def build_all(self, states=None):
+        """Builds every state for the current data refresh"""
+        token = data_token()
+        states = nyt_state_snapshot.states() if states is None else states
+        for state in states:
+            self.build(state, token)
+        self.prune(token)
+
+    def prune(self, token):
+        """Removes pivots from older data refreshes"""
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            if name != token:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+
+pivot_store = PivotStore()
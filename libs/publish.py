@@ -0,0 +1,152 @@
+"""
+Static export of everything the dashboard shows.
+
+publish() writes the tables and chart specs app.py computes on request to
+PUBLISH_DIR, so they can be served as plain files:
+
+    montana/        active cases, tests completed and CDC indicators
+    states/<state>/ cumulative, daily and doubling tables (state + counties),
+                    the case based CDC indicators of every county and
+                    charts/<county>.json, the explorer's default view
+    sir/            the fits, predictions and bands runsir.py wrote
+    manifest.json   data version, time and every file written
+
+Tables are written as CSV and as JSON (orient='split', ISO dates). The
+states are exported in parallel, each worker building its pivots the same
+way app.py does.
+"""
+
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from libs.gsheet import active_cases, cdc_indicators, tests_completed
+from libs.indicators import state_indicator_table
+from libs.metrics import population
+from libs.obs_utils import nyt_state_snapshot
+from libs.pivots import VARIANTS, chart_frame, data_token, pivot_store
+from libs.snapshot import slugify
+
+PUBLISH_DIR = './data/publish'
+SIR_OUTPUTS = ['sir_fits', 'sir_results', 'sir_bands']
+
+# Chart value names, as in app.py
+VALUE_NAMES = {'cumulative': 'Total Cases', 'daily': 'New Cases', 'doubling': '# days'}
+
+
+def write_table(df, path):
+    """Writes df to path.csv and path.json, returns both paths"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_csv(path + '.csv')
+    df.to_json(path + '.json', orient='split', date_format='iso')
+    return [path + '.csv', path + '.json']
+
+
+def write_json(obj, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(obj, f)
+    return [path]
+
+
+def county_charts(pivots, county):
+    """Vega-Lite specs of the explorer's charts for one county"""
+    from libs.charts import area_chart, downsample, line_chart
+
+    specs = {}
+    for variant, y in VALUE_NAMES.items():
+        df = chart_frame(pivots.frame(variant, [county]), y, finite=variant != 'cumulative')
+        if variant == 'cumulative':
+            specs[variant] = line_chart(downsample(df, y), y).to_dict()
+        else:
+            # Step charts aren't downsampled, see libs/charts.py
+            specs[variant] = area_chart(df, y).to_dict()
+    return specs
+
+
+def publish_state(state, token, root=PUBLISH_DIR, charts=True):
+    """Exports one state's explorer tables (and charts), returns the files written"""
+    pivots = pivot_store.load(state, token)
+    path = os.path.join(root, 'states', slugify(state))
+    written = []
+    for variant in VARIANTS:
+        df = pivots.frame(variant, pivots.counties)
+        written += write_table(df, os.path.join(path, variant))
+    indicators = state_indicator_table(pivots, population(state)).rename_axis('location')
+    written += write_table(indicators, os.path.join(path, 'cdc_indicators'))
+    if charts:
+        for county in pivots.counties:
+            written += write_json(
+                county_charts(pivots, county),
+                os.path.join(path, 'charts', slugify(county) + '.json')
+            )
+    return written
+
+
+def publish_gsheet(sheet, root=PUBLISH_DIR):
+    """Exports the Missoula/Montana tables from a formatted sheet"""
+    path = os.path.join(root, 'montana')
+    return (
+        write_table(active_cases(sheet), os.path.join(path, 'active_cases'))
+        + write_table(active_cases(sheet, per_100k=True), os.path.join(path, 'active_cases_per_100k'))
+        + write_table(tests_completed(sheet), os.path.join(path, 'tests_completed'))
+        + write_table(cdc_indicators(sheet), os.path.join(path, 'cdc_indicators'))
+    )
+
+
+def publish_sir(root=PUBLISH_DIR, data_dir='./data'):
+    """Exports the outputs of runsir.py that exist"""
+    written = []
+    for name in SIR_OUTPUTS:
+        source = os.path.join(data_dir, name + '.csv')
+        if os.path.exists(source):
+            df = pd.read_csv(source, index_col=0)
+            written += write_table(df, os.path.join(root, 'sir', name))
+    return written
+
+
+def publish(root=PUBLISH_DIR, states=None, workers=None, sheet=None, charts=True):
+    """
+    Exports every artefact to root, replacing what was there.
+
+    sheet is the formatted Google Sheet (see libs.gsheet.format_gsheet), or
+    None to skip its tables. workers=1 exports the states in this process.
+    Returns the manifest.
+    """
+    start = time.time()
+    token = data_token()
+    states = nyt_state_snapshot.states() if states is None else states
+
+    tmp = root + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    written = []
+    if sheet is not None:
+        written += publish_gsheet(sheet, tmp)
+    written += publish_sir(tmp)
+
+    jobs = [(state, token, tmp, charts) for state in states]
+    if workers == 1:
+        outputs = [publish_state(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(publish_state, *zip(*jobs)))
+    for files in outputs:
+        written += files
+    pivot_store.prune(token)
+
+    manifest = {
+        'token': token,
+        'time': start,
+        'seconds': time.time() - start,
+        'states': list(states),
+        'files': sorted(os.path.relpath(f, tmp) for f in written),
+    }
+    write_json(manifest, os.path.join(tmp, 'manifest.json'))
+    shutil.rmtree(root, ignore_errors=True)
+    os.rename(tmp, root)
+    return manifest
@@ -0,0 +1,122 @@
+"""
+Reconciles case series from several sources into one (date, location) series.
+
+Every source is a long frame indexed by date with a location column, cases
+(and optionally deaths) and a source column. Where sources overlap on a
+(date, location), each value comes from the first source in precedence that
+has it; gaps are then filled within each location only, so one location's
+numbers never leak into another's.
+
+Everything after the sort is a single vectorized pass over the rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+# NYT is the reference series, the state library's numbers fill in the days
+# NYT hasn't published yet (the same rule CovidTrends uses for Montana)
+SOURCE_PRECEDENCE = ['nyt', 'msl']
+VALUE_COLUMNS = ['cases', 'deaths']
+
+
+def group_starts(keys):
+    """Boolean mask of the rows that start a new run of equal keys"""
+    starts = np.zeros(len(keys[0]), dtype=bool)
+    starts[:1] = True
+    for key in keys:
+        starts[1:] |= key[1:] != key[:-1]
+    return starts
+
+
+def first_valid(values, starts):
+    """
+    Per group of rows (each starting where starts is True), the position of
+    the first non-NaN value, or -1 if the whole group is NaN.
+    """
+    size = len(values)
+    positions = np.where(np.isnan(values), size, np.arange(size))
+    first = np.minimum.reduceat(positions, np.flatnonzero(starts))
+    first[first == size] = -1
+    return first
+
+
+def fill_within(values, starts):
+    """
+    Forward then backward fills values without crossing group boundaries.
+    """
+    size = len(values)
+    index = np.arange(size)
+    valid = ~np.isnan(values)
+    group_first = np.maximum.accumulate(np.where(starts, index, 0))
+    ends = np.append(starts[1:], True)
+    group_last = np.minimum.accumulate(np.where(ends, index, size)[::-1])[::-1]
+
+    last_seen = np.maximum.accumulate(np.where(valid, index, -1))
+    forward = last_seen >= group_first
+    next_seen = np.minimum.accumulate(np.where(valid, index, size)[::-1])[::-1]
+    backward = ~forward & (next_seen <= group_last)
+
+    filled = values.copy()
+    filled[forward] = values[last_seen[forward]]
+    filled[backward] = values[next_seen[backward]]
+    return filled
+
+
+def reconcile(frames, precedence=SOURCE_PRECEDENCE, fill=True):
+    """
+    Merges long source frames into one row per (date, location).
+
+    Returns a frame indexed by date, sorted by date then location, with the
+    columns location, cases, deaths and source (the source of cases).
+    Sources not listed in precedence rank after the listed ones.
+    """
+    frames = [f.reset_index() for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame(
+            columns=['location'] + VALUE_COLUMNS + ['source'],
+            index=pd.DatetimeIndex([], name='date')
+        )
+    dates = np.concatenate([f['date'].values.astype('datetime64[D]').astype(np.int64) for f in frames])
+    locations = pd.Categorical(np.concatenate([np.asarray(f['location'], dtype=object) for f in frames]))
+    sources = pd.Categorical(np.concatenate([np.asarray(f['source'], dtype=object) for f in frames]))
+    values = {}
+    for name in VALUE_COLUMNS:
+        values[name] = np.concatenate([
+            f[name].astype(float).values if name in f else np.full(len(f), np.nan) for f in frames
+        ])
+
+    ranks = np.array([
+        precedence.index(s) if s in precedence else len(precedence) for s in sources.categories
+    ])
+    rank = ranks[sources.codes]
+    loc_codes = locations.codes
+    order = np.lexsort((rank, dates, loc_codes))
+    loc_codes, dates = loc_codes[order], dates[order]
+    starts = group_starts([loc_codes, dates])
+    rows = np.flatnonzero(starts)
+
+    out = {}
+    chosen_source = order[rows]
+    for name in VALUE_COLUMNS:
+        column = values[name][order]
+        first = first_valid(column, starts)
+        out[name] = np.where(first >= 0, column[np.maximum(first, 0)], np.nan)
+        if name == 'cases':
+            chosen_source = np.where(first >= 0, order[np.maximum(first, 0)], chosen_source)
+
+    loc_out = loc_codes[rows]
+    if fill:
+        loc_starts = group_starts([loc_out])
+        for name in VALUE_COLUMNS:
+            out[name] = fill_within(out[name], loc_starts)
+
+    by_date = np.lexsort((loc_out, dates[rows]))
+    df = pd.DataFrame({
+        'location': pd.Categorical.from_codes(loc_out[by_date], locations.categories),
+        'cases': out['cases'][by_date],
+        'deaths': out['deaths'][by_date],
+        'source': pd.Categorical.from_codes(
+            sources.codes[chosen_source][by_date], sources.categories
+        ),
+    }, index=pd.DatetimeIndex(dates[rows][by_date].astype('datetime64[D]'), name='date'))
+    return df
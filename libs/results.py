@@ -0,0 +1,188 @@
+"""
+Append-only store of model runs and their forecasts.
+
+Every fit runsir.py makes is kept in one SQLite file: a runs row per
+(location, run date, model, parameters) and its forecast rows, one per
+date. Nothing is overwritten or renamed, so any earlier forecast can be
+read back, and the lookups the dashboard needs (the latest run of a
+location, all runs of a location) are index seeks rather than a glob over
+CSV files.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+RESULTS_DB = './data/model_results.sqlite'
+
+# Forecast frame column -> forecasts table column
+FORECAST_COLUMNS = {
+    'Actual': 'actual',
+    'Susceptible': 'susceptible',
+    'Exposed': 'exposed',
+    'Infectious': 'infectious',
+    'Recovered': 'recovered',
+    'Dead': 'dead',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    location TEXT NOT NULL,
+    run_date TEXT NOT NULL,
+    model TEXT NOT NULL,
+    params TEXT NOT NULL,
+    loss REAL,
+    created REAL NOT NULL,
+    UNIQUE (location, run_date, model, params)
+);
+CREATE INDEX IF NOT EXISTS runs_by_location ON runs (location, model, run_date, run_id);
+CREATE TABLE IF NOT EXISTS forecasts (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    date TEXT NOT NULL,
+    {columns},
+    PRIMARY KEY (run_id, date)
+) WITHOUT ROWID;
+""".format(columns=',\n    '.join(c + ' REAL' for c in FORECAST_COLUMNS.values()))
+
+
+def params_key(params):
+    """Canonical JSON of a run's parameters, part of its key"""
+    clean = {}
+    for name, value in params.items():
+        if isinstance(value, np.generic):
+            value = value.item()
+        clean[name] = value
+    return json.dumps(clean, sort_keys=True)
+
+
+class ResultsStore(object):
+    """
+    Model runs in a SQLite file, see the module docstring.
+    """
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+
+    def connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        db = sqlite3.connect(self.path)
+        db.executescript(SCHEMA)
+        return closing(db)
+
+    def add_run(self, location, model, params, forecast, run_date=None, loss=None):
+        """
+        Stores one run and its forecast frame (indexed by date, with the
+        columns of FORECAST_COLUMNS it has). Returns the run_id, or None if
+        the same (location, run_date, model, params) is already stored.
+        """
+        run_date = run_date or time.strftime('%Y-%m-%d')
+        columns = [c for c in FORECAST_COLUMNS if c in forecast]
+        dates = pd.DatetimeIndex(forecast.index).strftime('%Y-%m-%d')
+        values = forecast[columns].astype(float).values
+        with self.connect() as db, db:
+            cursor = db.execute(
+                'INSERT OR IGNORE INTO runs (location, run_date, model, params, loss, created)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (location, run_date, model, params_key(params),
+                 None if loss is None or not np.isfinite(loss) else float(loss), time.time())
+            )
+            if not cursor.rowcount:
+                return None
+            run_id = cursor.lastrowid
+            db.executemany(
+                'INSERT INTO forecasts (run_id, date, {}) VALUES (?, ?, {})'.format(
+                    ', '.join(FORECAST_COLUMNS[c] for c in columns), ', '.join('?' * len(columns))
+                ),
+                [
+                    (run_id, date) + tuple(None if np.isnan(v) else v for v in row)
+                    for date, row in zip(dates, values)
+                ]
+            )
+        return run_id
+
+    def add_fits(self, fits, results, model='sir', param_columns=None, run_date=None):
+        """
+        Stores the output of fit_locations/fit_model_locations, one run per
+        location. param_columns are the fits columns that key the run (by
+        default every column but the bookkeeping ones).
+        """
+        skip = {'refit', 'loss', 'seconds', 'starts_run', 'model'}
+        param_columns = param_columns or [c for c in fits.columns if c not in skip]
+        run_ids = {}
+        for location, fit in fits.iterrows():
+            forecast = results[results['location'] == location]
+            params = {c: fit[c] for c in param_columns if pd.notnull(fit[c])}
+            run_ids[location] = self.add_run(
+                location, model, params, forecast, run_date, loss=fit.get('loss')
+            )
+        return run_ids
+
+    def runs(self, location=None, model=None):
+        """Run metadata, newest first, optionally for one location and/or model"""
+        where, args = [], []
+        if location is not None:
+            where.append('location = ?')
+            args.append(location)
+        if model is not None:
+            where.append('model = ?')
+            args.append(model)
+        query = 'SELECT * FROM runs'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY run_date DESC, run_id DESC'
+        with self.connect() as db:
+            df = pd.read_sql_query(query, db, params=args)
+        df['params'] = df['params'].apply(json.loads)
+        return df.set_index('run_id')
+
+    def forecast(self, run_id):
+        """One run's forecast, with the same columns it was stored with"""
+        with self.connect() as db:
+            df = pd.read_sql_query(
+                'SELECT * FROM forecasts WHERE run_id = ? ORDER BY date', db,
+                params=[int(run_id)], parse_dates=['date']
+            )
+        names = {v: k for k, v in FORECAST_COLUMNS.items()}
+        df = df.drop(columns='run_id').set_index('date').rename(columns=names)
+        return df.dropna(axis=1, how='all')
+
+    def latest_run(self, location, model='sir'):
+        """run_id of the newest run of a location, None if it has none"""
+        with self.connect() as db:
+            row = db.execute(
+                'SELECT run_id FROM runs WHERE location = ? AND model = ?'
+                ' ORDER BY run_date DESC, run_id DESC LIMIT 1',
+                (location, model)
+            ).fetchone()
+        return row[0] if row else None
+
+    def latest(self, location, model='sir'):
+        """Forecast of the newest run of a location, None if it has none"""
+        run_id = self.latest_run(location, model)
+        return None if run_id is None else self.forecast(run_id)
+
+    def history(self, location, model='sir'):
+        """
+        Every run's forecast of a location, newest run first, with run_id and
+        run_date columns.
+        """
+        with self.connect() as db:
+            df = pd.read_sql_query(
+                'SELECT runs.run_id, runs.run_date, forecasts.* FROM runs'
+                ' JOIN forecasts ON forecasts.run_id = runs.run_id'
+                ' WHERE runs.location = ? AND runs.model = ?'
+                ' ORDER BY runs.run_date DESC, runs.run_id DESC, forecasts.date',
+                db, params=[location, model], parse_dates=['date']
+            )
+        names = {v: k for k, v in FORECAST_COLUMNS.items()}
+        df = df.loc[:, ~df.columns.duplicated()].set_index('date').rename(columns=names)
+        return df.dropna(axis=1, how='all')
+
+
+results_store = ResultsStore()
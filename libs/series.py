@@ -0,0 +1,113 @@
+"""
+Compact long-form case series.
+
+CaseSeries keeps one row per (date, location) in contiguous NumPy arrays:
+int32 days since 1970-01-01 (the snapshot's date encoding), int32 codes
+into a list of location names, float32 cases and deaths (NaN where
+missing; float32 holds counts exactly up to 2**24) and int8 source codes.
+That is 17 bytes a row, against a few hundred for a frame with string
+locations and sources.
+
+Pandas and NumPy only come in at the edges: to_frame() for code that wants
+the old cov_update() frame, wide() for the date x location matrices the
+pivots and charts use, and the array attributes themselves.
+"""
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['location', 'cases', 'deaths', 'source']
+
+
+class CaseSeries(object):
+    """
+    Rows of (day, location, cases, deaths, source) in parallel arrays.
+    """
+
+    def __init__(self, days, codes, locations, cases, deaths, source_codes, sources):
+        self.days = np.asarray(days, dtype=np.int32)
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.locations = list(locations)
+        self.cases = np.asarray(cases, dtype=np.float32)
+        self.deaths = np.asarray(deaths, dtype=np.float32)
+        self.source_codes = np.asarray(source_codes, dtype=np.int8)
+        self.sources = list(sources)
+
+    @classmethod
+    def from_frame(cls, df, location_column='location'):
+        """
+        From a date-indexed frame with a location column, cases and
+        optionally deaths and source (like reconcile() returns).
+        """
+        days = df.index.values.astype('datetime64[D]').astype(np.int32)
+        location = pd.Categorical(df[location_column])
+        if 'source' in df:
+            source = pd.Categorical(df['source'])
+        else:
+            source = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), ['nyt'])
+        deaths = df['deaths'].values if 'deaths' in df else np.full(len(df), np.nan)
+        return cls(
+            days, location.codes, location.categories,
+            df['cases'].values.astype(np.float32), np.asarray(deaths, dtype=np.float32),
+            source.codes, source.categories
+        )
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        arrays = [self.days, self.codes, self.cases, self.deaths, self.source_codes]
+        return sum(a.nbytes for a in arrays)
+
+    @property
+    def dates(self):
+        return pd.DatetimeIndex(self.days.astype('datetime64[D]'), name='date')
+
+    @property
+    def location(self):
+        return pd.Categorical.from_codes(self.codes, self.locations)
+
+    @property
+    def source(self):
+        return pd.Categorical.from_codes(self.source_codes, self.sources)
+
+    def to_frame(self):
+        """The date-indexed location/cases/deaths/source frame"""
+        return pd.DataFrame({
+            'location': self.location,
+            'cases': self.cases,
+            'deaths': self.deaths,
+            'source': self.source,
+        }, index=self.dates, columns=COLUMNS)
+
+    def present(self):
+        """Codes of the locations with rows, in the order they first appear"""
+        codes, first = np.unique(self.codes, return_index=True)
+        return codes[np.argsort(first)]
+
+    def wide(self, column='cases'):
+        """
+        Date x location frame of one column, like pivoting to_frame() on
+        location: one row per date with data, one column per location in
+        the order the locations first appear. Not filled.
+        """
+        days, rows = np.unique(self.days, return_inverse=True)
+        present = self.present()
+        cols = np.empty(len(self.locations), dtype=np.intp)
+        cols[present] = np.arange(len(present))
+        matrix = np.full((len(days), len(present)), np.nan)
+        matrix[rows, cols[self.codes]] = getattr(self, column)
+        return pd.DataFrame(
+            matrix,
+            index=pd.DatetimeIndex(days.astype('datetime64[D]'), name='date'),
+            columns=pd.Index([self.locations[c] for c in present], name='location')
+        )
+
+    def select(self, location):
+        """Rows of one location, as a new CaseSeries"""
+        rows = self.codes == self.locations.index(location)
+        return CaseSeries(
+            self.days[rows], self.codes[rows], self.locations, self.cases[rows],
+            self.deaths[rows], self.source_codes[rows], self.sources
+        )
@@ -5,28 +5,130 @@ https://www.lewuathe.com/covid-19-dynamics-with-sir-model.html
 
 import numpy as np
 import pandas as pd
-from scipy.integrate import solve_ivp
-from scipy.optimize import minimize
-import matplotlib.pyplot as plt
-from datetime import timedelta, datetime
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import multiprocessing
+import os
+import time
 from libs.obs_utils import *
+from libs.models import MODELS, STEPS_PER_DAY, fit, forecast, get_model, latin_hypercube
+from libs.telemetry import telemetry
+
+# scipy is imported inside the functions that use it, so importing this
+# module (e.g. from app.py) stays cheap
 
 def loss(point, data, s_0, i_0, r_0):
     """
     RMSE between actual confirmed cases and the estimated infectious people with given beta and gamma.
     """
+    from scipy.integrate import solve_ivp
     size = len(data)
-    beta, gamma = point
-    def SIR(t, y):
-        S = y[0]
-        I = y[1]
-        R = y[2]
-        return [-beta*S*I, beta*S*I-gamma*I, gamma*I]
+    theta = np.asarray(point, dtype=float)
+    SIR = lambda t, y: MODELS['sir'].rhs(y, theta)
     solution = solve_ivp(SIR, [0, size], [s_0,i_0,r_0], t_eval=np.arange(0, size, 1), vectorized=True)
     return np.sqrt(np.mean((solution.y[1] - data)**2))
 
+FIT_STATE_PATH = './data/sir_fit_state.json'
+# Multi-start fits stop early once this many of the best fits agree within
+# AGREE_TOL (relative, on the loss and on every parameter)
+AGREE_TOP = 3
+AGREE_TOL = 1e-3
+
+def sir_sensitivity_rhs(y, beta, gamma):
+    """
+    SIR right-hand side together with the forward sensitivity equations.
+
+    y holds S, I, R followed by their derivatives with respect to beta and
+    then gamma. Plain arithmetic only, so it works on floats and arrays.
+    """
+    S, I, R, S_b, I_b, R_b, S_g, I_g, R_g = y
+    infection = beta*S*I
+    recovery = gamma*I
+    # d/dt dy/dp = J dy/dp + df/dp
+    dS_b = -beta*I*S_b - beta*S*I_b - S*I
+    dI_b = beta*I*S_b + (beta*S - gamma)*I_b + S*I
+    dR_b = gamma*I_b
+    dS_g = -beta*I*S_g - beta*S*I_g
+    dI_g = beta*I*S_g + (beta*S - gamma)*I_g - I
+    dR_g = gamma*I_g + I
+    return (-infection, infection - recovery, recovery, dS_b, dI_b, dR_b, dS_g, dI_g, dR_g)
+
+def rk4_sir(beta, gamma, s_0, i_0, r_0, size, steps_per_day=STEPS_PER_DAY):
+    """
+    Fixed-step RK4 solution of SIR and its sensitivities on days 0..size-1.
+
+    Returns an array of shape (9, size): S, I, R, then d(S, I, R)/dbeta and
+    d(S, I, R)/dgamma.
+    """
+    h = 1.0 / steps_per_day
+    y = (s_0, i_0, r_0, 0., 0., 0., 0., 0., 0.)
+    out = np.empty((9, size))
+    out[:, 0] = y
+    for day in range(1, size):
+        for _ in range(steps_per_day):
+            k1 = sir_sensitivity_rhs(y, beta, gamma)
+            k2 = sir_sensitivity_rhs([a + 0.5*h*k for a, k in zip(y, k1)], beta, gamma)
+            k3 = sir_sensitivity_rhs([a + 0.5*h*k for a, k in zip(y, k2)], beta, gamma)
+            k4 = sir_sensitivity_rhs([a + h*k for a, k in zip(y, k3)], beta, gamma)
+            y = tuple(
+                a + h/6*(b1 + 2*b2 + 2*b3 + b4)
+                for a, b1, b2, b3, b4 in zip(y, k1, k2, k3, k4)
+            )
+        out[:, day] = y
+    return out
+
+def simulate_sir(beta, gamma, s_0, i_0, r_0, days, steps_per_day=STEPS_PER_DAY):
+    """
+    Integrates K SIR trajectories at once with fixed-step RK4.
+
+    Every argument but days can be a scalar or an array of length K (they
+    are broadcast together). Returns an array of shape (K, days, 3) with
+    S, I, R on days 0..days-1.
+    """
+    beta, gamma, s_0, i_0, r_0 = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(v, dtype=float)) for v in (beta, gamma, s_0, i_0, r_0)]
+    )
+    return MODELS['sir'].simulate(
+        np.array([beta, gamma]), np.array([s_0, i_0, r_0]), days, steps_per_day
+    )
+
+def loss_rk4(point, data, s_0, i_0, r_0):
+    """
+    Same RMSE as loss() on the RK4 grid, returned with its exact gradient.
+
+    Use with minimize(..., jac=True).
+    """
+    beta, gamma = point
+    data = np.asarray(data, dtype=float)
+    y = rk4_sir(beta, gamma, s_0, i_0, r_0, len(data))
+    resid = y[1] - data
+    rmse = np.sqrt(np.mean(resid**2))
+    if rmse == 0:
+        return 0., np.zeros(2)
+    grad = np.array([np.mean(resid*y[4]), np.mean(resid*y[7])]) / rmse
+    return rmse, grad
+
 class SirLearner(object):
-    def __init__(self, confirmed_data, location, loss, predict_range, r_0, i_0, N):
+    """
+    Fits beta and gamma to a location's confirmed cases.
+
+    solver picks the ODE backend used while fitting: 'ivp' uses adaptive
+    solve_ivp with finite-difference gradients, 'rk4' a fixed-step RK4 grid
+    whose loss returns its exact gradient (see
+    benchmarks/bench_sir_solver.py). Predictions always come from the
+    batched simulate_sir. The parameters in fixed are held at their value.
+
+    With starts > 1, train() is a multi-start fit: the local fit is run from
+    the given (or default) point and from starts - 1 Latin hypercube points
+    over the bounds, across workers processes, keeping the best. budget
+    (seconds) stops it early, as does AGREE_TOP fits agreeing. Every train()
+    leaves its loss, wall time and starts run in self.report.
+    """
+    fixed = {'gamma': 0.2}  # constrained gamma to 1/5
+
+    def __init__(self, confirmed_data, location, loss, predict_range, r_0, i_0, N, solver='ivp',
+                 starts=1, workers=None, budget=None, seed=0):
         self.confirmed_data = confirmed_data
         self.location = location
         self.loss = loss
@@ -35,6 +137,14 @@ class SirLearner(object):
         self.i_0 = i_0
         self.N = N
         self.s_0 = N - i_0 - r_0
+        if solver not in ('ivp', 'rk4'):
+            raise ValueError("solver must be 'ivp' or 'rk4', got {!r}".format(solver))
+        self.solver = solver
+        self.starts = starts
+        self.workers = workers
+        self.budget = budget
+        self.seed = seed
+        self.report = {}
 
     def load_confirmed(self):
         """
@@ -44,12 +154,15 @@ class SirLearner(object):
         return loc_df[loc_df != 0]
 
     def extend_index(self, index):
-        values = index.date
-        current = values[-1]
-        while len(values) < self.predict_range:
-            current = current + timedelta(days=1)
-            values = np.append(values, current)           
-        return values
+        """
+        index followed by the days after its last one, up to predict_range dates.
+        """
+        index = pd.DatetimeIndex(index)
+        extra = self.predict_range - len(index)
+        if extra <= 0:
+            return index
+        horizon = pd.date_range(index[-1] + pd.Timedelta(days=1), periods=extra, freq='D')
+        return index.append(horizon)
 
     def predict(self, beta, gamma, data):
         """
@@ -57,39 +170,426 @@ class SirLearner(object):
         The model is formulated with the given beta and gamma.
         """
 
+        from scipy.optimize import OptimizeResult
         new_index = self.extend_index(data.index)
         size = len(new_index)
-        def SIR(t, y):
-            S = y[0]
-            I = y[1]
-            R = y[2]
-            return [-beta*S*I, beta*S*I-gamma*I, gamma*I]
-        extended_actual = np.concatenate((data.values, [None] * (size - len(data.values))))
-        return new_index, extended_actual, solve_ivp(SIR, [0, size], [self.s_0,self.i_0,self.r_0], t_eval=np.arange(0, size, 1))
+        extended_actual = np.full(size, np.nan)
+        extended_actual[:len(data)] = data.values
+        trajectory = simulate_sir(beta, gamma, self.s_0, self.i_0, self.r_0, size)[0]
+        return new_index, extended_actual, OptimizeResult(t=np.arange(0, size, 1), y=trajectory.T)
 
-    def train(self):
+    def forecast_frame(self, beta, gamma, data):
         """
-        Run the optimization to estimate the beta and gamma fitting the given confirmed cases.
+        Actual and predicted compartments over the prediction range.
         """
-        data = self.load_confirmed()
-        optimal = minimize(
-            loss, 
-            [0.001, 0.001], 
-            args=(data, self.s_0, self.i_0, self.r_0), 
-            method='L-BFGS-B', 
-            # bounds=[(0.00000001, 0.5), (0.00000001, 0.5)]
-            bounds=[(0.00000001, 0.5), (0.2, 0.2)]  # constrained gamma to 1/5
-            )
-
-        beta, gamma = optimal.x
         new_index, extended_actual, prediction = self.predict(beta, gamma, data)
-        df = pd.DataFrame({
+        return pd.DataFrame({
             'Actual': extended_actual,
             'Susceptible': prediction.y[0],
             'Infectious': prediction.y[1],
             'Recovered': prediction.y[2]
         }, index=new_index)
-        return beta, gamma, df
+
+    def bounds(self):
+        return [
+            (self.fixed[p.name],)*2 if p.name in self.fixed else p.bounds for p in MODELS['sir'].params
+        ]
+
+    def optimize(self, data, x0):
+        """One local L-BFGS-B fit from x0"""
+        from scipy.optimize import minimize
+        return minimize(
+            loss_rk4 if self.solver == 'rk4' else self.loss, 
+            x0, 
+            args=(data, self.s_0, self.i_0, self.r_0), 
+            method='L-BFGS-B', 
+            jac=self.solver == 'rk4',
+            bounds=self.bounds()
+            )
+
+    def train(self, x0=None):
+        """
+        Run the optimization to estimate the beta and gamma fitting the given confirmed cases.
+
+        x0 is the starting point, the SIR model's defaults unless warm-starting.
+        """
+        start = time.time()
+        data = self.load_confirmed()
+        x0 = [p.x0 for p in MODELS['sir'].params] if x0 is None else x0
+        if self.starts > 1:
+            optimal, completed = self.multistart(data, x0)
+        else:
+            optimal, completed = self.optimize(data, x0), 1
+        self.report = {
+            'loss': float(optimal.fun),
+            'seconds': time.time() - start,
+            'starts': completed,
+        }
+
+        beta, gamma = optimal.x
+        return beta, gamma, self.forecast_frame(beta, gamma, data)
+
+    def start_points(self, x0):
+        """x0 followed by starts - 1 Latin hypercube points over the bounds"""
+        random = np.random.RandomState(self.seed)
+        points = latin_hypercube(self.starts - 1, self.bounds(), random)
+        return [np.asarray(x0, dtype=float)] + list(points)
+
+    def multistart(self, data, x0):
+        """
+        Best local fit over start_points(x0), returns (result, fits completed).
+        """
+        start = time.time()
+        results = []
+        initargs = (self, data)
+        if self.workers == 1:
+            _init_multistart(*initargs)
+            pool = None
+            outputs = map(_fit_start, self.start_points(x0))
+            next_result = lambda timeout: next(outputs)
+        else:
+            # multiprocessing's Pool rather than ProcessPoolExecutor, so fits
+            # still running when we stop early can be terminated
+            pool = multiprocessing.Pool(self.workers, _init_multistart, initargs)
+            outputs = pool.imap_unordered(_fit_start, self.start_points(x0))
+            next_result = outputs.next
+        try:
+            while not fits_agree(results):
+                # Past the budget, stop as soon as there is any fit
+                timeout = None
+                if self.budget is not None and results:
+                    timeout = max(self.budget - (time.time() - start), 0)
+                    if not timeout and pool is None:
+                        # A serial fit can't be waited on, don't start it
+                        break
+                try:
+                    results.append(next_result(timeout))
+                except (StopIteration, multiprocessing.TimeoutError):
+                    break
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        return min(results, key=fit_loss), len(results)
+
+    def data_hash(self, data):
+        """
+        Fingerprint of the confirmed series together with the model settings.
+        """
+        digest = hashlib.sha256()
+        digest.update(np.asarray(data.values, dtype=float).tobytes())
+        digest.update(data.index.values.astype('datetime64[D]').astype(np.int64).tobytes())
+        settings = [self.predict_range, self.r_0, self.i_0, self.N, self.solver]
+        digest.update(json.dumps(settings).encode())
+        return digest.hexdigest()
+
+    def refit(self, previous=None):
+        """
+        Incremental train() using the fit-state saved by an earlier run.
+
+        If the series and settings hash the same as in previous, the stored
+        beta/gamma are reused without optimizing. Otherwise the fit is warm
+        started from them. Returns (beta, gamma, df, state) where state is
+        the fit-state to persist for next time.
+        """
+        data = self.load_confirmed()
+        digest = self.data_hash(data)
+        if previous and previous.get('hash') == digest:
+            beta, gamma = previous['beta'], previous['gamma']
+            df = self.forecast_frame(beta, gamma, data)
+            self.report = {'loss': previous.get('loss'), 'seconds': 0.0, 'starts': 0}
+            refit = False
+        else:
+            x0 = [previous['beta'], previous['gamma']] if previous else None
+            beta, gamma, df = self.train(x0)
+            refit = True
+        state = {
+            'beta': float(beta),
+            'gamma': float(gamma),
+            'hash': digest,
+            'last_date': str(data.index[-1].date()),
+            'refit': refit,
+        }
+        state.update(self.report)
+        return beta, gamma, df, state
+
+def load_fit_state(path=FIT_STATE_PATH):
+    """Fit-state per location saved by fit_locations, {} if there is none"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_fit_state(state, path=FIT_STATE_PATH):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def fit_location(confirmed, location, params, previous=None, workers=None):
+    """
+    Fits one location; module level so it can run in a worker process.
+
+    workers is the process count of a multi-start fit (params['starts']).
+    """
+    learner = SirLearner(
+        confirmed, location, loss, params['predict_range'], params['r_0'],
+        params['i_0'], params['N'], solver=params.get('solver', 'ivp'),
+        starts=params.get('starts', 1), workers=workers, budget=params.get('budget')
+    )
+    with telemetry.section('sir.fit_location') as section:
+        beta, gamma, df, state = learner.refit(previous)
+        section.output(df)
+    return location, beta, gamma, df, state
+
+@telemetry.timed('sir.fit_locations', output=False)
+def fit_locations(data, params, workers=None, state_path=None):
+    """
+    Fits SirLearner for many locations across a process pool.
+
+    data has one column of confirmed cases per location and params maps each
+    location to its SirLearner settings (predict_range, r_0, i_0, N and
+    optionally solver, and starts and budget for a multi-start fit).
+    workers=1 fits in this process. Multi-start locations are fit one after
+    the other, each spreading its starts over the pool. With state_path the
+    fits are incremental: locations whose data is unchanged since the last
+    run are not refit and the rest are warm started (see SirLearner.refit).
+    Returns (fits, results): one row of beta/gamma, loss, seconds and starts
+    run per location, and every prediction stacked with a location column.
+    """
+    state = load_fit_state(state_path) if state_path else {}
+    jobs = [
+        (data[[loc]], loc, p, state.get(loc))
+        for loc, p in params.items()
+    ]
+    if workers == 1 or any(p.get('starts', 1) > 1 for p in params.values()):
+        outputs = [fit_location(*job, workers=workers) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(fit_location, *zip(*jobs)))
+
+    fits = []
+    frames = []
+    for location, beta, gamma, df, loc_state in outputs:
+        fits.append(dict(
+            location=location, beta=beta, gamma=gamma, refit=loc_state['refit'],
+            loss=loc_state['loss'], seconds=loc_state['seconds'], starts_run=loc_state['starts'],
+            **params[location]
+        ))
+        state[location] = loc_state
+        df = df.copy()
+        df.insert(0, 'location', location)
+        df['Date'] = df.index
+        frames.append(df)
+    if state_path:
+        save_fit_state(state, state_path)
+    return pd.DataFrame(fits).set_index('location'), pd.concat(frames)
+
+def location_targets(location, state='Montana'):
+    """
+    Cumulative cases and deaths of a state (location == state) or one of
+    its counties, for fitting models other than SIR. Days missing from the
+    feed carry the previous totals forward.
+    """
+    source = 'state' if location == state else 'county'
+    series = load_dataset(source, state).select(location)
+    df = series.to_frame()[['cases', 'deaths']].astype(float)
+    return df[df['cases'] > 0].asfreq('D').ffill()
+
+def fit_model_location(model, targets, location, params):
+    """
+    Fits one location with the shared pipeline in libs/models.py; module
+    level so it can run in a worker process.
+    """
+    with telemetry.section('{}.fit_location'.format(model)) as section:
+        fitted, result = fit(
+            model, targets, params['N'], params['i_0'], params['r_0'], fixed=params.get('fixed')
+        )
+        df = forecast(
+            model, fitted, targets, params['N'], params['i_0'], params['r_0'], params['predict_range']
+        )
+        section.output(df)
+    return location, fitted, result.fun, df
+
+@telemetry.timed('models.fit_locations', output=False)
+def fit_model_locations(model, targets, params, workers=None):
+    """
+    fit_locations for any registered model (see libs/models.py).
+
+    targets maps each location to its frame of cumulative cases (and
+    deaths), e.g. from location_targets. Returns (fits, results) like
+    fit_locations, with one column per model parameter and the loss.
+    """
+    model = get_model(model).name
+    jobs = [(model, targets[loc], loc, p) for loc, p in params.items()]
+    if workers == 1:
+        outputs = [fit_model_location(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(fit_model_location, *zip(*jobs)))
+
+    fits = []
+    frames = []
+    for location, fitted, value, df in outputs:
+        fits.append(dict(location=location, model=model, loss=value, **fitted))
+        df = df.copy()
+        df.insert(0, 'location', location)
+        df['Date'] = df.index
+        frames.append(df)
+    return pd.DataFrame(fits).set_index('location'), pd.concat(frames)
+
+def fit_loss(result):
+    """Loss of an OptimizeResult, inf if the fit diverged"""
+    return result.fun if np.isfinite(result.fun) else np.inf
+
+def fits_agree(results, top=AGREE_TOP, tol=AGREE_TOL):
+    """Whether the top best of the OptimizeResults so far agree within tol"""
+    if len(results) < top:
+        return False
+    best = sorted(results, key=fit_loss)[:top]
+    funs = np.array([fit_loss(r) for r in best])
+    if not np.isfinite(funs).all():
+        return False
+    points = np.array([r.x for r in best])
+    scale = np.maximum(np.abs(points[0]), 1e-12)
+    return (
+        funs[-1] - funs[0] <= tol * max(abs(funs[0]), 1e-12)
+        and (np.abs(points - points[0]) <= tol * scale).all()
+    )
+
+_multistart_data = {}
+
+def _init_multistart(learner, data):
+    """Stores the learner and its series once per worker process"""
+    _multistart_data.update(learner=learner, data=data)
+
+def _fit_start(x0):
+    return _multistart_data['learner'].optimize(_multistart_data['data'], x0)
+
+class QuantileReservoir(object):
+    """
+    Streaming percentiles over arrays of a fixed shape.
+
+    Keeps a uniform random sample of at most size arrays (reservoir
+    sampling), so memory is bounded no matter how many are added.
+    """
+    def __init__(self, shape, size=500, seed=0):
+        self.size = size
+        self.samples = np.empty((size,) + tuple(shape))
+        self.count = 0
+        self.random = np.random.RandomState(seed)
+
+    def add(self, values):
+        if self.count < self.size:
+            self.samples[self.count] = values
+        else:
+            slot = self.random.randint(0, self.count + 1)
+            if slot < self.size:
+                self.samples[slot] = values
+        self.count += 1
+
+    def percentiles(self, q):
+        return np.nanpercentile(self.samples[:min(self.count, self.size)], q, axis=0)
+
+_ensemble_data = {}
+
+def _init_ensemble(confirmed, location, params, x0):
+    """Stores the observed series once per worker process"""
+    _ensemble_data.update(confirmed=confirmed, location=location, params=params, x0=x0)
+
+def perturb_confirmed(confirmed, random):
+    """
+    Bootstrap replicate of a cumulative series: Poisson resampled daily counts.
+
+    The first value is kept so the replicate starts on the same day.
+    """
+    values = np.asarray(confirmed.values, dtype=float)
+    daily = random.poisson(np.maximum(np.diff(values), 0))
+    replicate = values[0] + np.concatenate(([0], np.cumsum(daily)))
+    return pd.Series(replicate, index=confirmed.index)
+
+def _fit_replicate(seed):
+    """
+    Fits one bootstrap replicate of the shared series, returns (beta, I/R trajectory).
+    """
+    confirmed = _ensemble_data['confirmed']
+    location = _ensemble_data['location']
+    params = _ensemble_data['params']
+    replicate = perturb_confirmed(confirmed, np.random.RandomState(seed)).to_frame(location)
+    learner = SirLearner(
+        replicate, location, loss, params['predict_range'], params['r_0'],
+        params['i_0'], params['N'], solver=params.get('solver', 'ivp')
+    )
+    beta, gamma, df = learner.train(_ensemble_data['x0'])
+    return beta, df[['Infectious', 'Recovered']].values
+
+def bootstrap_ensemble(confirmed, location, params, point_fit=None, replicates=200, workers=None,
+                       budget=None, percentiles=(5, 25, 50, 75, 95), reservoir_size=500, seed=0):
+    """
+    Percentile bands for Infectious/Recovered from refitting bootstrap replicates.
+
+    confirmed is a frame with a column of cumulative cases for location and
+    params its SirLearner settings. point_fit is the location's published
+    fit, (beta, gamma, forecast frame) as fit_locations returns them; it is
+    only fit here when not given. Each replicate resamples the daily counts
+    and is refit (warm started from the point fit) in a process pool whose
+    workers share one copy of the series. Results are streamed into a
+    QuantileReservoir, so memory does not grow with replicates; past budget
+    seconds the remaining replicates are cancelled. Returns (bands,
+    beta_bands, completed): bands has columns like 'Infectious p50' indexed
+    by date, beta_bands maps percentile to beta.
+    """
+    start = time.time()
+    if point_fit is None:
+        point_fit = fit_location(confirmed, location, params)[1:4]
+    beta, gamma, point = point_fit
+    series = SirLearner(
+        confirmed, location, loss, params['predict_range'], params['r_0'], params['i_0'], params['N']
+    ).load_confirmed()
+    compartments = ['Infectious', 'Recovered']
+    trajectories = QuantileReservoir((len(point), len(compartments)), reservoir_size, seed)
+    betas = QuantileReservoir((), reservoir_size, seed)
+
+    seeds = np.random.RandomState(seed).randint(0, 2**31 - 1, replicates)
+    initargs = (series, location, params, [beta, gamma])
+    if workers == 1:
+        _init_ensemble(*initargs)
+        pool = None
+        outputs = map(_fit_replicate, seeds)
+        next_result = lambda timeout: next(outputs)
+    else:
+        # Terminated rather than drained when the budget runs out, see
+        # SirLearner.multistart
+        pool = multiprocessing.Pool(workers, _init_ensemble, initargs)
+        outputs = pool.imap_unordered(_fit_replicate, seeds)
+        next_result = outputs.next
+    completed = 0
+    try:
+        while True:
+            timeout = None
+            if budget is not None:
+                timeout = max(budget - (time.time() - start), 0)
+                if not timeout:
+                    break
+            try:
+                replicate_beta, trajectory = next_result(timeout)
+            except (StopIteration, multiprocessing.TimeoutError):
+                break
+            betas.add(replicate_beta)
+            trajectories.add(trajectory)
+            completed += 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    bands = {}
+    values = trajectories.percentiles(percentiles)
+    for i, q in enumerate(percentiles):
+        for j, name in enumerate(compartments):
+            bands['{} p{}'.format(name, q)] = values[i, :, j]
+    beta_bands = dict(zip(percentiles, betas.percentiles(percentiles)))
+    return pd.DataFrame(bands, index=point.index), beta_bands, completed
 
 # N = 200
 # i_0 = 1
@@ -104,6 +604,7 @@ class SirLearner(object):
 
 # l = SirLearner(data, 'Missoula', loss, 150, r_0, i_0, N)
 # beta, gamma, df = l.train()
+# import matplotlib.pyplot as plt
 # fig, ax = plt.subplots(figsize=(8, 5))
 # ax.set_title('Montana')
 # df.plot(ax=ax)
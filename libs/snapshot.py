@@ -0,0 +1,671 @@
+"""
+Local on-disk snapshots of the NYT csv feeds.
+
+A feed is downloaded once, split by state and written as raw NumPy columns
+that are memory-mapped on read. Later reads never touch the network; a
+refresh only re-parses the feed when the upstream ETag/Last-Modified or the
+content hash has changed.
+
+Feeds are never held in memory whole: a download is spooled to a temporary
+file and then scanned and parsed in chunks, so peak memory is bounded by
+CHUNK_ROWS and SCAN_WINDOW rather than by the size of the national feed.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from libs.fetch import open_url
+from libs.telemetry import telemetry
+
+SNAPSHOT_DIR = './data/snapshots'
+CHUNK_ROWS = 100000
+SCAN_WINDOW = 1 << 22
+COPY_BUFFER = 1 << 20
+# Socket timeout in seconds of every feed download, so a stalled connection
+# can't hold the snapshot lock
+FEED_TIMEOUT = 60
+
+# On-disk dtype of every column we keep. The state column is implied by the
+# partition and county names are stored as codes into the partition metadata.
+COLUMN_DTYPES = {
+    'date': '<i4',      # days since 1970-01-01
+    'county': '<i4',    # codes into partition['categories']['county']
+    'fips': '<i4',      # -1 where missing
+    'cases': '<f8',
+    'deaths': '<f8',
+}
+
+CSV_DTYPES = {
+    'date': 'str',
+    'county': 'category',
+    'state': 'category',
+    'fips': 'Int64',
+    'cases': 'float',
+    'deaths': 'float'
+}
+
+
+def slugify(name):
+    """Directory-safe version of a state name"""
+    return re.sub(r'[^0-9a-zA-Z]+', '_', name).strip('_').lower()
+
+
+def is_remote(url):
+    return url.startswith('http://') or url.startswith('https://')
+
+
+def local_path(url):
+    if url.startswith('file://'):
+        return url[len('file://'):]
+    return url
+
+
+def iter_csv_chunks(f, names=None, states=None, chunksize=CHUNK_ROWS):
+    """
+    Parses an NYT csv stream chunk by chunk, keeping only the given states.
+
+    county and state come back as categoricals. Pass names when f is
+    positioned past the header.
+    """
+    chunks = pd.read_csv(
+        f,
+        header=None if names else 'infer',
+        names=names,
+        dtype=CSV_DTYPES,
+        parse_dates=['date'],
+        chunksize=chunksize
+    )
+    for chunk in chunks:
+        if states is not None:
+            chunk = chunk[chunk['state'].isin(states)]
+        yield chunk
+
+
+def read_nyt_csv(url, states=None, chunksize=CHUNK_ROWS, timeout=FEED_TIMEOUT):
+    """
+    Streams an NYT csv (URL or path) and returns only the rows of states.
+
+    Peak memory is one chunk plus the rows kept, not the whole feed.
+    """
+    if is_remote(url):
+        with open_url(url, timeout) as response:
+            kept = list(iter_csv_chunks(response.raw, states=states, chunksize=chunksize))
+    else:
+        with open(local_path(url), 'rb') as f:
+            kept = list(iter_csv_chunks(f, states=states, chunksize=chunksize))
+    df = pd.concat(kept)
+    for name in ['county', 'state']:
+        if name in df:
+            # concat falls back to object when the chunks' categories differ
+            df[name] = df[name].astype('category').cat.remove_unused_categories()
+    return df.set_index('date')
+
+
+class FeedBody(object):
+    """
+    The bytes of a feed from offset base to the end, backed by a file.
+
+    Offsets are always positions in the full feed. A local feed is read in
+    place, a download is spooled to a temporary file first.
+    """
+
+    def __init__(self, path, base=0, temporary=False):
+        self.path = path
+        self.base = base
+        self.end = base + os.path.getsize(path)
+        self.temporary = temporary
+
+    @classmethod
+    def spool(cls, response, base=0):
+        f = tempfile.NamedTemporaryFile(prefix='feed-', suffix='.csv', delete=False)
+        with f:
+            shutil.copyfileobj(response, f, COPY_BUFFER)
+        return cls(f.name, base, temporary=True)
+
+    def close(self):
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def open(self, pos):
+        f = open(self.path, 'rb')
+        f.seek(pos - self.base)
+        return f
+
+    def header(self):
+        """First line of the feed, only available for a full body"""
+        with self.open(0) as f:
+            return f.readline().decode()
+
+    def sha(self, start=None, end=None):
+        start = self.base if start is None else start
+        end = self.end if end is None else end
+        digest = hashlib.sha256()
+        with self.open(start) as f:
+            remaining = end - start
+            while remaining > 0:
+                data = f.read(min(COPY_BUFFER, remaining))
+                if not data:
+                    break
+                digest.update(data)
+                remaining -= len(data)
+        return digest.hexdigest()
+
+    def day_blocks(self, start, window=SCAN_WINDOW):
+        """
+        Splits the rows from byte offset start onwards into one block per date.
+
+        Returns a list of [date, start, end, sha256], scanning at most window
+        bytes at a time. Relies on every row starting with an ISO date, as the
+        NYT feeds do.
+        """
+        if start >= self.end:
+            return []
+        buf = np.memmap(self.path, dtype=np.uint8, mode='r')
+        blocks = []
+        pos = start
+        while pos < self.end:
+            seg = buf[pos - self.base:min(pos + window, self.end) - self.base]
+            if pos + len(seg) < self.end:
+                # Stop at the last full line, the rest goes in the next window
+                newlines = np.flatnonzero(seg == ord('\n'))
+                if len(newlines):
+                    seg = seg[:newlines[-1] + 1]
+            starts = np.concatenate(([0], np.flatnonzero(seg == ord('\n')) + 1))
+            starts = starts[starts < len(seg)]
+            padded = np.concatenate((seg, np.zeros(10, dtype=np.uint8)))
+            keys = padded[starts[:, None] + np.arange(10)]
+            changes = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+            firsts = np.concatenate(([0], changes))
+            bounds = np.append(starts[firsts], len(seg))
+            for i, first in enumerate(firsts):
+                date = keys[first].tobytes().decode()
+                lo, hi = int(bounds[i]), int(bounds[i + 1])
+                if blocks and blocks[-1][0] == date and blocks[-1][2] == pos + lo:
+                    # Same date carried over from the previous window
+                    blocks[-1][3].update(seg[lo:hi].tobytes())
+                    blocks[-1][2] = pos + hi
+                else:
+                    blocks.append([date, pos + lo, pos + hi, hashlib.sha256(seg[lo:hi].tobytes())])
+            pos += len(seg)
+        del buf
+        return [[date, lo, hi, digest.hexdigest()] for date, lo, hi, digest in blocks]
+
+
+def first_changed_date(days, blocks):
+    """
+    Earliest date whose stored block differs from the feed, or None.
+    """
+    for stored, block in zip(days, blocks):
+        if stored[0] != block[0] or stored[3] != block[3]:
+            return min(stored[0], block[0])
+    if len(days) > len(blocks):
+        return days[len(blocks)][0]
+    if len(blocks) > len(days):
+        return blocks[len(days)][0]
+    return None
+
+
+def copy_prefix(source, target, size, link=False):
+    """
+    Writes the first size bytes of source to target, as a hard link when
+    link and the whole file is kept.
+    """
+    if not size:
+        open(target, 'wb').close()
+        return
+    if link and os.path.getsize(source) == size:
+        os.link(source, target)
+        return
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        remaining = size
+        while remaining > 0:
+            data = src.read(min(COPY_BUFFER, remaining))
+            if not data:
+                break
+            dst.write(data)
+            remaining -= len(data)
+
+
+def encode_partition(df, categories):
+    """
+    Converts one state's rows of the csv into a dict of numpy columns.
+
+    New county names are appended to categories so existing codes stay valid.
+    """
+    columns = {}
+    days = df['date'].values.astype('datetime64[D]').astype(np.int64)
+    columns['date'] = days.astype(COLUMN_DTYPES['date'])
+    if 'county' in df:
+        names = categories.setdefault('county', [])
+        lookup = {name: code for code, name in enumerate(names)}
+        county = df['county'].astype('category')
+        codes = county.cat.codes.values
+        # One slot per category of the chunk, the last one for missing (-1)
+        mapping = np.zeros(len(county.cat.categories) + 1, dtype=COLUMN_DTYPES['county'])
+        for code in np.unique(codes):
+            name = county.cat.categories[code] if code >= 0 else 'Unknown'
+            if name not in lookup:
+                lookup[name] = len(names)
+                names.append(name)
+            mapping[code] = lookup[name]
+        columns['county'] = mapping[codes]
+    if 'fips' in df:
+        columns['fips'] = df['fips'].fillna(-1).values.astype(COLUMN_DTYPES['fips'])
+    for name in ['cases', 'deaths']:
+        if name in df:
+            columns[name] = df[name].values.astype(COLUMN_DTYPES[name])
+    return columns
+
+
+def decode_partition(columns, categories, state):
+    """
+    Builds a dataframe shaped like pd.read_csv(feed) for a single state.
+
+    county and state are categoricals built straight from the stored codes.
+    """
+    dates = pd.to_datetime(np.asarray(columns['date']).astype('datetime64[D]'))
+    data = {}
+    if 'county' in columns:
+        data['county'] = pd.Categorical.from_codes(
+            np.asarray(columns['county']), categories.get('county', [])
+        )
+    data['state'] = pd.Categorical.from_codes(np.zeros(len(dates), dtype=np.int8), [state])
+    if 'fips' in columns:
+        fips = np.asarray(columns['fips']).astype('float')
+        fips[fips < 0] = np.nan
+        data['fips'] = pd.Series(fips).astype('Int64').values
+    for name in ['cases', 'deaths']:
+        if name in columns:
+            data[name] = np.array(columns[name], dtype='float')
+    df = pd.DataFrame(data, index=pd.Index(dates, name='date'))
+    return df
+
+
+class FeedSnapshot(object):
+    """
+    Typed, state-partitioned on-disk copy of one csv feed.
+
+    url can be an http(s) URL or a local path (or file:// URL) standing in
+    for the feed. Reads are served from memory-mapped columns; the feed is
+    only re-checked once the snapshot is older than max_age seconds.
+    only_states limits the snapshot to those states; other rows are dropped
+    while parsing.
+
+    With incremental=True the snapshot records the byte range and a digest
+    of every date block it has ingested, so a refresh only parses the rows
+    from the first date that differs from the feed (see _refresh).
+
+    Column files are never changed once meta.json points at them: every
+    refresh writes a new version directory and switches meta over, and
+    read() holds a shared lock while it copies columns out, so old versions
+    can be removed as soon as the next one is published.
+    """
+
+    def __init__(self, source, url, root=SNAPSHOT_DIR, max_age=3600, incremental=False, only_states=None,
+                 timeout=FEED_TIMEOUT):
+        self.source = source
+        self.url = url
+        self.root = os.path.join(root, source)
+        self.max_age = max_age
+        self.incremental = incremental
+        self.only_states = only_states
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+
+    @contextmanager
+    def locked(self, shared=False):
+        """
+        Holds the snapshot for a refresh, or with shared=True for a read:
+        the RLock keeps out other threads and an flock on root/.lock other
+        processes (publish and runsir workers). A refresh removes the
+        version it replaced, so readers of it must be finished first.
+        """
+        with self._lock:
+            if not self._lock_depth:
+                os.makedirs(self.root, exist_ok=True)
+                self._lock_file = open(os.path.join(self.root, '.lock'), 'w')
+                fcntl.flock(self._lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if not self._lock_depth:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.root, 'meta.json')
+
+    def load_meta(self):
+        if not os.path.exists(self.meta_path):
+            return {}
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def save_meta(self, meta):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmp, self.meta_path)
+
+    def is_stale(self, meta=None):
+        meta = self.load_meta() if meta is None else meta
+        if not meta:
+            return True
+        return time.time() - meta.get('checked', 0) > self.max_age
+
+    def fetch(self, meta):
+        """
+        Conditionally fetches the whole feed.
+
+        Returns (body, validators). body is a FeedBody, or None when the feed
+        has not changed since the snapshot recorded in meta.
+        """
+        with telemetry.section('snapshot.fetch.{}'.format(self.source)) as section:
+            body, validators = self._fetch(meta)
+            if body is not None:
+                section.add(bytes_in=body.end - body.base)
+        return body, validators
+
+    def _fetch(self, meta):
+        if not is_remote(self.url):
+            path = local_path(self.url)
+            stat = os.stat(path)
+            validators = {'size': stat.st_size, 'mtime': stat.st_mtime}
+            if meta and meta.get('size') == stat.st_size and meta.get('mtime') == stat.st_mtime:
+                return None, validators
+            return FeedBody(path), validators
+
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        # The pooled session of libs/fetch.py, with a socket timeout so a
+        # stalled download fails instead of holding the snapshot lock
+        with open_url(self.url, self.timeout, headers) as response:
+            if response.status_code == 304:
+                return None, {}
+            body = FeedBody.spool(response.raw)
+            headers = response.headers
+        validators = {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+        }
+        return body, validators
+
+    def refresh(self, force=False):
+        """
+        Thread- and process-safe _refresh, only one refresh of a snapshot
+        runs at a time.
+        """
+        with self.locked():
+            return self._refresh(force)
+
+    def ensure_fresh(self):
+        """
+        Refreshes the snapshot if it is stale and returns its metadata.
+
+        If the feed can't be reached but an older snapshot exists, the older
+        snapshot is served and the refresh is retried on the next call.
+        """
+        with self.locked():
+            meta = self.load_meta()
+            if self.is_stale(meta) or not self.version_dir(meta):
+                try:
+                    self._refresh()
+                except (OSError, ValueError):
+                    if not self.version_dir(meta):
+                        raise
+                meta = self.load_meta()
+        return meta
+
+    @telemetry.timed('snapshot.refresh', output=False)
+    def _refresh(self, force=False):
+        """
+        Brings the snapshot up to date with the feed.
+
+        The feed is only downloaded when its validators changed. In
+        incremental mode every date block of the new feed is then compared
+        with the stored digests and only the rows from the first changed
+        date onwards are parsed: just the appended days when upstream only
+        added rows, more when it revised older ones. Returns True if the
+        snapshot changed.
+        """
+        meta = self.load_meta()
+        if force or not self.version_dir(meta):
+            body, validators = self.fetch({})
+            meta.update(validators)
+            try:
+                self.build(body, meta)
+            finally:
+                body.close()
+            return True
+
+        body, validators = self.fetch(meta)
+        meta.update(validators)
+        meta['checked'] = time.time()
+        if body is None:
+            self.save_meta(meta)
+            return False
+
+        try:
+            changed = self.ingest(body, meta)
+        finally:
+            body.close()
+        return changed
+
+    def ingest(self, body, meta):
+        """
+        Compares the whole feed with the snapshot and rebuilds what changed.
+        """
+        digest = body.sha()
+        if digest == meta.get('sha256'):
+            self.save_meta(meta)
+            return False
+        header = body.header()
+        if not self.incremental or not meta.get('days') or header != meta['header']:
+            self.build(body, meta)
+            return True
+
+        blocks = body.day_blocks(len(header.encode()))
+        since = first_changed_date(meta['days'], blocks)
+        if since is None:
+            meta['sha256'] = digest
+            meta['offset'] = body.end
+            self.save_meta(meta)
+            return False
+        changed = [b for b in blocks if b[0] >= since]
+        pos = changed[0][1] if changed else body.end
+        stage = self.stage(digest)
+        try:
+            self.update_range(meta, since, body, pos, changed, stage)
+        except BaseException:
+            shutil.rmtree(stage, ignore_errors=True)
+            raise
+        meta['sha256'] = digest
+        meta['offset'] = body.end
+        self.publish(meta, stage)
+        return True
+
+    def version_dir(self, meta):
+        if not meta.get('version'):
+            return None
+        path = os.path.join(self.root, meta['version'])
+        return path if os.path.isdir(path) else None
+
+    def stage(self, digest):
+        """New private directory for the next version's column files"""
+        os.makedirs(self.root, exist_ok=True)
+        return tempfile.mkdtemp(prefix='.v{}-'.format(digest[:12]), dir=self.root)
+
+    def publish(self, meta, stage):
+        """
+        Makes the staged version current by saving meta, then removes every
+        other version (and stages left by refreshes that failed). Call with
+        the lock held.
+        """
+        version = os.path.basename(stage)[1:]
+        os.rename(stage, os.path.join(self.root, version))
+        meta['version'] = version
+        self.save_meta(meta)
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name != version and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def build(self, body, meta):
+        """
+        Parses the whole feed and writes a new snapshot version.
+        """
+        digest = body.sha()
+        header = body.header()
+        header_len = len(header.encode())
+        stage = self.stage(digest)
+
+        meta.update({
+            'url': self.url,
+            'header': header,
+            'columns': [c for c in COLUMN_DTYPES if c in header.strip().split(',')],
+            'partitions': {},
+            'days': [],
+            'revision': 0,
+            'offset': header_len,
+        })
+        blocks = body.day_blocks(header_len)
+        try:
+            self.update_range(meta, None, body, header_len, blocks, stage)
+        except BaseException:
+            shutil.rmtree(stage, ignore_errors=True)
+            raise
+        meta['sha256'] = digest
+        meta['checked'] = meta['built'] = time.time()
+        if any(a[0] >= b[0] for a, b in zip(blocks, blocks[1:])):
+            # Feed is not sorted by date, so it can't be ingested by its tail
+            meta['days'] = []
+        self.publish(meta, stage)
+
+    def update_range(self, meta, since, body, pos, blocks, stage):
+        """
+        Writes the snapshot of meta to the stage directory with every row
+        dated on or after since replaced by the rows of body from byte offset
+        pos onwards. meta is updated but not saved, see publish.
+
+        blocks are the day_blocks of those rows. Kept rows are hard linked
+        (or, for partitions cut short, copied) from the current version, and
+        the new rows parsed and appended CHUNK_ROWS at a time, so the parsing
+        cost is proportional to the size of the replaced range.
+        """
+        partitions = meta['partitions']
+        if since is not None:
+            since_day = np.datetime64(since, 'D').astype(np.int64)
+            version_path = os.path.join(self.root, meta['version'])
+            for state, partition in partitions.items():
+                columns = self.read_columns(meta, state)
+                keep = int(np.searchsorted(columns['date'], since_day, side='left'))
+                del columns
+                source = os.path.join(version_path, partition['dir'])
+                path = os.path.join(stage, partition['dir'])
+                os.makedirs(path)
+                for name in meta['columns']:
+                    itemsize = np.dtype(COLUMN_DTYPES[name]).itemsize
+                    copy_prefix(os.path.join(source, name + '.bin'), os.path.join(path, name + '.bin'),
+                                keep * itemsize, link=keep == partition['rows'])
+                partition['rows'] = keep
+            meta['days'] = [d for d in meta['days'] if d[0] < since]
+
+        if pos < body.end:
+            names = meta['header'].strip().split(',')
+            with body.open(pos) as f:
+                for chunk in iter_csv_chunks(f, names=names, states=self.only_states):
+                    for state, state_df in chunk.groupby('state', sort=False, observed=True):
+                        partition = partitions.setdefault(
+                            state, {'dir': slugify(state), 'categories': {}, 'rows': 0}
+                        )
+                        columns = encode_partition(state_df, partition['categories'])
+                        path = os.path.join(stage, partition['dir'])
+                        self.write_columns(path, columns, mode='ab')
+                        partition['rows'] += len(state_df)
+
+        meta['days'].extend(blocks)
+        meta['offset'] = blocks[-1][2] if blocks else meta['offset']
+        meta['sha256'] = None
+        meta['revision'] = meta.get('revision', 0) + 1
+        meta['checked'] = time.time()
+
+    def write_columns(self, path, columns, mode='wb'):
+        os.makedirs(path, exist_ok=True)
+        for name, values in columns.items():
+            filename = os.path.join(path, name + '.bin')
+            if mode == 'ab' and os.path.exists(filename) and os.stat(filename).st_nlink > 1:
+                # Still linked to the current version, append to a copy
+                copy_prefix(filename, filename + '.tmp', os.path.getsize(filename))
+                os.replace(filename + '.tmp', filename)
+            with open(filename, mode) as f:
+                f.write(np.ascontiguousarray(values, dtype=COLUMN_DTYPES[name]).tobytes())
+
+    def read_columns(self, meta, state):
+        """
+        Memory-mapped columns for one state, or None if the state is unknown.
+        """
+        partition = meta['partitions'].get(state)
+        if partition is None:
+            return None
+        path = os.path.join(self.root, meta['version'], partition['dir'])
+        columns = {}
+        for name in meta['columns']:
+            if partition['rows'] == 0:
+                columns[name] = np.empty(0, dtype=COLUMN_DTYPES[name])
+            else:
+                columns[name] = np.memmap(
+                    os.path.join(path, name + '.bin'),
+                    dtype=COLUMN_DTYPES[name],
+                    mode='r',
+                    shape=(partition['rows'],)
+                )
+        return columns
+
+    def read(self, state):
+        """
+        Returns one state's rows with the same layout as the raw csv.
+        """
+        self.ensure_fresh()
+        with self.locked(shared=True):
+            # Copied out before a refresh can replace the version
+            meta = self.load_meta()
+            columns = self.read_columns(meta, state)
+            if columns is not None:
+                columns = {name: np.array(values) for name, values in columns.items()}
+        if columns is None:
+            columns = {name: np.empty(0, dtype=COLUMN_DTYPES[name]) for name in meta['columns']}
+            return decode_partition(columns, {}, state)
+        return decode_partition(columns, meta['partitions'][state]['categories'], state)
+
+    def states(self):
+        meta = self.ensure_fresh()
+        return list(meta['partitions'])
+
+    def token(self):
+        """
+        Identifier of the current snapshot contents, changes on every refresh
+        that altered the data.
+        """
+        meta = self.ensure_fresh()
+        return '{}-{}'.format(meta['version'], meta['revision'])
@@ -0,0 +1,82 @@
+"""
+Startup timing for the dashboard.
+
+app.py marks the milestones of its first run in a process (imports done,
+first paint, each section rendered) and the report is appended to
+STARTUP_LOG as one JSON line, so cold-start times can be compared across
+releases. Per-module import times come from benchmarks/bench_startup.py.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+STARTUP_LOG = './data/startup_times.jsonl'
+
+# Modules that must not be imported before the first paint
+HEAVY_MODULES = ['scipy', 'matplotlib', 'gspread', 'oauth2client']
+
+
+def release():
+    """Short git revision of the running code, or None outside a checkout"""
+    try:
+        out = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.decode().strip() or None
+
+
+class StartupTimer(object):
+    """
+    Wall-clock milestones of one script run, in seconds since start.
+
+    Streamlit re-runs app.py on every interaction with the modules already
+    imported, so only the first run in a process is a cold start and only
+    that one is saved.
+    """
+    started = False
+
+    def __init__(self, start=None):
+        self.start = time.time() if start is None else start
+        self.marks = []
+        self.loaded = {}
+        self.notes = {}
+        self.cold = not StartupTimer.started
+        StartupTimer.started = True
+
+    def mark(self, name):
+        """Records the time since start and which HEAVY_MODULES are loaded"""
+        self.marks.append((name, time.time() - self.start))
+        self.loaded[name] = [m for m in HEAVY_MODULES if m in sys.modules]
+
+    def note(self, name, value):
+        """Adds a JSON-serializable value to the report"""
+        self.notes[name] = value
+
+    def report(self):
+        return {
+            'time': self.start,
+            'release': release(),
+            'marks': dict(self.marks),
+            'heavy_modules_loaded': self.loaded,
+            'notes': self.notes,
+        }
+
+    def save(self, path=STARTUP_LOG):
+        if not self.cold:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.report()) + '\n')
+
+
+def load_reports(path=STARTUP_LOG):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,363 @@
+"""
+Per-stage timing and data-size telemetry.
+
+Wrap a stage in telemetry.section(name) (or decorate a function with
+telemetry.timed(name)) to record its wall time, the rows it produced and
+the bytes it read and returned. app.py records its sections with a Run,
+marking the end of each one like StartupTimer does.
+
+Every record is appended as one JSON line to a log of the process that
+made it (TELEMETRY_LOG with the pid added, see log_path), which rotates at
+TELEMETRY_MAX_BYTES, so the logs cover recent traffic whatever its volume
+and pool workers never rotate a file another process is writing. Logs
+untouched for TELEMETRY_MAX_AGE are removed. summary() gives the p50/p95
+seconds and mean sizes per section over all of them. Snapshots of
+counters kept elsewhere (the dataset cache's stats()) are logged the same
+way with Telemetry.gauge().
+
+When prometheus_client is installed each record is also observed in
+per-section histograms and counters, served as Prometheus text on
+TELEMETRY_PORT when that environment variable is set. The collectors live
+in the process that observes them, so only the serving process (the
+dashboard) is exported; sections run in runsir/publish pool workers are
+only in the logs.
+"""
+
+import functools
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from logging.handlers import RotatingFileHandler
+
+import pandas as pd
+
+from libs.cache import sizeof
+
+TELEMETRY_LOG = './data/telemetry.jsonl'
+TELEMETRY_MAX_BYTES = 5 * 2**20
+TELEMETRY_BACKUPS = 3
+TELEMETRY_MAX_AGE = 7 * 24 * 3600
+
+# Histogram buckets in seconds, from a cache hit to a full NYT rebuild
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def measure(value):
+    """
+    (rows, bytes) of a frame, array, CaseSeries, chart spec or raw payload.
+
+    Frames are measured shallow (object cells count as pointers) and
+    without memory_usage(), which costs as much as the smaller stages it
+    would measure.
+    """
+    if value is None:
+        return None, None
+    if isinstance(value, (bytes, str)):
+        return None, len(value)
+    if isinstance(value, dict):
+        # A Vega-Lite spec is served as JSON
+        return None, len(json.dumps(value, default=str))
+    rows = len(value) if hasattr(value, '__len__') else None
+    if isinstance(value, pd.DataFrame):
+        return rows, int(value.index.nbytes + sum(column.nbytes for _, column in value.items()))
+    if isinstance(value, pd.Series):
+        return rows, int(value.index.nbytes + value.nbytes)
+    if hasattr(value, 'nbytes'):
+        return rows, int(value.nbytes)
+    return rows, sizeof(value)
+
+
+class Section(object):
+    """One timed stage; set its sizes with add() or output()"""
+
+    def __init__(self, name, run=None):
+        self.name = name
+        self.run = run
+        self.rows = None
+        self.bytes_in = None
+        self.bytes_out = None
+        self.error = None
+        self.seconds = None
+        self.start = time.perf_counter()
+
+    def add(self, rows=None, bytes_in=None, bytes_out=None):
+        if rows is not None:
+            self.rows = (self.rows or 0) + int(rows)
+        if bytes_in is not None:
+            self.bytes_in = (self.bytes_in or 0) + int(bytes_in)
+        if bytes_out is not None:
+            self.bytes_out = (self.bytes_out or 0) + int(bytes_out)
+
+    def output(self, value):
+        """Counts the rows and bytes of what the stage returns"""
+        rows, size = measure(value)
+        self.add(rows=rows, bytes_out=size)
+        return value
+
+    def record(self):
+        return {
+            'time': time.time(),
+            'pid': os.getpid(),
+            'run': self.run,
+            'section': self.name,
+            'seconds': self.seconds,
+            'rows': self.rows,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'error': self.error,
+        }
+
+
+class Run(object):
+    """
+    Consecutive sections of one script run, sharing a run id.
+
+    mark(name) closes the section that started at the previous mark (or
+    when the run started), so a linear script only marks stage ends.
+    """
+
+    def __init__(self, telemetry, prefix):
+        self.telemetry = telemetry
+        self.prefix = prefix
+        self.id = uuid.uuid4().hex[:12]
+        self.begin = self.last = time.perf_counter()
+
+    def mark(self, name, value=None, **sizes):
+        """
+        Ends section name; value is what it produced (measured for rows and
+        bytes out), sizes are rows/bytes_in/bytes_out counted directly.
+        """
+        now = time.perf_counter()
+        section = Section('{}.{}'.format(self.prefix, name), self.id)
+        section.start = self.last
+        section.add(**sizes)
+        section.output(value)
+        section.seconds = now - self.last
+        self.last = now
+        self.telemetry.emit(section)
+
+    def finish(self, stats=None):
+        """
+        Ends the run; stats maps names to dicts of counters to record with
+        it, see Telemetry.gauge.
+        """
+        section = Section('{}.total'.format(self.prefix), self.id)
+        section.seconds = time.perf_counter() - self.begin
+        self.telemetry.emit(section)
+        for name, values in (stats or {}).items():
+            self.telemetry.gauge(name, values, self.id)
+
+
+class Telemetry(object):
+    """
+    Records sections to the rolling log and, if available, Prometheus.
+
+    Safe to use from threads. Every process, forked pool workers included,
+    writes its own log file.
+    """
+
+    def __init__(self, path=TELEMETRY_LOG, max_bytes=TELEMETRY_MAX_BYTES, backups=TELEMETRY_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.enabled = os.environ.get('TELEMETRY', '1') != '0'
+        self._lock = threading.Lock()
+        self._logger = None
+        self._pid = None
+        self._metrics = None
+        self._server = None
+
+    def logger(self):
+        """This process's logger, set up again after a fork"""
+        with self._lock:
+            if self._logger is None or self._pid != os.getpid():
+                path = log_path(self.path, os.getpid())
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                prune_logs(self.path)
+                handler = RotatingFileHandler(path, maxBytes=self.max_bytes, backupCount=self.backups)
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger = logging.getLogger('telemetry.{}'.format(os.path.abspath(path)))
+                logger.handlers = [handler]
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                self._logger, self._pid = logger, os.getpid()
+            return self._logger
+
+    def metrics(self):
+        """The Prometheus collectors, False if prometheus_client isn't installed"""
+        with self._lock:
+            if self._metrics is None:
+                try:
+                    # Imported here so the dashboard can start rendering before it loads
+                    import prometheus_client as prom
+                except ImportError:
+                    self._metrics = False
+                else:
+                    self._metrics = {
+                        'seconds': prom.Histogram(
+                            'dashboard_section_seconds', 'Wall time of a section',
+                            ['section'], buckets=BUCKETS
+                        ),
+                        'rows': prom.Counter('dashboard_section_rows', 'Rows produced', ['section']),
+                        'bytes_in': prom.Counter('dashboard_section_bytes_in', 'Bytes read', ['section']),
+                        'bytes_out': prom.Counter('dashboard_section_bytes_out', 'Bytes returned', ['section']),
+                        'errors': prom.Counter('dashboard_section_errors', 'Sections that raised', ['section']),
+                        'stats': prom.Gauge('dashboard_stat', 'Last recorded value of a statistic', ['name', 'stat']),
+                    }
+            return self._metrics
+
+    def emit(self, section):
+        if not self.enabled:
+            return
+        self.logger().info(json.dumps(section.record()))
+        metrics = self.metrics()
+        if metrics:
+            metrics['seconds'].labels(section.name).observe(section.seconds)
+            for name in ['rows', 'bytes_in', 'bytes_out']:
+                value = getattr(section, name)
+                if value:
+                    metrics[name].labels(section.name).inc(value)
+            if section.error:
+                metrics['errors'].labels(section.name).inc()
+
+    def gauge(self, name, values, run=None):
+        """
+        Records the current values of a dict of counters (like
+        DatasetCache.stats()) as one log record and, for the numeric ones,
+        dashboard_stat gauges labelled with name.
+        """
+        if not self.enabled:
+            return
+        record = {'time': time.time(), 'pid': os.getpid(), 'run': run, 'stats': name, 'values': values}
+        self.logger().info(json.dumps(record, default=str))
+        metrics = self.metrics()
+        if metrics:
+            for stat, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metrics['stats'].labels(name, stat).set(value)
+
+    def section(self, name, run=None):
+        """Context manager timing a stage; yields its Section"""
+        return _SectionContext(self, name, run)
+
+    def timed(self, name, output=True):
+        """
+        Decorator timing every call of a function as section name, with the
+        rows and bytes of its return value if output.
+        """
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.section(name) as section:
+                    result = fn(*args, **kwargs)
+                    if output:
+                        section.output(result)
+                    return result
+            return wrapper
+        return decorate
+
+    def run(self, prefix):
+        return Run(self, prefix)
+
+    def serve(self, port=None):
+        """
+        Serves the Prometheus metrics on port (default TELEMETRY_PORT) once
+        per process. Returns whether they are being served.
+        """
+        port = port or os.environ.get('TELEMETRY_PORT')
+        if not port or not self.metrics():
+            return False
+        with self._lock:
+            if self._server is None:
+                from prometheus_client import start_http_server
+                start_http_server(int(port))
+                self._server = int(port)
+        return True
+
+    def text(self):
+        """The Prometheus text exposition of the metrics, empty without prometheus_client"""
+        if not self.metrics():
+            return ''
+        from prometheus_client import generate_latest
+        return generate_latest().decode()
+
+
+class _SectionContext(object):
+    def __init__(self, telemetry, name, run):
+        self.telemetry = telemetry
+        self.section = Section(name, run)
+
+    def __enter__(self):
+        self.section.start = time.perf_counter()
+        return self.section
+
+    def __exit__(self, exc_type, exc, tb):
+        self.section.seconds = time.perf_counter() - self.section.start
+        if exc_type is not None:
+            self.section.error = exc_type.__name__
+        self.telemetry.emit(self.section)
+        return False
+
+
+def log_path(path, pid):
+    """The log of process pid: telemetry.jsonl -> telemetry.<pid>.jsonl"""
+    root, ext = os.path.splitext(path)
+    return '{}.{}{}'.format(root, pid, ext)
+
+
+def log_files(path=TELEMETRY_LOG):
+    """Every process's log and its rotated backups"""
+    return glob.glob(log_path(path, '*')) + glob.glob(log_path(path, '*') + '.*')
+
+
+def prune_logs(path=TELEMETRY_LOG, max_age=TELEMETRY_MAX_AGE):
+    """Removes the logs of processes that stopped writing over max_age ago"""
+    cutoff = time.time() - max_age
+    for name in log_files(path):
+        try:
+            if os.path.getmtime(name) < cutoff:
+                os.remove(name)
+        except OSError:
+            pass
+
+
+def load_records(path=TELEMETRY_LOG):
+    """Every record in every process's logs, oldest first"""
+    records = []
+    for name in log_files(path):
+        try:
+            with open(name) as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+        except OSError:
+            # Rotated away while listing
+            pass
+    return sorted(records, key=lambda record: record['time'])
+
+
+def summary(path=TELEMETRY_LOG):
+    """
+    Calls, p50/p95/max seconds and mean rows and bytes per section, slowest
+    p95 first.
+    """
+    df = pd.DataFrame([record for record in load_records(path) if 'section' in record])
+    if df.empty:
+        return df
+    grouped = df.groupby('section')
+    table = pd.DataFrame({
+        'calls': grouped.size(),
+        'p50 s': grouped['seconds'].quantile(0.5),
+        'p95 s': grouped['seconds'].quantile(0.95),
+        'max s': grouped['seconds'].max(),
+        'rows': grouped['rows'].mean(),
+        'bytes in': grouped['bytes_in'].mean(),
+        'bytes out': grouped['bytes_out'].mean(),
+        'errors': grouped['error'].count(),
+    })
+    return table.sort_values('p95 s', ascending=False)
+
+
+telemetry = Telemetry()
@@ -0,0 +1,45 @@
+"""
+Writes every dashboard table and chart to static files (see libs/publish.py)
+
+    python publish.py [--out data/publish] [--workers N] [--states Montana Idaho]
+        [--no-gsheet] [--no-charts]
+
+Refreshes the NYT snapshots first. The Google Sheet tables are skipped
+when the credentials file is missing; run runsir.py before this to
+include the SIR outputs.
+"""
+
+from libs.fetch import fetch_all
+from libs.gsheet import GOOGLE_CREDS, format_gsheet, load_gsheet
+from libs.obs_utils import upstream_sources
+from libs.publish import PUBLISH_DIR, publish
+import argparse
+import os
+
+parser = argparse.ArgumentParser(description='Write the dashboard to static files')
+parser.add_argument('--out', default=PUBLISH_DIR, help='output directory')
+parser.add_argument('--workers', type=int, default=None,
+    help='number of worker processes (default: one per core, 1 to run serially)')
+parser.add_argument('--states', nargs='+', default=None,
+    help='states to export (default: every state in the NYT data)')
+parser.add_argument('--no-gsheet', action='store_true', help='skip the Google Sheet tables')
+parser.add_argument('--no-charts', action='store_true', help='skip the chart specs')
+args = parser.parse_args()
+
+for name, result in fetch_all(upstream_sources()).items():
+    if not result.ok:
+        raise result.error
+
+sheet = None
+if not args.no_gsheet:
+    if os.path.exists(GOOGLE_CREDS):
+        sheet = format_gsheet(load_gsheet())
+    else:
+        print('No {}, skipping the Google Sheet tables'.format(GOOGLE_CREDS))
+
+manifest = publish(
+    args.out, states=args.states, workers=args.workers, sheet=sheet, charts=not args.no_charts
+)
+print('Wrote {} files for {} states to {} in {:.1f}s'.format(
+    len(manifest['files']), len(manifest['states']), args.out, manifest['seconds']
+))
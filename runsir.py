@@ -1,59 +1,116 @@
 """
 Make sure to run this before deployment
+
+Fits the SIR model for every location in parallel and writes all results
+to data/sir_fits.csv (beta/gamma per location) and data/sir_results.csv
+(predictions, one location column). Every run is also appended to the
+results store in data/model_results.sqlite (see libs/results.py), which
+keeps the earlier forecasts.
+
+    python runsir.py [--workers N] [--all-counties] [--full] [--ensemble N]
+        [--model sir|seir|sird] [--starts N] [--budget SECONDS]
+
+Locations whose data has not changed since the last run keep their fit and
+the rest are warm started from it (state in data/sir_fit_state.json); use
+--full to refit everything from scratch. --ensemble N also refits N
+bootstrap replicates per location, warm started from its fit, and writes
+percentile bands to data/sir_bands.csv.
+
+--starts N fits each location from N starting points (a Latin hypercube
+over the bounds) across the workers and keeps the best; --budget caps
+the seconds spent per location on the multi-start fit and on the
+bootstrap replicates. The loss and wall time of every fit are
+printed and written to data/sir_fits.csv.
+
+--model seir or sird fits that model instead (see libs/models.py) to the
+NYT cases and deaths and writes data/<model>_fits.csv and
+data/<model>_results.csv.
 """
 
 from libs.sir_utils import *
 from libs.obs_utils import *
+from libs.results import results_store
 from datetime import datetime
-import glob
+import argparse
 import os
 
+parser = argparse.ArgumentParser(description='Fit the SIR model for each location')
+parser.add_argument('--workers', type=int, default=None,
+    help='number of worker processes (default: one per core, 1 to run serially)')
+parser.add_argument('--all-counties', action='store_true',
+    help='also fit every other Montana county')
+parser.add_argument('--full', action='store_true',
+    help='ignore the saved fit-state and refit every location from scratch')
+parser.add_argument('--ensemble', type=int, default=0, metavar='N',
+    help='number of bootstrap replicates for uncertainty bands (default: none)')
+parser.add_argument('--starts', type=int, default=1, metavar='N',
+    help='starting points per location for a multi-start fit (default: 1)')
+parser.add_argument('--budget', type=float, default=None, metavar='SECONDS',
+    help='time budget per location for a multi-start fit or ensemble')
+parser.add_argument('--model', default='sir', choices=sorted(MODELS),
+    help='compartment model to fit (default: sir)')
+args = parser.parse_args()
+
 # Bring in data
 zoo_data = CovidTrends(county=30063).get_covid_data()
 gal_data = CovidTrends(county=30031).get_covid_data()
 data = pd.merge(zoo_data, gal_data['Gallatin'], how='inner', left_index=True, right_index=True)
 
-# Move existing model result data
-<<<<<<< HEAD
-date = data.index[-1].strftime("%Y%m%d")
-old_files = glob.glob('data/sir_results*.csv')
-for f in old_files:
-    new_loc = 'archive/{}_{}.csv'.format(
-        f.split("/")[-1].split(".")[0],
-        date
-    ) 
-    os.rename(f, new_loc)
-=======
-# date = data.index[-1].strftime("%Y%m%d")
-# old_files = glob.glob('data/sir_results*.csv')
-# for f in old_files:
-#     new_loc = 'archive/{}_{}.csv'.format(
-#         f.split("/")[-1].split(".")[0],
-#         date
-#     ) 
-#     os.rename(f, new_loc)
->>>>>>> master
+# Model settings per location
+n_days = 120
+r_0 = 0
+i_0 = 2
+params = {
+    'Montana': dict(predict_range=n_days, r_0=r_0, i_0=i_0, N=10000),
+    'Missoula': dict(predict_range=n_days, r_0=r_0, i_0=i_0, N=1000),
+    'Gallatin': dict(predict_range=n_days, r_0=r_0, i_0=i_0, N=1000),
+}
+
+if args.all_counties:
+    from libs.pivots import pivot_store
+    pivots = pivot_store.load('Montana')
+    counties = [c for c in pivots.counties if c not in params and c != 'Unknown']
+    county_data = pivots.frame('cumulative', counties).drop(columns='Montana')
+    data = pd.merge(data, county_data, how='left', left_index=True, right_index=True).fillna(0)
+    for county in counties:
+        params[county] = dict(predict_range=n_days, r_0=r_0, i_0=i_0, N=1000)
+
+if args.starts > 1:
+    for loc_params in params.values():
+        loc_params.update(starts=args.starts, budget=args.budget)
+
+if args.model != 'sir':
+    print("Running {} model for {}".format(args.model.upper(), ", ".join(params)))
+    targets = {loc: location_targets(loc) for loc in params}
+    fits, results = fit_model_locations(args.model, targets, params, workers=args.workers)
+    print(fits)
+    fits.to_csv('data/{}_fits.csv'.format(args.model))
+    results.to_csv('data/{}_results.csv'.format(args.model))
+    results_store.add_fits(fits, results, model=args.model)
+    raise SystemExit
 
 # Run model
-mod_locs = ['Montana', 'Missoula', 'Gallatin']
-for mod_loc in mod_locs:
-    print("Running model for " + mod_loc)
-    fname = 'sir_results_{}.csv'.format(mod_loc)
-
-    if mod_loc == 'Montana':
-        N = 10000
-    elif mod_loc == 'Missoula': 
-        N = 1000
-    elif mod_loc == 'Gallatin':
-        N = 1000 
-
-    n_days = 120
-    r_0 = 0
-    i_0 = 2
-
-    l = SirLearner(data, mod_loc, loss, n_days, r_0, i_0, N)
-    beta, gamma, df_mod = l.train()
-    print('beta = ' + str(beta))
-    print('gamma = ' + str(gamma))
-    df_mod['Date'] = df_mod.index
-    df_mod.to_csv('data/' + fname)
+print("Running model for " + ", ".join(params))
+if args.full and os.path.exists(FIT_STATE_PATH):
+    os.remove(FIT_STATE_PATH)
+fits, results = fit_locations(data, params, workers=args.workers, state_path=FIT_STATE_PATH)
+print(fits[['beta', 'gamma', 'refit', 'loss', 'seconds', 'starts_run']])
+fits.to_csv('data/sir_fits.csv')
+results.to_csv('data/sir_results.csv')
+results_store.add_fits(fits, results, model='sir')
+
+if args.ensemble:
+    bands = []
+    for mod_loc, mod_params in params.items():
+        print("Running {} bootstrap replicates for {}".format(args.ensemble, mod_loc))
+        point = results[results['location'] == mod_loc].drop(columns=['location', 'Date'])
+        point_fit = (fits.loc[mod_loc, 'beta'], fits.loc[mod_loc, 'gamma'], point)
+        loc_bands, beta_bands, completed = bootstrap_ensemble(
+            data, mod_loc, mod_params, point_fit, replicates=args.ensemble, workers=args.workers,
+            budget=args.budget
+        )
+        print('{} replicates, beta percentiles = {}'.format(completed, beta_bands))
+        loc_bands.insert(0, 'location', mod_loc)
+        loc_bands['Date'] = loc_bands.index
+        bands.append(loc_bands)
+    pd.concat(bands).to_csv('data/sir_bands.csv')
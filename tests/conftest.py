@@ -0,0 +1,4 @@
+import os
+
+# Keep test runs out of data/telemetry.jsonl
+os.environ.setdefault('TELEMETRY', '0')
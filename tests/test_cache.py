@@ -0,0 +1,89 @@
+import threading
+import time
+
+import numpy as np
+
+from libs.cache import DatasetCache
+from libs.telemetry import load_records, summary
+from tests.test_telemetry import make_telemetry
+
+
+def test_hits_and_ttl():
+    cache = DatasetCache(ttl=0.2)
+    loads = []
+    loader = lambda: loads.append(1) or len(loads)
+    assert cache.get('a', loader) == 1
+    assert cache.get('a', loader) == 1
+    time.sleep(0.25)
+    assert cache.get('a', loader) == 2
+    # A per-call ttl overrides the cache's
+    assert cache.get('b', loader, ttl=60) == 3
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations']) == (1, 3, 1)
+
+
+def test_least_recently_used_is_evicted():
+    cache = DatasetCache(max_entries=2)
+    cache.get('a', lambda: 1)
+    cache.get('b', lambda: 2)
+    cache.get('a', lambda: None)
+    cache.get('c', lambda: 3)
+    assert cache.get('a', lambda: None) == 1
+    assert cache.get('b', lambda: 'reloaded') == 'reloaded'
+    assert cache.stats()['evictions'] == 2
+
+
+def test_values_over_the_ceiling_are_not_cached():
+    cache = DatasetCache(max_bytes=100)
+    assert len(cache.get('big', lambda: np.zeros(100))) == 100
+    assert cache.stats()['entries'] == 0
+
+
+def test_concurrent_misses_load_once():
+    cache = DatasetCache()
+    calls = []
+    started = threading.Event()
+
+    def loader():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 'value'
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('k', loader))) for _ in range(4)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == ['value'] * 4
+    assert cache.stats()['waits'] == 3
+
+
+def test_failed_load_is_not_cached():
+    cache = DatasetCache()
+
+    def fail():
+        raise IOError('offline')
+    try:
+        cache.get('k', fail)
+    except IOError:
+        pass
+    assert cache.get('k', lambda: 'value') == 'value'
+
+
+def test_stats_are_recorded_with_a_run(tmp_path):
+    telemetry = make_telemetry(tmp_path)
+    cache = DatasetCache()
+    cache.get('a', lambda: 1)
+    cache.get('a', lambda: 1)
+    run = telemetry.run('app')
+    run.finish(stats={'dataset_cache': cache.stats()})
+    records = load_records(telemetry.path)
+    assert records[-1]['stats'] == 'dataset_cache'
+    assert records[-1]['run'] == records[0]['run']
+    assert records[-1]['values']['hits'] == 1
+    # Stats records aren't sections
+    assert list(summary(telemetry.path).index) == ['app.total']
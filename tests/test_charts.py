@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from libs.cache import DatasetCache
+from libs.charts import ChartStore
+
+
+def chart_frame(days=1000):
+    dates = pd.date_range('2020-03-01', periods=days)
+    values = np.random.RandomState(0).poisson(20, days)
+    return pd.DataFrame({'Date': dates, 'Location': 'Missoula', 'New Cases': values})
+
+
+def test_line_charts_are_downsampled():
+    store = ChartStore(cache=DatasetCache(), budget=100)
+    spec, size = store.line('new cases', ('line',), chart_frame, 'New Cases')
+    rows = list(spec['datasets'].values())[0]
+    assert len(rows) == 100
+
+
+def test_step_charts_keep_every_point():
+    store = ChartStore(cache=DatasetCache(), budget=100)
+    spec, size = store.area('new cases', ('area',), chart_frame, 'New Cases')
+    rows = list(spec['datasets'].values())[0]
+    assert len(rows) == 1000
+    # The size is returned on every render, cached or not
+    assert store.area('new cases', ('area',), chart_frame, 'New Cases')[1] == size > 0
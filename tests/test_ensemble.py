@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from libs import sir_utils
+from libs.sir_utils import bootstrap_ensemble, fit_location
+
+PARAMS = dict(predict_range=80, r_0=0, i_0=2, N=1000)
+
+
+def confirmed():
+    index = pd.date_range('2020-03-01', periods=60)
+    daily = np.random.RandomState(1).poisson(np.linspace(1, 10, 60))
+    return pd.DataFrame({'Missoula': np.cumsum(daily)}, index=index)
+
+
+def test_ensemble_uses_the_point_fit(monkeypatch):
+    data = confirmed()
+    point_fit = fit_location(data, 'Missoula', PARAMS)[1:4]
+
+    def refit(*args, **kwargs):
+        raise AssertionError('point fit was run again')
+    monkeypatch.setattr(sir_utils, 'fit_location', refit)
+
+    bands, beta_bands, completed = bootstrap_ensemble(
+        data, 'Missoula', PARAMS, point_fit, replicates=4, workers=1
+    )
+    assert completed == 4
+    assert list(bands.index) == list(point_fit[2].index)
+    assert beta_bands[5] <= beta_bands[50] <= beta_bands[95]
+
+
+def test_ensemble_budget_cancels_replicates():
+    data = confirmed()
+    point_fit = fit_location(data, 'Missoula', PARAMS)[1:4]
+    bands, beta_bands, completed = bootstrap_ensemble(
+        data, 'Missoula', PARAMS, point_fit, replicates=200, workers=2, budget=2
+    )
+    assert 0 < completed < 200
+    assert len(bands) == len(point_fit[2])
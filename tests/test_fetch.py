@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from libs.fetch import Source, fetch_all
+from libs.snapshot import FeedSnapshot, read_nyt_csv
+
+FEED = (
+    'date,county,state,fips,cases,deaths\n'
+    '2020-03-01,Missoula,Montana,30063,1,0\n'
+    '2020-03-01,Ada,Idaho,16001,2,0\n'
+    '2020-03-02,Missoula,Montana,30063,3,0\n'
+    '2020-03-02,Ada,Idaho,16001,4,0\n'
+)
+
+
+class Handler(SimpleHTTPRequestHandler):
+    """Static files, plus /slow which stalls before answering"""
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(2)
+        return SimpleHTTPRequestHandler.do_GET(self)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    with open(str(tmp_path / 'us-counties.csv'), 'w') as f:
+        f.write(FEED)
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), partial(Handler, directory=str(tmp_path)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield tmp_path, 'http://127.0.0.1:{}'.format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_url_sources_are_parsed_from_the_stream(server):
+    root, url = server
+    results = fetch_all([
+        Source('raw', url=url + '/us-counties.csv'),
+        Source('frame', url=url + '/us-counties.csv', parse=pd.read_csv),
+    ])
+    assert results['raw'].ok and results['raw'].value == FEED.encode()
+    assert results['frame'].value['cases'].tolist() == [1, 2, 3, 4]
+
+
+def test_failures_are_reported_not_raised(server):
+    root, url = server
+    results = fetch_all([
+        Source('missing', url=url + '/nope.csv', retries=2, backoff=0.01),
+        Source('ok', url=url + '/us-counties.csv'),
+    ])
+    assert not results['missing'].ok
+    assert results['missing'].attempts == 2
+    assert results['ok'].ok
+
+
+def test_url_timeout_is_a_socket_timeout(server):
+    root, url = server
+    start = time.time()
+    result = fetch_all([Source('slow', url=url + '/slow', timeout=0.3, retries=1)])['slow']
+    assert not result.ok
+    assert time.time() - start < 1.5
+
+
+def test_timed_out_loader_is_not_retried():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.5)
+
+    result = fetch_all([Source('stuck', loader=loader, timeout=0.1, retries=3, backoff=0.01)])['stuck']
+    assert not result.ok
+    assert result.attempts == 1
+    assert len(calls) == 1
+
+
+def test_read_nyt_csv_over_http(server):
+    root, url = server
+    df = read_nyt_csv(url + '/us-counties.csv', states=['Idaho'])
+    assert df['cases'].tolist() == [2, 4]
+
+
+def test_snapshot_downloads_conditionally(server):
+    root, url = server
+    snapshot = FeedSnapshot(
+        'http', url + '/us-counties.csv', root=str(root / 'snapshots'), max_age=0, incremental=True, timeout=5
+    )
+    assert snapshot.refresh()
+    assert snapshot.load_meta()['last_modified']
+    # Not modified since: the server answers 304
+    assert not snapshot.refresh()
+
+    path = str(root / 'us-counties.csv')
+    with open(path, 'a') as f:
+        f.write('2020-03-03,Missoula,Montana,30063,5,0\n')
+    later = os.path.getmtime(path) + 10
+    os.utime(path, (later, later))
+    assert snapshot.refresh()
+    assert snapshot.read('Montana')['cases'].tolist() == [1, 3, 5]
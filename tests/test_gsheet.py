@@ -0,0 +1,118 @@
+import re
+
+import pandas as pd
+
+from libs.gsheet import SheetSync, column_letter, typed_sheet
+
+HEADER = ['Date', 'Active infected', 'Notes']
+
+
+class FakeWorksheet(object):
+    """gspread worksheet stand-in over a list of rows (header first)"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.requests = []
+
+    def row_values(self, row):
+        return list(self.rows[row - 1])
+
+    def get(self, cells):
+        start = int(re.match(r'A(\d+):', cells).group(1))
+        self.requests.append(cells)
+        return [list(row) for row in self.rows[start - 1:]]
+
+
+class FakeClient(object):
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def open_by_key(self, key):
+        return self
+
+    def get_worksheet(self, index):
+        return self.worksheet
+
+
+def sheet_rows(days, notes='x'):
+    rows = [list(HEADER)]
+    for day in range(days):
+        date = (pd.Timestamp('2020-10-01') + pd.Timedelta(days=day)).strftime('%m/%d/%Y')
+        rows.append([date, str(100 + day), notes])
+    return rows
+
+
+def make_sync(tmp_path, rows, overlap=3):
+    ws = FakeWorksheet(rows)
+    sync = SheetSync(path=str(tmp_path / 'gsheet.pkl'), overlap=overlap, client=FakeClient(ws))
+    return sync, ws
+
+
+def test_column_letter():
+    assert [column_letter(n) for n in [1, 26, 27, 52, 703]] == ['A', 'Z', 'AA', 'AZ', 'AAA']
+
+
+def test_typed_sheet():
+    df = typed_sheet([['10/01/2020', '5', ''], ['10/02/2020', '', 'n']], HEADER)
+    assert df['Date'].dtype.kind == 'M'
+    assert df['Active infected'].dtype == float
+    assert df['Active infected'].isnull().tolist() == [False, True]
+    assert df['Notes'].isnull().tolist() == [True, False]
+
+
+def test_first_sync_fetches_everything(tmp_path):
+    sync, ws = make_sync(tmp_path, sheet_rows(10))
+    df = sync.sync()
+    assert ws.requests == ['A2:C']
+    assert len(df) == 10
+    pd.testing.assert_frame_equal(sync.read(), df)
+
+
+def test_appended_rows_fetch_only_the_tail(tmp_path):
+    sync, ws = make_sync(tmp_path, sheet_rows(10))
+    sync.sync()
+    ws.rows = sheet_rows(12)
+    sync.fetched_rows = 0
+    df = sync.sync()
+    # The last overlap rows again plus the two new ones
+    assert ws.requests[-1] == 'A9:C'
+    assert sync.fetched_rows == 5
+    pd.testing.assert_frame_equal(df, typed_sheet(sheet_rows(12)[1:], HEADER))
+
+
+def test_changed_recent_row_is_picked_up(tmp_path):
+    sync, ws = make_sync(tmp_path, sheet_rows(10))
+    sync.sync()
+    ws.rows[-2][1] = '999'
+    df = sync.sync()
+    assert ws.requests[-1] == 'A9:C'
+    assert df['Active infected'].iloc[-2] == 999
+
+
+def test_header_change_refetches_everything(tmp_path):
+    sync, ws = make_sync(tmp_path, sheet_rows(10))
+    sync.sync()
+    ws.rows = [row + [str(i)] for i, row in enumerate(sheet_rows(10))]
+    ws.rows[0][-1] = 'Tests completed'
+    df = sync.sync()
+    assert ws.requests[-1] == 'A2:D'
+    assert list(df.columns) == HEADER + ['Tests completed']
+    assert len(df) == 10
+
+
+def test_type_change_refetches_everything(tmp_path):
+    sync, ws = make_sync(tmp_path, sheet_rows(10))
+    sync.sync()
+    ws.rows[-1][1] = 'pending'
+    df = sync.sync()
+    assert ws.requests[-2:] == ['A9:C', 'A2:C']
+    assert df['Active infected'].dtype == object
+
+
+def test_shorter_sheet_refetches_everything(tmp_path):
+    sync, ws = make_sync(tmp_path, sheet_rows(10))
+    sync.sync()
+    ws.rows = sheet_rows(5)
+    df = sync.sync()
+    assert ws.requests[-1] == 'A2:C'
+    assert len(df) == 5
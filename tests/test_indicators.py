@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.fixtures import Fixture
+from libs.gsheet import cdc_indicators
+from libs.indicators import CDC_THRESHOLDS, indicator_levels, state_indicator_table
+from libs.metrics import population
+from libs.pivots import pivot_store
+
+
+def missoula_sheet(new_cases, change):
+    """A formatted sheet whose last row has the given Missoula case indicators"""
+    return pd.DataFrame({
+        'Missoula New Cases': [0.0, new_cases],
+        'Missoula % Change': [0.0, change],
+        'Missoula Positivity Rate': [0.0, 4.0],
+        'Missoula Hosp. % Full': [0.0, 85.0],
+        'Missoula Cov. Hosp. %': [0.0, 12.0],
+    })
+
+
+def test_county_table_bins_match_the_missoula_table():
+    with Fixture(days=60, counties=8):
+        pivots = pivot_store.load('Montana')
+        table = state_indicator_table(pivots, population('Montana'))
+        cumulative = pivots.frame('cumulative', pivots.counties)
+    assert set(pivots.counties) <= set(table.index)
+
+    missoula = cumulative['Missoula'].values
+    new_cases = 100000 * (missoula[-1] - missoula[-15]) / population('Montana')['Missoula']
+    last_week, prev_week = missoula[-1] - missoula[-8], missoula[-8] - missoula[-15]
+    change = 100 * (last_week - prev_week) / prev_week
+    assert np.isclose(table.loc['Missoula', '14day New Cases'], new_cases)
+    assert np.isclose(table.loc['Missoula', '14day % Change'], change)
+
+    sheet_levels = indicator_levels(cdc_indicators(missoula_sheet(new_cases, change)))
+    county_levels = indicator_levels(table.loc[['Missoula']])
+    for column in county_levels.columns:
+        assert county_levels[column].iloc[0] == sheet_levels[column].iloc[0]
+        expected = np.digitize(table.loc['Missoula', column], CDC_THRESHOLDS[column], right=True)
+        assert county_levels[column].iloc[0] == expected
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from libs.metrics import METRICS, RollingMetrics, align, population, write_population
+
+CENSUS = [
+    (40, 'Arkansas', 'Arkansas', 3017804),
+    (50, 'Arkansas', 'Arkansas County', 17486),
+    (50, 'Arkansas', 'Pulaski County', 391911),
+    (40, 'New York', 'New York', 19453561),
+    (50, 'New York', 'Albany County', 305506),
+    (50, 'New York', 'Kings County', 2559903),
+    (50, 'New York', 'New York County', 1628706),
+    (50, 'New York', 'Queens County', 2253858),
+    (50, 'New York', 'Bronx County', 1418207),
+    (50, 'New York', 'Richmond County', 476143),
+]
+
+
+def write_census(path):
+    pd.DataFrame(CENSUS, columns=['SUMLEV', 'STNAME', 'CTYNAME', 'POPESTIMATE2019']).to_csv(path, index=False)
+
+
+def cumulative_frame(columns, days=30):
+    growth = np.arange(1, len(columns) + 1, dtype=float)
+    values = np.cumsum(np.outer(np.arange(days), growth), axis=0)
+    return pd.DataFrame(values, index=pd.date_range('2020-03-01', periods=days), columns=columns)
+
+
+def test_county_named_like_its_state(tmp_path):
+    census, path = str(tmp_path / 'census.csv'), str(tmp_path / 'population.csv')
+    write_census(census)
+    pd.DataFrame({
+        'state': ['Guam'], 'level': ['state'], 'location': ['Guam'], 'population': [168485]
+    }).to_csv(path, index=False)
+    write_population(path, census)
+
+    arkansas = population('Arkansas', path)
+    assert arkansas.iloc[0] == 3017804
+    assert arkansas.iloc[1:].to_dict() == {'Arkansas': 17486, 'Pulaski': 391911}
+    # Rows the Census file doesn't cover are kept
+    assert population('Guam', path).tolist() == [168485]
+    assert population('New York', path)['New York City'] == 1628706 + 2559903 + 2253858 + 1418207 + 476143
+
+    # Columns as StatePivots.frame('cumulative', ['Arkansas', 'Pulaski']) returns them
+    cumulative = cumulative_frame(['Arkansas', 'Arkansas', 'Pulaski'])
+    pop = align(arkansas, cumulative.columns)
+    assert pop.tolist() == [3017804, 17486, 391911]
+    per_100k = RollingMetrics.from_frame(cumulative, pop).frame('14day per 100k').iloc[-1]
+    fortnight = (cumulative.iloc[-1] - cumulative.iloc[-15]).values
+    assert np.allclose(per_100k.values, 100000 * fortnight / pop.values)
+
+
+def test_align_fills_unknown_counties():
+    pop = align(pd.Series([100.0, 10.0], index=['Montana', 'Missoula']), ['Montana', 'Missoula', 'Nowhere'])
+    assert pop.iloc[:2].tolist() == [100, 10]
+    assert np.isnan(pop.iloc[2])
+
+
+def test_window_metrics():
+    cumulative = cumulative_frame(['Montana', 'Missoula'])
+    metrics = RollingMetrics.from_frame(cumulative)
+    missoula = cumulative['Missoula'].values
+    assert metrics.frame('new')['Missoula'].iloc[-1] == missoula[-1] - missoula[-2]
+    assert metrics.frame('14day New Cases')['Missoula'].iloc[-1] == missoula[-1] - missoula[-15]
+    last_week, prev_week = missoula[-1] - missoula[-8], missoula[-8] - missoula[-15]
+    change = metrics.frame('14day % Change')['Missoula'].iloc[-1]
+    assert change == pytest.approx(100 * (last_week - prev_week) / prev_week)
+    # Before a full fortnight there is nothing to compare with
+    assert np.isnan(metrics.frame('14day New Cases').iloc[13]).all()
+
+
+def test_extend_matches_from_frame():
+    cumulative = cumulative_frame(['Montana', 'Missoula'])
+    whole = RollingMetrics.from_frame(cumulative)
+    rolling = RollingMetrics.from_frame(cumulative.iloc[:10])
+    rolling.extend(cumulative.index[10:20], cumulative.values[10:20])
+    for date, row in cumulative.iloc[20:].iterrows():
+        rolling.append(date, row.values)
+    for name in METRICS:
+        pd.testing.assert_frame_equal(rolling.frame(name), whole.frame(name))
@@ -0,0 +1,23 @@
+import time
+
+from libs import sir_utils
+from libs.sir_utils import SirLearner, loss
+from tests.test_ensemble import PARAMS, confirmed
+
+
+def learner(**kwargs):
+    return SirLearner(
+        confirmed(), 'Missoula', loss, PARAMS['predict_range'], PARAMS['r_0'], PARAMS['i_0'], PARAMS['N'],
+        **kwargs
+    )
+
+
+def test_serial_multistart_stops_at_the_budget(monkeypatch):
+    # Keep the starts from stopping early by agreeing
+    monkeypatch.setattr(sir_utils, 'fits_agree', lambda results: False)
+    sir = learner(starts=40, workers=1, budget=0.5)
+    start = time.time()
+    sir.train()
+    assert 1 <= sir.report['starts'] < 40
+    # At most the fit running when the budget ran out goes over it
+    assert time.time() - start < 5
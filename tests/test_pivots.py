@@ -0,0 +1,28 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.fixtures import Fixture
+from libs.pivots import StatePivots, data_token, pivot_store
+
+
+def test_concurrent_builds_publish_one_directory():
+    with Fixture(days=30, counties=8):
+        token = data_token()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            paths = list(pool.map(lambda _: pivot_store.build('Montana', token), range(8)))
+        assert len(set(paths)) == 1
+        pivots = StatePivots(paths[0])
+        assert pivots.state == 'Montana'
+        assert 'Missoula' in pivots.counties
+        # No temporary directories left behind
+        assert os.listdir(os.path.dirname(paths[0])) == ['montana']
+
+
+def test_load_builds_once_per_token():
+    with Fixture(days=30, counties=8):
+        first = pivot_store.load('Montana')
+        again = pivot_store.load('Montana')
+        assert first.token == again.token == data_token()
+        assert np.array_equal(first.matrices['cumulative'], again.matrices['cumulative'], equal_nan=True)
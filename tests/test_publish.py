@@ -0,0 +1,19 @@
+import os
+
+import pandas as pd
+
+from benchmarks.fixtures import Fixture
+from libs.publish import publish
+
+
+def test_publish_writes_the_county_indicators(tmp_path):
+    root = str(tmp_path / 'publish')
+    with Fixture(days=60, counties=8):
+        manifest = publish(root=root, workers=1, charts=False)
+    assert manifest['states'] == ['Montana']
+    for ext in ['csv', 'json']:
+        assert 'states/montana/cdc_indicators.' + ext in manifest['files']
+    table = pd.read_csv(os.path.join(root, 'states', 'montana', 'cdc_indicators.csv'), index_col='location')
+    assert {'Missoula', 'Gallatin', 'Montana'} <= set(table.index)
+    assert list(table.columns) == ['14day New Cases', '14day % Change']
+    assert table.loc['Missoula'].notnull().all()
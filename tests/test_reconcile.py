@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from libs.reconcile import fill_within, first_valid, group_starts, reconcile
+
+
+def source_frame(source, rows):
+    """Long frame of (date, location, cases, deaths) rows from one source"""
+    df = pd.DataFrame(rows, columns=['date', 'location', 'cases', 'deaths'])
+    df['date'] = pd.to_datetime(df['date'])
+    df['source'] = source
+    return df.set_index('date')
+
+
+def test_kernels():
+    starts = group_starts([np.array([1, 1, 2, 2, 2]), np.array([5, 5, 5, 6, 6])])
+    assert starts.tolist() == [True, False, True, True, False]
+    values = np.array([np.nan, 1, np.nan, np.nan, 3])
+    assert first_valid(values, starts).tolist() == [1, -1, 4]
+    groups = np.array([True, False, False, True, False])
+    assert fill_within(np.array([np.nan, 1, np.nan, np.nan, 3]), groups).tolist() == [1, 1, 1, 3, 3]
+
+
+def test_precedence_picks_each_value_from_the_first_source_that_has_it():
+    nyt = source_frame('nyt', [
+        ('2020-04-01', 'Missoula', 10, np.nan),
+        ('2020-04-02', 'Missoula', 12, 1),
+    ])
+    msl = source_frame('msl', [
+        ('2020-04-01', 'Missoula', 99, 0),
+        ('2020-04-02', 'Missoula', 99, 9),
+        ('2020-04-03', 'Missoula', 15, 1),
+    ])
+    # Listing order of the frames doesn't matter, precedence does
+    df = reconcile([msl, nyt])
+    assert df['cases'].tolist() == [10, 12, 15]
+    assert df['deaths'].tolist() == [0, 1, 1]
+    assert df['source'].astype(str).tolist() == ['nyt', 'nyt', 'msl']
+    assert reconcile([msl, nyt], precedence=['msl', 'nyt'])['cases'].tolist() == [99, 99, 15]
+
+
+def test_one_row_per_date_and_location_sorted_by_date():
+    nyt = source_frame('nyt', [
+        ('2020-04-02', 'Missoula', 12, 0),
+        ('2020-04-01', 'Missoula', 10, 0),
+        ('2020-04-01', 'Gallatin', 20, 0),
+        ('2020-04-01', 'Missoula', 11, 0),
+    ])
+    other = source_frame('other', [('2020-04-01', 'Gallatin', 30, 0)])
+    df = reconcile([other, nyt])
+    assert list(zip(df.index.strftime('%m-%d'), df['location'].astype(str))) == [
+        ('04-01', 'Gallatin'), ('04-01', 'Missoula'), ('04-02', 'Missoula'),
+    ]
+    # Sources outside the precedence list rank last
+    assert df['cases'].tolist()[0] == 20
+    assert not df.reset_index().duplicated(['date', 'location']).any()
+
+
+def test_fills_never_cross_locations():
+    nyt = source_frame('nyt', [
+        ('2020-04-01', 'Gallatin', 20, np.nan),
+        ('2020-04-02', 'Gallatin', np.nan, np.nan),
+        ('2020-04-01', 'Missoula', np.nan, np.nan),
+        ('2020-04-02', 'Missoula', 12, 2),
+        ('2020-04-03', 'Missoula', np.nan, np.nan),
+    ])
+    df = reconcile([nyt])
+    gallatin = df[df['location'] == 'Gallatin']
+    missoula = df[df['location'] == 'Missoula']
+    assert gallatin['cases'].tolist() == [20, 20]
+    assert gallatin['deaths'].isna().all()
+    # Backfilled from its own later day, not from Gallatin's row before it
+    assert missoula['cases'].tolist() == [12, 12, 12]
+    assert missoula['deaths'].tolist() == [2, 2, 2]
+    assert reconcile([nyt], fill=False)['cases'].isna().sum() == 3
+
+
+def test_no_rows():
+    df = reconcile([source_frame('nyt', [])])
+    assert df.empty
+    assert list(df.columns) == ['location', 'cases', 'deaths', 'source']
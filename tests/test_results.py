@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from libs.results import ResultsStore
+
+
+def forecast(scale, days=5):
+    index = pd.date_range('2020-04-01', periods=days)
+    return pd.DataFrame({
+        'Actual': [10.0, 12.0, np.nan, np.nan, np.nan][:days],
+        'Infectious': scale * np.arange(days, dtype=float),
+        'Recovered': np.ones(days),
+    }, index=index)
+
+
+def test_runs_are_appended_once(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    first = store.add_run('Missoula', 'sir', {'beta': 0.5, 'gamma': 0.1}, forecast(1), '2020-04-01', loss=2.0)
+    assert first is not None
+    # Same key, nothing stored
+    assert store.add_run('Missoula', 'sir', {'gamma': 0.1, 'beta': 0.5}, forecast(9), '2020-04-01') is None
+    second = store.add_run('Missoula', 'sir', {'beta': 0.6, 'gamma': 0.1}, forecast(2), '2020-04-02')
+    store.add_run('Gallatin', 'sir', {'beta': 0.4, 'gamma': 0.1}, forecast(3), '2020-04-03')
+
+    runs = store.runs('Missoula')
+    assert list(runs.index) == [second, first]
+    assert runs.loc[first, 'params'] == {'beta': 0.5, 'gamma': 0.1}
+    assert runs.loc[first, 'loss'] == 2.0
+    assert store.latest_run('Missoula') == second
+    assert store.latest_run('Missoula', model='seir') is None
+    assert store.latest('Nowhere') is None
+
+
+def test_forecasts_read_back(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    store.add_run('Missoula', 'sir', {'beta': 0.5}, forecast(1), '2020-04-01')
+    store.add_run('Missoula', 'sir', {'beta': 0.6}, forecast(2), '2020-04-02')
+
+    latest = store.latest('Missoula')
+    # Only the columns the run was stored with
+    assert list(latest.columns) == ['Actual', 'Infectious', 'Recovered']
+    pd.testing.assert_frame_equal(latest, forecast(2), check_names=False, check_freq=False)
+
+    history = store.history('Missoula')
+    assert history['run_date'].unique().tolist() == ['2020-04-02', '2020-04-01']
+    assert len(history) == 10
+    assert history[history['run_date'] == '2020-04-01']['Infectious'].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_add_fits_stores_one_run_per_location(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    fits = pd.DataFrame({
+        'beta': [0.5, 0.4], 'gamma': [0.1, 0.2], 'loss': [1.0, 2.0], 'seconds': [3.0, 4.0],
+    }, index=pd.Index(['Missoula', 'Gallatin'], name='location'))
+    results = pd.concat([
+        forecast(1).assign(location='Missoula'), forecast(2).assign(location='Gallatin'),
+    ])
+    run_ids = store.add_fits(fits, results, run_date='2020-04-01')
+    assert set(run_ids) == {'Missoula', 'Gallatin'}
+    assert store.runs('Gallatin').iloc[0]['params'] == {'beta': 0.4, 'gamma': 0.2}
+    assert store.latest('Gallatin')['Infectious'].tolist() == [0, 2, 4, 6, 8]
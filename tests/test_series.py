@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from libs.cache import DatasetCache, sizeof
+from libs.series import CaseSeries
+
+
+def case_series(days=5):
+    index = pd.DatetimeIndex(pd.date_range('2020-03-01', periods=days).repeat(2), name='date')
+    return CaseSeries.from_frame(pd.DataFrame({
+        'location': ['Missoula', 'Gallatin'] * days,
+        'cases': np.arange(2 * days, dtype=float),
+        'deaths': np.zeros(2 * days),
+    }, index=index))
+
+
+def test_frame_round_trip():
+    series = case_series()
+    df = series.to_frame()
+    assert len(series) == len(df) == 10
+    assert df['location'].astype(str).tolist()[:2] == ['Missoula', 'Gallatin']
+    assert df['source'].astype(str).unique().tolist() == ['nyt']
+    assert CaseSeries.from_frame(df).to_frame().equals(df)
+
+
+def test_wide_and_select():
+    series = case_series()
+    wide = series.wide()
+    assert list(wide.columns) == ['Missoula', 'Gallatin']
+    assert wide['Gallatin'].tolist() == [1, 3, 5, 7, 9]
+    missoula = series.select('Missoula')
+    assert missoula.cases.tolist() == [0, 2, 4, 6, 8]
+    assert missoula.locations == series.locations
+
+
+def test_cache_counts_case_series_bytes():
+    series = case_series(days=1000)
+    assert sizeof(series) == series.nbytes > 20000
+    cache = DatasetCache(max_bytes=int(2.5 * series.nbytes))
+    for key in range(3):
+        cache.get(key, lambda: case_series(days=1000))
+    stats = cache.stats()
+    assert stats['entries'] == 2
+    assert stats['evictions'] == 1
+    assert stats['bytes'] <= cache.max_bytes
@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from libs import snapshot as snapshot_module
+from libs.snapshot import FeedSnapshot, read_nyt_csv
+
+HEADER = 'date,county,state,fips,cases,deaths\n'
+
+
+def feed_rows(days, cases=None):
+    rows = []
+    for day in range(days):
+        date = '2020-03-{:02d}'.format(day + 1)
+        for county, fips in [('Missoula', 30063), ('Gallatin', 30031)]:
+            value = 100 + day if cases is None else cases.get((date, county), 100 + day)
+            rows.append('{},{},Montana,{},{},0\n'.format(date, county, fips, value))
+        rows.append('{},Ada,Idaho,16001,{},1\n'.format(date, 200 + day))
+    return rows
+
+
+def write_feed(path, rows, mtime):
+    with open(path, 'w') as f:
+        f.write(HEADER + ''.join(rows))
+    os.utime(path, (mtime, mtime))
+
+
+def missoula_cases(snapshot):
+    df = snapshot.read('Montana')
+    return df[df['county'] == 'Missoula']['cases'].tolist()
+
+
+def make_snapshot(tmp_path, rows):
+    path = str(tmp_path / 'us-counties.csv')
+    write_feed(path, rows, 1000)
+    snapshot = FeedSnapshot('test', path, root=str(tmp_path / 'snapshots'), max_age=0, incremental=True)
+    snapshot.refresh()
+    return snapshot, path
+
+
+def test_snapshot_reads_back_the_local_feed(tmp_path):
+    snapshot, path = make_snapshot(tmp_path, feed_rows(5))
+    assert sorted(snapshot.states()) == ['Idaho', 'Montana']
+    expected = read_nyt_csv(path, states=['Montana'])
+    df = snapshot.read('Montana')
+    assert len(df) == 10
+    pd.testing.assert_index_equal(pd.DatetimeIndex(df.index), pd.DatetimeIndex(expected.index), check_names=False)
+    assert df['county'].astype(str).tolist() == expected['county'].astype(str).tolist()
+    assert np.array_equal(df['cases'].values, expected['cases'].values)
+    assert np.array_equal(df['fips'].values, expected['fips'].values)
+
+
+def _refresh_in_process(args):
+    path, root = args
+    FeedSnapshot('test', path, root=root, max_age=0, incremental=True).refresh()
+
+
+def test_concurrent_process_refreshes_append_once(tmp_path):
+    snapshot, path = make_snapshot(tmp_path, feed_rows(5))
+    write_feed(path, feed_rows(30), 2000)
+    context = multiprocessing.get_context('fork')
+    with context.Pool(4) as pool:
+        pool.map(_refresh_in_process, [(path, str(tmp_path / 'snapshots'))] * 8)
+    assert missoula_cases(snapshot) == list(range(100, 130))
+    assert len(snapshot.read('Idaho')) == 30
+
+
+def test_appended_days_only_parse_the_tail(tmp_path):
+    snapshot, path = make_snapshot(tmp_path, feed_rows(5))
+    revision = snapshot.load_meta().get('revision', 0)
+    write_feed(path, feed_rows(7), 2000)
+    assert snapshot.refresh()
+    assert missoula_cases(snapshot) == [100, 101, 102, 103, 104, 105, 106]
+    meta = snapshot.load_meta()
+    assert meta['revision'] == revision + 1
+    assert [d[0] for d in meta['days']][-2:] == ['2020-03-06', '2020-03-07']
+
+
+def test_unchanged_feed_is_not_reparsed(tmp_path):
+    snapshot, path = make_snapshot(tmp_path, feed_rows(5))
+    assert not snapshot.refresh()
+    # Same bytes under new validators
+    write_feed(path, feed_rows(5), 2000)
+    assert not snapshot.refresh()
+    assert missoula_cases(snapshot) == [100, 101, 102, 103, 104]
+
+
+def test_same_length_revision_of_an_old_row_is_rebuilt(tmp_path):
+    snapshot, path = make_snapshot(tmp_path, feed_rows(5))
+    # 101 -> 191 keeps every byte offset of the feed
+    revised = feed_rows(6, cases={('2020-03-02', 'Missoula'): 191})
+    write_feed(path, revised, 2000)
+    assert os.path.getsize(path) == len(HEADER) + len(''.join(feed_rows(6)))
+    assert snapshot.refresh()
+    assert missoula_cases(snapshot) == [100, 191, 102, 103, 104, 105]
+    idaho = snapshot.read('Idaho')
+    assert np.array_equal(idaho['cases'].values, np.arange(200, 206))
+
+
+def test_revision_waits_for_readers_and_publishes_a_new_version(tmp_path):
+    snapshot, path = make_snapshot(tmp_path, feed_rows(5))
+    reader = FeedSnapshot('test', path, root=snapshot.root.rsplit(os.sep, 1)[0], max_age=0, incremental=True)
+    old_version = snapshot.load_meta()['version']
+    # Upstream revises an old row and drops the last day
+    write_feed(path, feed_rows(4, cases={('2020-03-02', 'Missoula'): 1101}), 2000)
+    with reader.locked(shared=True):
+        meta = reader.load_meta()
+        refresh = threading.Thread(target=snapshot.refresh)
+        refresh.start()
+        refresh.join(0.5)
+        assert refresh.is_alive()
+        columns = reader.read_columns(meta, 'Montana')
+        assert columns['cases'][::2].tolist() == [100, 101, 102, 103, 104]
+    refresh.join()
+    assert missoula_cases(snapshot) == [100, 1101, 102, 103]
+    assert snapshot.load_meta()['version'] != old_version
+    assert not os.path.exists(os.path.join(snapshot.root, old_version))
+
+
+def test_failed_revision_keeps_the_published_version(tmp_path, monkeypatch):
+    snapshot, path = make_snapshot(tmp_path, feed_rows(5))
+    write_feed(path, feed_rows(5, cases={('2020-03-02', 'Missoula'): 191}), 2000)
+
+    def fail(*args):
+        raise ValueError('bad chunk')
+    with monkeypatch.context() as patch:
+        patch.setattr(snapshot_module, 'encode_partition', fail)
+        with pytest.raises(ValueError):
+            snapshot.refresh()
+    columns = snapshot.read_columns(snapshot.load_meta(), 'Montana')
+    assert columns['cases'][::2].tolist() == [100, 101, 102, 103, 104]
+    assert snapshot.refresh()
+    assert missoula_cases(snapshot) == [100, 191, 102, 103, 104]
+    assert [name for name in os.listdir(snapshot.root) if name.startswith('.v')] == []
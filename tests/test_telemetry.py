@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from libs.telemetry import Telemetry, load_records, log_files, measure, summary
+
+RECORDS = 200
+# Inherited by the forked pool workers, like libs.telemetry.telemetry
+_shared = {}
+
+
+def _emit(_):
+    for _ in range(RECORDS):
+        with _shared['telemetry'].section('worker') as section:
+            section.output(np.zeros(4))
+    return os.getpid()
+
+
+def make_telemetry(tmp_path, **kwargs):
+    telemetry = Telemetry(str(tmp_path / 'telemetry.jsonl'), **kwargs)
+    telemetry.enabled = True
+    return telemetry
+
+
+def test_measure():
+    df = pd.DataFrame({'a': np.arange(10, dtype=np.int64)}, index=pd.RangeIndex(10))
+    assert measure(df) == (10, 80 + df.index.nbytes)
+    assert measure(np.zeros(3)) == (3, 24)
+    assert measure(b'abc') == (None, 3)
+    assert measure(None) == (None, None)
+
+
+def test_sections_runs_and_errors(tmp_path):
+    telemetry = make_telemetry(tmp_path)
+    with telemetry.section('load') as section:
+        section.add(rows=3, bytes_in=10)
+    try:
+        with telemetry.section('boom'):
+            raise ValueError
+    except ValueError:
+        pass
+    run = telemetry.run('app')
+    run.mark('first', rows=2)
+    run.finish()
+    records = load_records(telemetry.path)
+    assert [r['section'] for r in records] == ['load', 'boom', 'app.first', 'app.total']
+    assert records[0]['rows'] == 3 and records[0]['bytes_in'] == 10
+    assert records[1]['error'] == 'ValueError'
+    assert records[2]['run'] == records[3]['run']
+    assert summary(telemetry.path).loc['boom', 'errors'] == 1
+
+
+def test_pool_workers_write_their_own_logs(tmp_path):
+    # Small enough that every worker rotates its log several times
+    telemetry = make_telemetry(tmp_path, max_bytes=4000, backups=100)
+    telemetry.logger()
+    _shared['telemetry'] = telemetry
+    with multiprocessing.get_context('fork').Pool(4) as pool:
+        pids = set(pool.map(_emit, range(8), chunksize=1))
+    records = load_records(telemetry.path)
+    assert len(records) == 8 * RECORDS
+    assert {r['pid'] for r in records} == pids
+    assert all(os.path.basename(name).startswith('telemetry.') for name in log_files(telemetry.path))